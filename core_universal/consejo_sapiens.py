@@ -15,14 +15,34 @@ Filosofía: "No importa qué vendes, importa cómo lo haces mejor"
 
 import os
 import json
+import asyncio
 import hashlib
+import heapq
 import random
+import re
 import time
+import bisect
+import threading
+import unicodedata
+import sqlite3
+from array import array
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from dataclasses import dataclass
 from enum import Enum
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
 class TipoInversion(Enum):
     FONDO_SUENOS = "fondo_suenos"
     DESARROLLO_BOTS = "desarrollo_bots"
@@ -49,14 +69,493 @@ class PropuestaInversion:
     fecha_creacion: datetime = None
     estado: str = "pendiente"
 
+# Vocabulario por defecto si no hay config/vocabulario_etico.json
+PALABRAS_PROHIBIDAS = ("arma", "bomba", "apuesta", "casino", "tabaco", "alcohol")
+
+RUTA_VOCABULARIO = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "config", "vocabulario_etico.json")
+RUTA_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "..", "config", "system_config.yaml")
+
+def cargar_config_consejo(ruta: Optional[str] = None) -> Dict:
+    """Sección `consejo_sapiens` de system_config.yaml ({} si no se puede leer)"""
+    ruta = ruta or RUTA_CONFIG
+    if not YAML_AVAILABLE or not os.path.exists(ruta):
+        return {}
+    with open(ruta, "r", encoding="utf-8") as f:
+        return (yaml.safe_load(f) or {}).get("consejo_sapiens") or {}
+
+def _tabla_sin_acentos() -> Dict[int, str]:
+    """Latín con diacríticos -> letra base en minúscula, solo si es un único carácter"""
+    tabla = {}
+    for codigo in range(0xC0, 0x250):
+        ch = chr(codigo)
+        base = "".join(c for c in unicodedata.normalize("NFKD", ch) if not unicodedata.combining(c)).lower()
+        if len(base) == 1 and base != ch:
+            tabla[codigo] = base
+    return tabla
+
+_SIN_ACENTOS = _tabla_sin_acentos()
+
+def normalizar_texto(texto: str) -> Tuple[str, Optional[List[int]]]:
+    """
+    Texto en minúsculas y sin acentos (plegado NFKD), más la posición en el
+    original de cada carácter normalizado (None si coinciden una a una, el
+    caso común: ASCII o latín con acentos, que se resuelve con translate()).
+    """
+    if texto.isascii():
+        return texto.lower(), None
+    normalizado = texto.translate(_SIN_ACENTOS).lower()
+    # Solo si todo quedó en ASCII coincide con NFKD; anchos completos o
+    # ligaduras (p. ej. "ﬁ") siguen sin plegar y van por el camino lento
+    if len(normalizado) == len(texto) and normalizado.isascii():
+        return normalizado, None
+    caracteres, posiciones = [], []
+    for i, ch in enumerate(texto):
+        for c in unicodedata.normalize("NFKD", ch):
+            if not unicodedata.combining(c):
+                for d in c.lower():
+                    caracteres.append(d)
+                    posiciones.append(i)
+    posiciones.append(len(texto))
+    return "".join(caracteres), posiciones
+
+class FiltroEtico:
+    """
+    Detector de términos vetados en un solo recorrido del texto.
+    
+    El vocabulario (versionado) agrupa variantes bajo un término: por
+    ejemplo "arma" -> ["arma", "armas"]. Todas las variantes, normalizadas
+    sin acentos y en minúsculas, se compilan en una única expresión regular
+    con forma de trie (prefijos comunes factorizados), así que en cada
+    posición del texto el motor solo sigue la rama de la letra actual: el
+    coste es lineal en la longitud del texto aunque haya miles de términos.
+    Solo cuentan palabras completas; un espacio en una variante admite
+    cualquier separación.
+    """
+    
+    def __init__(self, terminos: Union[Iterable[str], Dict[str, List[str]]] = PALABRAS_PROHIBIDAS,
+                 version: str = "base", penalizacion: int = 30):
+        if not isinstance(terminos, dict):
+            terminos = {t: [t] for t in terminos}
+        self.version = version
+        self.penalizacion = penalizacion
+        self.terminos = {termino: list(variantes) for termino, variantes in terminos.items()}
+        self._termino_de: Dict[str, str] = {}
+        for termino, variantes in self.terminos.items():
+            for variante in variantes:
+                clave = " ".join(normalizar_texto(variante)[0].split())
+                if clave:
+                    self._termino_de[clave] = termino
+        self._patron = re.compile(r"(?<!\w)" + self._trie(sorted(self._termino_de)) + r"(?!\w)")
+    
+    @classmethod
+    def desde_archivo(cls, ruta: str) -> "FiltroEtico":
+        """Carga {"version", "penalizacion", "terminos": {termino: [variantes]}} de un JSON"""
+        with open(ruta, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        return cls(datos["terminos"], str(datos.get("version", "base")), int(datos.get("penalizacion", 30)))
+    
+    @staticmethod
+    def _trie(claves: List[str]) -> str:
+        raiz: Dict = {}
+        for clave in claves:
+            nodo = raiz
+            for ch in clave:
+                nodo = nodo.setdefault(ch, {})
+            nodo[""] = {}
+        
+        def emitir(nodo: Dict) -> str:
+            ramas = [(r"\s+" if ch == " " else re.escape(ch)) + emitir(hijo)
+                     for ch, hijo in sorted(nodo.items()) if ch]
+            if not ramas:
+                return ""
+            cuerpo = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+            # Greedy: se prueba primero la variante más larga
+            return "(?:" + cuerpo + ")?" if "" in nodo else cuerpo
+        
+        return "(?:" + emitir(raiz) + ")" if raiz else "(?!)"
+    
+    def analizar(self, texto: str) -> List[Dict]:
+        """Coincidencias en orden: término, variante encontrada y posición [inicio, fin) en `texto`"""
+        normalizado, posiciones = normalizar_texto(texto)
+        coincidencias = []
+        for m in self._patron.finditer(normalizado):
+            inicio, fin = m.span()
+            if posiciones is not None:
+                inicio, fin = posiciones[inicio], posiciones[fin - 1] + 1
+            coincidencias.append({
+                "termino": self._termino_de[" ".join(m.group().split())],
+                "texto": texto[inicio:fin],
+                "inicio": inicio,
+                "fin": fin
+            })
+        return coincidencias
+    
+    def terminos_en(self, texto: str) -> set:
+        """Términos distintos presentes en el texto"""
+        normalizado, _ = normalizar_texto(texto)
+        return {self._termino_de[" ".join(m.split())] for m in self._patron.findall(normalizado)}
+    
+    def penalizar(self, texto: str) -> int:
+        """Puntos que resta el texto: `penalizacion` por cada término distinto presente"""
+        return self.penalizacion * len(self.terminos_en(texto))
+
+def clave_usuario(usuario: str) -> int:
+    """Hash de 63 bits del usuario (nunca 0): identifica su voto sin guardar el nombre"""
+    clave = int.from_bytes(hashlib.blake2b(usuario.encode(), digest_size=8).digest(), "little")
+    return (clave & 0x7FFFFFFFFFFFFFFF) or 1
+
+class _VotosPorUsuario:
+    """
+    Tabla hash abierta clave_usuario -> voto sobre dos arrays (8 + 1 bytes
+    por hueco): un millón de votantes ocupa decenas de MB menos que un dict.
+    """
+    
+    __slots__ = ("_claves", "_votos", "_n")
+    
+    def __init__(self, capacidad: int = 8):
+        self._claves = array("Q", [0]) * capacidad
+        self._votos = array("b", [0]) * capacidad
+        self._n = 0
+    
+    def _hueco(self, clave: int) -> int:
+        claves = self._claves
+        mascara = len(claves) - 1
+        i = clave & mascara
+        while True:
+            actual = claves[i]
+            if actual == clave or actual == 0:
+                return i
+            i = (i + 1) & mascara
+    
+    def get(self, clave: int) -> Optional[int]:
+        i = self._hueco(clave)
+        return self._votos[i] if self._claves[i] == clave else None
+    
+    def poner(self, clave: int, voto: int) -> Optional[int]:
+        """Guarda el voto y devuelve el anterior del mismo usuario, si lo había"""
+        i = self._hueco(clave)
+        if self._claves[i] == clave:
+            anterior = self._votos[i]
+            self._votos[i] = voto
+            return anterior
+        self._claves[i] = clave
+        self._votos[i] = voto
+        self._n += 1
+        if self._n * 10 > len(self._claves) * 7:
+            self._crecer()
+        return None
+    
+    def _crecer(self):
+        claves, votos = self._claves, self._votos
+        self._claves = array("Q", [0]) * (len(claves) * 2)
+        self._votos = array("b", [0]) * (len(claves) * 2)
+        for clave, voto in zip(claves, votos):
+            if clave:
+                i = self._hueco(clave)
+                self._claves[i] = clave
+                self._votos[i] = voto
+    
+    def __len__(self) -> int:
+        return self._n
+
+class AgregadoVotos:
+    """
+    Agregados de los votos de la comunidad a una propuesta: suma, número de
+    votantes, media e histograma en tramos de 10 puntos. Cada voto cuesta
+    O(1); si el usuario ya había votado, su voto anterior se descuenta.
+    """
+    
+    TRAMOS = 21
+    
+    def __init__(self):
+        self.suma = 0
+        self.conteo = 0
+        self.histograma = array("q", [0]) * self.TRAMOS
+        self._usuarios = _VotosPorUsuario()
+    
+    @staticmethod
+    def _tramo(voto: int) -> int:
+        return (voto + 100) // 10
+    
+    def votar(self, clave: int, voto: int) -> bool:
+        """Registra el voto; True si es el primero del usuario"""
+        anterior = self._usuarios.poner(clave, voto)
+        if anterior is None:
+            self.conteo += 1
+        else:
+            self.suma -= anterior
+            self.histograma[self._tramo(anterior)] -= 1
+        self.suma += voto
+        self.histograma[self._tramo(voto)] += 1
+        return anterior is None
+    
+    def voto_de(self, usuario: str) -> Optional[int]:
+        return self._usuarios.get(clave_usuario(usuario))
+    
+    @property
+    def media(self) -> float:
+        return self.suma / self.conteo if self.conteo else 0.0
+    
+    def resumen(self) -> Dict:
+        return {
+            "suma": self.suma,
+            "conteo": self.conteo,
+            "media": round(self.media, 2),
+            "histograma": {f"{-100 + 10 * k}..{min(100, -91 + 10 * k)}": n
+                           for k, n in enumerate(self.histograma)}
+        }
+
+class AlmacenPropuestas:
+    """
+    Propuestas indexadas por id, estado, tipo y proponente.
+    
+    Cada propuesta recibe un número de secuencia creciente; los índices por
+    estado, tipo y proponente son listas ordenadas de secuencias, así que
+    listar con filtros recorre solo las propuestas de la lista más corta y
+    pagina con la secuencia como cursor estable. Con `ruta_db`, cada cambio
+    se escribe en SQLite y al arrancar se recargan las propuestas.
+    """
+    
+    _CAMPOS = ("id", "titulo", "descripcion", "tipo", "monto_solicitado", "retorno_esperado",
+               "plazo_meses", "proponente", "votos_ia", "votos_comunidad", "score_etico",
+               "fecha_creacion", "estado")
+    _UPDATE = f"UPDATE propuestas SET {', '.join(c + ' = ?' for c in _CAMPOS[1:])} WHERE id = ?"
+    
+    def __init__(self, ruta_db: Optional[str] = None):
+        self._por_id: Dict[str, PropuestaInversion] = {}
+        self._seq: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._por_estado: Dict[str, List[int]] = {}
+        self._por_tipo: Dict[TipoInversion, List[int]] = {}
+        self._por_proponente: Dict[str, List[int]] = {}
+        # Estado con el que está indexada cada propuesta (el campo se puede cambiar por fuera)
+        self._estado_indexado: Dict[str, str] = {}
+        self.conn = None
+        if ruta_db:
+            self.conn = sqlite3.connect(ruta_db, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS propuestas (
+                    seq INTEGER PRIMARY KEY,
+                    {", ".join(c + (" TEXT UNIQUE NOT NULL" if c == "id" else "") for c in self._CAMPOS)}
+                )""")
+            # Registro append-only de votos: al recargar, el último de cada usuario gana
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS votos (
+                    propuesta_id TEXT NOT NULL,
+                    usuario INTEGER NOT NULL,
+                    voto INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS votos_por_propuesta ON votos (propuesta_id);
+            """)
+            self._cargar()
+    
+    def _cargar(self):
+        filas = self.conn.execute(f"SELECT seq, {', '.join(self._CAMPOS)} FROM propuestas ORDER BY seq")
+        for seq, *valores in filas:
+            datos = dict(zip(self._CAMPOS, valores))
+            datos["tipo"] = TipoInversion(datos["tipo"])
+            if datos["fecha_creacion"]:
+                datos["fecha_creacion"] = datetime.fromisoformat(datos["fecha_creacion"])
+            self._indexar(PropuestaInversion(**datos))
+    
+    def _fila(self, propuesta: PropuestaInversion) -> tuple:
+        valores = []
+        for campo in self._CAMPOS:
+            valor = getattr(propuesta, campo)
+            if campo == "tipo":
+                valor = valor.value
+            elif campo == "fecha_creacion" and valor is not None:
+                valor = valor.isoformat()
+            valores.append(valor)
+        return tuple(valores)
+    
+    def _indexar(self, propuesta: PropuestaInversion) -> int:
+        seq = len(self._ids)
+        self._ids.append(propuesta.id)
+        self._por_id[propuesta.id] = propuesta
+        self._seq[propuesta.id] = seq
+        # Secuencia creciente: añadir al final mantiene las listas ordenadas
+        self._por_estado.setdefault(propuesta.estado, []).append(seq)
+        self._por_tipo.setdefault(propuesta.tipo, []).append(seq)
+        self._por_proponente.setdefault(propuesta.proponente, []).append(seq)
+        self._estado_indexado[propuesta.id] = propuesta.estado
+        return seq
+    
+    def agregar(self, propuesta: PropuestaInversion):
+        if propuesta.id in self._por_id:
+            raise ValueError(f"Propuesta duplicada: {propuesta.id}")
+        seq = self._indexar(propuesta)
+        if self.conn:
+            with self.conn:
+                self.conn.execute(
+                    f"INSERT INTO propuestas (seq, {', '.join(self._CAMPOS)}) "
+                    f"VALUES (?, {', '.join('?' * len(self._CAMPOS))})",
+                    (seq,) + self._fila(propuesta))
+    
+    # Compatibilidad con el uso anterior como lista
+    append = agregar
+    
+    def get(self, propuesta_id: str) -> Optional[PropuestaInversion]:
+        return self._por_id.get(propuesta_id)
+    
+    def _reindexar(self, propuesta: PropuestaInversion) -> bool:
+        """Mueve la propuesta de índice de estado si cambió; False si no está en el almacén"""
+        anterior = self._estado_indexado.get(propuesta.id)
+        if anterior is None:
+            return False
+        if anterior != propuesta.estado:
+            seq = self._seq[propuesta.id]
+            lista = self._por_estado[anterior]
+            del lista[bisect.bisect_left(lista, seq)]
+            if not lista:
+                del self._por_estado[anterior]
+            bisect.insort(self._por_estado.setdefault(propuesta.estado, []), seq)
+            self._estado_indexado[propuesta.id] = propuesta.estado
+        return True
+    
+    def _actualizacion(self, propuesta: PropuestaInversion) -> tuple:
+        fila = self._fila(propuesta)
+        return fila[1:] + (fila[0],)
+    
+    def guardar(self, propuesta: PropuestaInversion, votos: List[Tuple[int, int]] = ()):
+        """
+        Reindexa el estado si cambió y persiste los campos de la propuesta,
+        junto con los votos (clave_usuario, voto) dados, en una transacción.
+        """
+        if not self._reindexar(propuesta):
+            return
+        if self.conn:
+            with self.conn:
+                if votos:
+                    self.conn.executemany("INSERT INTO votos VALUES (?, ?, ?)",
+                                          [(propuesta.id, clave, voto) for clave, voto in votos])
+                self.conn.execute(self._UPDATE, self._actualizacion(propuesta))
+    
+    def guardar_lote(self, propuestas: List[PropuestaInversion]):
+        """
+        Como guardar() para muchas propuestas, en una sola transacción. Los
+        cambios de estado se aplican por índice de una vez (filtrar y
+        reordenar cada lista) en lugar de uno a uno.
+        """
+        propuestas = [p for p in propuestas if p.id in self._estado_indexado]
+        salen: Dict[str, set] = {}
+        entran: Dict[str, List[int]] = {}
+        for p in propuestas:
+            anterior = self._estado_indexado[p.id]
+            if anterior != p.estado:
+                seq = self._seq[p.id]
+                salen.setdefault(anterior, set()).add(seq)
+                entran.setdefault(p.estado, []).append(seq)
+                self._estado_indexado[p.id] = p.estado
+        for estado, seqs in salen.items():
+            lista = [seq for seq in self._por_estado[estado] if seq not in seqs]
+            if lista:
+                self._por_estado[estado] = lista
+            else:
+                del self._por_estado[estado]
+        for estado, seqs in entran.items():
+            lista = self._por_estado.setdefault(estado, [])
+            lista.extend(seqs)
+            lista.sort()
+        if self.conn and propuestas:
+            with self.conn:
+                self.conn.executemany(self._UPDATE, [self._actualizacion(p) for p in propuestas])
+    
+    def con_estado(self, estado: str) -> List[PropuestaInversion]:
+        """Propuestas en un estado, de la más antigua a la más reciente"""
+        return [self._por_id[self._ids[seq]] for seq in self._por_estado.get(estado, ())]
+    
+    def listar(self, estado: Optional[str] = None, tipo: Optional[TipoInversion] = None,
+               proponente: Optional[str] = None, limite: int = 50,
+               cursor: Optional[int] = None) -> Dict:
+        """
+        Propuestas que cumplen los filtros, de la más reciente a la más
+        antigua. `cursor` es el `siguiente_cursor` de la página anterior.
+        """
+        listas = []
+        if estado is not None:
+            listas.append(self._por_estado.get(estado, []))
+        if tipo is not None:
+            listas.append(self._por_tipo.get(tipo, []))
+        if proponente is not None:
+            listas.append(self._por_proponente.get(proponente, []))
+        fin = len(self._ids) if cursor is None else cursor
+        
+        if listas:
+            lista = min(listas, key=len)
+            candidatas = (lista[k] for k in range(bisect.bisect_left(lista, fin) - 1, -1, -1))
+            total = len(lista) if len(listas) == 1 else None
+        else:
+            candidatas = iter(range(min(fin, len(self._ids)) - 1, -1, -1))
+            total = len(self._ids)
+        
+        pagina = []
+        siguiente = None
+        for seq in candidatas:
+            propuesta = self._por_id[self._ids[seq]]
+            if ((estado is None or self._estado_indexado[propuesta.id] == estado) and
+                    (tipo is None or propuesta.tipo == tipo) and
+                    (proponente is None or propuesta.proponente == proponente)):
+                if len(pagina) == limite:
+                    siguiente = seq + 1
+                    break
+                pagina.append(propuesta)
+        return {"propuestas": pagina, "total": total, "siguiente_cursor": siguiente}
+    
+    def votantes(self) -> Dict[str, int]:
+        """Número de votantes distintos por propuesta según la base ({} sin base)"""
+        if not self.conn:
+            return {}
+        return dict(self.conn.execute(
+            "SELECT propuesta_id, COUNT(DISTINCT usuario) FROM votos GROUP BY propuesta_id"))
+    
+    def votos(self, propuesta_id: str) -> Iterator[Tuple[int, int]]:
+        """Votos guardados de una propuesta, en orden de llegada: (clave_usuario, voto)"""
+        if self.conn:
+            yield from self.conn.execute(
+                "SELECT usuario, voto FROM votos WHERE propuesta_id = ? ORDER BY rowid", (propuesta_id,))
+    
+    def contar(self, estado: Optional[str] = None) -> int:
+        return len(self._ids) if estado is None else len(self._por_estado.get(estado, ()))
+    
+    def __contains__(self, propuesta_id: str) -> bool:
+        return propuesta_id in self._por_id
+    
+    def __len__(self) -> int:
+        return len(self._ids)
+    
+    def __iter__(self) -> Iterator[PropuestaInversion]:
+        return iter(list(self._por_id.values()))
+    
+    def cerrar(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
 class ConsejoSapiens:
     """Consejo que decide inversiones"""
     
-    def __init__(self, treasury=None):
+    def __init__(self, treasury=None, ruta_db: Optional[str] = None, semilla: Optional[int] = None,
+                 filtro_etico: Optional[FiltroEtico] = None, config: Optional[Dict] = None):
         self.treasury = treasury
-        self.propuestas = []
+        # votacion_dias, min_votos_comunidad... de config/system_config.yaml
+        self.config = cargar_config_consejo() if config is None else config
+        if filtro_etico is None:
+            filtro_etico = (FiltroEtico.desde_archivo(RUTA_VOCABULARIO) if os.path.exists(RUTA_VOCABULARIO)
+                            else FiltroEtico())
+        self.filtro_etico = filtro_etico
+        # Fuente del término de caos: con la misma semilla, decidir y decidir_lote coinciden
+        self.azar = random.Random(semilla)
+        self.propuestas = AlmacenPropuestas(ruta_db)
         self.historial = []
-        self.comunidad_votos = {}
+        # propuesta_id -> AgregadoVotos (se reconstruye de la base al primer voto)
+        self.comunidad_votos: Dict[str, AgregadoVotos] = {}
+        # Suscriptores a eventos ("propuesta", "voto") con la propuesta afectada
+        self._observadores: List[Callable[[str, PropuestaInversion], None]] = []
         
         print("""
 ╔════════════════════════════════════════════════════════════╗
@@ -68,8 +567,11 @@ class ConsejoSapiens:
     def proponer(self, titulo: str, descripcion: str, tipo: TipoInversion, 
                  monto: float, roi: float, plazo: int, proponente: str) -> PropuestaInversion:
         """Nueva propuesta de inversión"""
+        propuesta_id = hashlib.sha256(f"{titulo}{time.time()}".encode()).hexdigest()[:12]
+        while propuesta_id in self.propuestas:
+            propuesta_id = hashlib.sha256(f"{titulo}{time.time()}{propuesta_id}".encode()).hexdigest()[:12]
         propuesta = PropuestaInversion(
-            id=hashlib.sha256(f"{titulo}{time.time()}".encode()).hexdigest()[:12],
+            id=propuesta_id,
             titulo=titulo,
             descripcion=descripcion,
             tipo=tipo,
@@ -82,14 +584,29 @@ class ConsejoSapiens:
         
         self.propuestas.append(propuesta)
         print(f"📢 NUEVA PROPUESTA: {titulo}")
+        self._notificar("propuesta", propuesta)
         return propuesta
     
+    def suscribir(self, observador: Callable[[str, PropuestaInversion], None]):
+        """Llama a observador(evento, propuesta) al proponer ("propuesta") y al votar ("voto")"""
+        self._observadores.append(observador)
+    
+    def _notificar(self, evento: str, propuesta: PropuestaInversion):
+        for observador in self._observadores:
+            observador(evento, propuesta)
+    
     def votar_ia(self, propuesta_id: str) -> int:
         """La IA vota (0-100)"""
-        propuesta = next((p for p in self.propuestas if p.id == propuesta_id), None)
+        propuesta = self.propuestas.get(propuesta_id)
         if not propuesta:
             return 0
         
+        propuesta.votos_ia = self._score_ia(propuesta)
+        self.propuestas.guardar(propuesta)
+        return propuesta.votos_ia
+    
+    @staticmethod
+    def _score_ia(propuesta: PropuestaInversion) -> int:
         # Heurística simple
         score = 50
         
@@ -105,46 +622,106 @@ class ConsejoSapiens:
         if 2.0 <= propuesta.retorno_esperado <= 4.0:
             score += 10
         
-        propuesta.votos_ia = max(0, min(100, score))
-        return propuesta.votos_ia
+        return max(0, min(100, score))
     
     def votar_comunidad(self, propuesta_id: str, usuario: str, voto: int) -> bool:
         """Comunidad vota (-100 a 100)"""
-        propuesta = next((p for p in self.propuestas if p.id == propuesta_id), None)
+        propuesta = self.propuestas.get(propuesta_id)
         if not propuesta:
             return False
         
-        if propuesta_id not in self.comunidad_votos:
-            self.comunidad_votos[propuesta_id] = []
+        if not -100 <= voto <= 100:
+            return False
         
-        self.comunidad_votos[propuesta_id].append(voto)
-        propuesta.votos_comunidad = sum(self.comunidad_votos[propuesta_id])
+        clave = clave_usuario(usuario)
+        agregado = self._agregado(propuesta_id)
+        agregado.votar(clave, int(voto))
+        propuesta.votos_comunidad = agregado.suma
+        self.propuestas.guardar(propuesta, [(clave, int(voto))])
+        self._notificar("voto", propuesta)
         return True
     
+    def _agregado(self, propuesta_id: str) -> AgregadoVotos:
+        agregado = self.comunidad_votos.get(propuesta_id)
+        if agregado is None:
+            agregado = self.comunidad_votos[propuesta_id] = AgregadoVotos()
+            for clave, voto in self.propuestas.votos(propuesta_id):
+                agregado.votar(clave, voto)
+        return agregado
+    
+    def votar_comunidad_lote(self, votos: List[Tuple[str, str, int]], origen: str = "") -> Dict:
+        """
+        Importa votos en bloque [(propuesta_id, usuario, voto), ...], p. ej.
+        desde Telegram o WhatsApp. Se aplican en orden (si un usuario vota
+        dos veces, cuenta el último) y cada propuesta se persiste una vez.
+        """
+        por_propuesta: Dict[str, List[Tuple[int, int]]] = {}
+        rechazados = 0
+        for propuesta_id, usuario, voto in votos:
+            if propuesta_id not in self.propuestas or not -100 <= voto <= 100:
+                rechazados += 1
+                continue
+            por_propuesta.setdefault(propuesta_id, []).append((clave_usuario(usuario), int(voto)))
+        
+        nuevos = cambiados = 0
+        for propuesta_id, filas in por_propuesta.items():
+            agregado = self._agregado(propuesta_id)
+            votar = agregado.votar
+            for clave, voto in filas:
+                if votar(clave, voto):
+                    nuevos += 1
+                else:
+                    cambiados += 1
+            propuesta = self.propuestas.get(propuesta_id)
+            propuesta.votos_comunidad = agregado.suma
+            self.propuestas.guardar(propuesta, filas)
+            self._notificar("voto", propuesta)
+        
+        return {"origen": origen, "aceptados": nuevos + cambiados, "nuevos": nuevos,
+                "cambiados": cambiados, "rechazados": rechazados, "propuestas": len(por_propuesta)}
+    
+    def resultados_comunidad(self, propuesta_id: str) -> Optional[Dict]:
+        """Suma, votantes, media e histograma de la comunidad para una propuesta"""
+        if propuesta_id not in self.propuestas:
+            return None
+        return self._agregado(propuesta_id).resumen()
+    
     def evaluar_etica(self, propuesta_id: str) -> float:
         """Comité ético evalúa"""
-        propuesta = next((p for p in self.propuestas if p.id == propuesta_id), None)
+        propuesta = self.propuestas.get(propuesta_id)
         if not propuesta:
             return 0
         
+        propuesta.score_etico = self._score_etico(propuesta)
+        self.propuestas.guardar(propuesta)
+        return propuesta.score_etico
+    
+    def analisis_etico(self, propuesta_id: str) -> Optional[Dict]:
+        """Términos vetados encontrados en título y descripción, con sus posiciones"""
+        propuesta = self.propuestas.get(propuesta_id)
+        if not propuesta:
+            return None
+        return {
+            "version": self.filtro_etico.version,
+            "titulo": self.filtro_etico.analizar(propuesta.titulo),
+            "descripcion": self.filtro_etico.analizar(propuesta.descripcion)
+        }
+    
+    def _score_etico(self, propuesta: PropuestaInversion) -> int:
         score = 100
         
-        # Palabras prohibidas
-        prohibidas = ["arma", "bomba", "apuesta", "casino", "tabaco", "alcohol"]
-        for p in prohibidas:
-            if p in propuesta.descripcion.lower():
-                score -= 30
+        # Términos vetados
+        score -= self.filtro_etico.penalizar(propuesta.descripcion)
         
         # Descripción muy corta
         if len(propuesta.descripcion) < 100:
             score -= 20
         
-        propuesta.score_etico = max(0, min(100, score))
-        return propuesta.score_etico
+        return max(0, min(100, score))
     
     def decidir(self, propuesta_id: str) -> Dict:
         """Toma la decisión final"""
-        propuesta = next((p for p in self.propuestas if p.id == propuesta_id), None)
+        propuesta = self.propuestas.get(propuesta_id)
         if not propuesta:
             return {"error": "Propuesta no encontrada"}
         
@@ -159,7 +736,7 @@ class ConsejoSapiens:
             comunidad = (propuesta.votos_comunidad + 10000) / 200
         
         # Caos
-        caos = random.randint(-5, 5)
+        caos = self.azar.randint(-5, 5)
         
         # Puntuación final
         puntuacion = ia * 0.33 + comunidad * 0.33 + etica * 0.33 + caos * 0.01
@@ -177,6 +754,7 @@ class ConsejoSapiens:
             propuesta.estado = "rechazada"
         else:
             propuesta.estado = "pendiente_revision"
+        self.propuestas.guardar(propuesta)
         
         decision = {
             "id": propuesta.id,
@@ -191,6 +769,257 @@ class ConsejoSapiens:
         
         self.historial.append(decision)
         return decision
+    
+    def _caos_lote(self, n: int):
+        """
+        Los n términos de caos que darían n llamadas a self.azar.randint(-5, 5).
+        
+        En CPython, randint(-5, 5) toma los 4 bits altos de una salida de 32
+        bits del Mersenne Twister y repite mientras el valor sea >= 11. Aquí
+        se piden las salidas en bloque, se aplica el mismo rechazo con NumPy
+        y el generador se deja avanzado exactamente las salidas consumidas.
+        """
+        if not NUMPY_AVAILABLE:
+            return [self.azar.randint(-5, 5) for _ in range(n)]
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        estado = self.azar.getstate()
+        trozos = []
+        aceptados = 0
+        while aceptados < n:
+            pedir = (n - aceptados) * 3 // 2 + 32
+            palabras = np.frombuffer(self.azar.getrandbits(32 * pedir).to_bytes(4 * pedir, "little"),
+                                     dtype="<u4") >> 28
+            trozos.append(palabras)
+            aceptados += int(np.count_nonzero(palabras < 11))
+        valores = np.concatenate(trozos)
+        validos = np.flatnonzero(valores < 11)[:n]
+        # Deja el generador como si solo se hubieran consumido las salidas usadas
+        self.azar.setstate(estado)
+        self.azar.getrandbits(32 * (int(validos[-1]) + 1))
+        return valores[validos].astype(np.int64) - 5
+    
+    def decidir_lote(self, propuesta_ids: Optional[List[str]] = None) -> Dict:
+        """
+        Decide muchas propuestas de una vez: por defecto, todas las pendientes.
+        
+        Aplica el mismo modelo que decidir() sobre arrays de NumPy (heurística
+        IA, ética, comunidad normalizada y caos) y da las mismas decisiones
+        que llamar a decidir() en el mismo orden con la misma semilla. Las
+        propuestas aprobadas se envían a la tesorería en una sola emisión.
+        """
+        if propuesta_ids is None:
+            propuestas = self.propuestas.con_estado("pendiente")
+        else:
+            propuestas = [p for p in map(self.propuestas.get, propuesta_ids) if p is not None]
+        n = len(propuestas)
+        caos = self._caos_lote(n)
+        
+        if NUMPY_AVAILABLE and n:
+            tipos = np.fromiter((p.tipo is TipoInversion.FONDO_SUENOS for p in propuestas), dtype=bool, count=n)
+            montos = np.fromiter((p.monto_solicitado for p in propuestas), dtype=np.float64, count=n)
+            roi = np.fromiter((p.retorno_esperado for p in propuestas), dtype=np.float64, count=n)
+            votos = np.fromiter((p.votos_comunidad for p in propuestas), dtype=np.float64, count=n)
+            penalizar = self.filtro_etico.penalizar
+            penalizaciones = np.fromiter((penalizar(p.descripcion) for p in propuestas), dtype=np.int64, count=n)
+            cortas = np.fromiter((len(p.descripcion) < 100 for p in propuestas), dtype=bool, count=n)
+            
+            ia = 50 + 20 * tipos - 15 * (montos > 50000) + 10 * ((roi >= 2.0) & (roi <= 4.0))
+            ia = np.clip(ia, 0, 100)
+            etica = np.clip(100 - penalizaciones - 20 * cortas, 0, 100)
+            comunidad = np.where(votos == 0, 50, (votos + 10000) / 200)
+            puntuacion = ia * 0.33 + comunidad * 0.33 + etica * 0.33 + caos * 0.01
+            estados = np.where(puntuacion >= 60, "aprobada",
+                               np.where(puntuacion < 40, "rechazada", "pendiente_revision"))
+            ia, etica, comunidad = ia.tolist(), etica.tolist(), comunidad.tolist()
+            puntuacion, estados, caos = puntuacion.tolist(), estados.tolist(), caos.tolist()
+        else:
+            ia = [self._score_ia(p) for p in propuestas]
+            etica = [self._score_etico(p) for p in propuestas]
+            comunidad = [50 if p.votos_comunidad == 0 else (p.votos_comunidad + 10000) / 200 for p in propuestas]
+            puntuacion = [a * 0.33 + c * 0.33 + e * 0.33 + x * 0.01 for a, c, e, x in zip(ia, comunidad, etica, caos)]
+            estados = ["aprobada" if s >= 60 else "rechazada" if s < 40 else "pendiente_revision"
+                       for s in puntuacion]
+        
+        decisiones = []
+        emisiones = []
+        for k, propuesta in enumerate(propuestas):
+            propuesta.votos_ia = ia[k]
+            propuesta.score_etico = etica[k]
+            propuesta.estado = estados[k]
+            if estados[k] == "aprobada":
+                emisiones.append((propuesta.monto_solicitado / 0.10, propuesta.monto_solicitado,
+                                  f"PROYECTO_{propuesta.id}", f"Inversión: {propuesta.titulo}"))
+            decisiones.append({
+                "id": propuesta.id,
+                "titulo": propuesta.titulo,
+                "puntuacion": round(puntuacion[k], 2),
+                "ia": ia[k],
+                "comunidad": round(comunidad[k], 2),
+                "etica": etica[k],
+                "caos": caos[k],
+                "decision": estados[k]
+            })
+        self.propuestas.guardar_lote(propuestas)
+        self.historial.extend(decisiones)
+        
+        emision = None
+        if self.treasury and emisiones:
+            if hasattr(self.treasury, "emitir_lote"):
+                emision = self.treasury.emitir_lote(emisiones)
+            else:
+                emision = [self.treasury.emitir_forgecoins(*e) for e in emisiones]
+        
+        return {
+            "decididas": n,
+            "aprobadas": len(emisiones),
+            "decisiones": decisiones,
+            "emision": emision
+        }
+
+class ProgramadorVotaciones:
+    """
+    Cierra las ventanas de votación del Consejo sin sondeos.
+    
+    Las propuestas pendientes esperan en un montículo ordenado por cierre
+    (creación + `votacion_dias`). Una propuesta se decide al cerrar su
+    ventana o antes, en cuanto reúne `min_votos_comunidad` votantes; las que
+    están listas a la vez se deciden en un solo decidir_lote. La tarea
+    asyncio duerme hasta el próximo cierre y solo la despiertan los avisos
+    del Consejo (propuesta que cierra antes o quórum alcanzado). No guarda
+    nada aparte: al arrancar, el montículo se reconstruye con las propuestas
+    pendientes del almacén y el quórum con los votos de la base.
+    """
+    
+    def __init__(self, consejo: ConsejoSapiens, votacion_dias: Optional[float] = None,
+                 min_votos_comunidad: Optional[int] = None, max_lote: int = 10000):
+        self.consejo = consejo
+        config = consejo.config
+        dias = config.get("votacion_dias", 7) if votacion_dias is None else votacion_dias
+        self.votacion_segundos = float(dias) * 86400
+        self.min_votos = int(config.get("min_votos_comunidad", 100) if min_votos_comunidad is None
+                             else min_votos_comunidad)
+        self.max_lote = max_lote
+        self._monticulo: List[Tuple[float, int, str]] = []
+        self._secuencia = 0
+        # Propuestas con quórum, en orden de llegada (dict como conjunto ordenado)
+        self._con_quorum: Dict[str, None] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._despertar: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self.lotes = 0
+        self.decididas = 0
+        self._reconstruir()
+        consejo.suscribir(self._al_evento)
+    
+    def _cierre(self, propuesta: PropuestaInversion) -> float:
+        creada = propuesta.fecha_creacion.timestamp() if propuesta.fecha_creacion else time.time()
+        return creada + self.votacion_segundos
+    
+    def _reconstruir(self):
+        pendientes = self.consejo.propuestas.con_estado("pendiente")
+        votantes = self.consejo.propuestas.votantes()
+        with self._lock:
+            self._monticulo = [(self._cierre(p), k, p.id) for k, p in enumerate(pendientes)]
+            heapq.heapify(self._monticulo)
+            self._secuencia = len(pendientes)
+            for p in pendientes:
+                agregado = self.consejo.comunidad_votos.get(p.id)
+                n = agregado.conteo if agregado is not None else votantes.get(p.id, 0)
+                if n >= self.min_votos:
+                    self._con_quorum[p.id] = None
+    
+    def _al_evento(self, evento: str, propuesta: PropuestaInversion):
+        if propuesta.estado != "pendiente":
+            return
+        if evento == "propuesta":
+            cierre = self._cierre(propuesta)
+            with self._lock:
+                heapq.heappush(self._monticulo, (cierre, self._secuencia, propuesta.id))
+                self._secuencia += 1
+                primera = self._monticulo[0][2] == propuesta.id
+            if primera:
+                self._avisar()
+        elif evento == "voto":
+            agregado = self.consejo.comunidad_votos.get(propuesta.id)
+            if agregado is None or agregado.conteo < self.min_votos:
+                return
+            with self._lock:
+                nueva = propuesta.id not in self._con_quorum
+                self._con_quorum[propuesta.id] = None
+            if nueva:
+                self._avisar()
+    
+    def _avisar(self):
+        """Despierta la tarea asyncio (los avisos pueden llegar desde otros hilos)"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._despertar.set)
+    
+    def proximo_cierre(self) -> Optional[float]:
+        """Timestamp del próximo cierre de ventana (descarta propuestas ya decididas)"""
+        propuestas = self.consejo.propuestas
+        with self._lock:
+            while self._monticulo:
+                propuesta = propuestas.get(self._monticulo[0][2])
+                if propuesta is not None and propuesta.estado == "pendiente":
+                    return self._monticulo[0][0]
+                heapq.heappop(self._monticulo)
+        return None
+    
+    def procesar(self, ahora: Optional[float] = None) -> Optional[Dict]:
+        """Decide en un lote las propuestas con quórum y las de ventana vencida"""
+        ahora = time.time() if ahora is None else ahora
+        with self._lock:
+            listas = list(self._con_quorum)
+            self._con_quorum.clear()
+            vistas = set(listas)
+            while self._monticulo and self._monticulo[0][0] <= ahora and len(listas) < self.max_lote:
+                _, _, propuesta_id = heapq.heappop(self._monticulo)
+                if propuesta_id not in vistas:
+                    vistas.add(propuesta_id)
+                    listas.append(propuesta_id)
+        ids = [pid for pid in listas
+               if (p := self.consejo.propuestas.get(pid)) is not None and p.estado == "pendiente"]
+        if not ids:
+            return None
+        resultado = self.consejo.decidir_lote(ids)
+        self.lotes += 1
+        self.decididas += resultado["decididas"]
+        return resultado
+    
+    async def ejecutar(self):
+        """Bucle de la tarea: decide lo que esté listo y duerme hasta el próximo cierre o aviso"""
+        self._loop = asyncio.get_running_loop()
+        self._despertar = asyncio.Event()
+        try:
+            while True:
+                self._despertar.clear()
+                self.procesar()
+                cierre = self.proximo_cierre()
+                espera = None if cierre is None else max(0.0, cierre - time.time())
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = None
+    
+    def iniciar(self) -> asyncio.Task:
+        """Lanza la tarea en el event loop en curso"""
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.get_running_loop().create_task(self.ejecutar())
+        return self._tarea
+    
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
 
 if __name__ == "__main__":
     consejo = ConsejoSapiens()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Pruebas del Consejo Sapiens
+Ejecuta: python -m pytest test_consejo_sapiens.py
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import consejo_sapiens as cs
+
+
+def _consejo_con_propuestas(semilla, n=500):
+    """Consejo con n propuestas variadas; el mismo contenido para la misma semilla"""
+    azar = random.Random(42)
+    consejo = cs.ConsejoSapiens(semilla=semilla)
+    descripciones = ["corto", "x" * 150, "Un casino con alcohol y tabaco " + "y" * 90, "bomba de agua " * 10]
+    for i in range(n):
+        propuesta = consejo.proponer(
+            f"P{i}", azar.choice(descripciones), azar.choice(list(cs.TipoInversion)),
+            azar.choice([1000, 30000, 60000]), azar.choice([1.0, 3.0, 5.0]), 6, f"@u{i % 5}"
+        )
+        if azar.random() < 0.5:
+            consejo.votar_comunidad(propuesta.id, "@a", azar.randint(-100, 100))
+    return consejo
+
+
+@pytest.mark.parametrize("con_numpy", [True, False])
+@pytest.mark.parametrize("semilla", [1, 7])
+def test_decidir_lote_igual_a_decidir(monkeypatch, semilla, con_numpy):
+    """Mismas decisiones que decidir() en orden y el generador queda en el mismo estado"""
+    if con_numpy and not cs.NUMPY_AVAILABLE:
+        pytest.skip("numpy no disponible")
+    monkeypatch.setattr(cs, "NUMPY_AVAILABLE", con_numpy and cs.NUMPY_AVAILABLE)
+    uno_a_uno = _consejo_con_propuestas(semilla)
+    en_lote = _consejo_con_propuestas(semilla)
+
+    esperadas = [uno_a_uno.decidir(p.id) for p in list(uno_a_uno.propuestas)]
+    obtenidas = en_lote.decidir_lote()["decisiones"]
+
+    sin_id = lambda d: {k: v for k, v in d.items() if k != "id"}
+    assert [sin_id(d) for d in obtenidas] == [sin_id(d) for d in esperadas]
+    assert en_lote.azar.getstate() == uno_a_uno.azar.getstate()
+    assert en_lote.propuestas.contar("pendiente") == 0
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("Ｃａｓｉｎｏ", "casino"),
+    ("ﬁnanzas", "finanzas"),
+    ("Café ﬁno", "cafe fino"),
+    ("Árbol Ñandú", "arbol nandu"),
+])
+def test_normalizar_texto_pliega_nfkd(texto, esperado):
+    """Anchos completos y ligaduras se pliegan como en NFKD aunque el texto sea NFC"""
+    normalizado, posiciones = cs.normalizar_texto(texto)
+    assert normalizado == esperado
+    if posiciones is not None:
+        assert len(posiciones) == len(normalizado) + 1
+
+
+def test_filtro_etico_detecta_anchos_completos():
+    filtro = cs.FiltroEtico()
+    coincidencias = filtro.analizar("Un Ｃａｓｉｎｏ nuevo")
+    assert [c["termino"] for c in coincidencias] == ["casino"]
+    assert coincidencias[0]["texto"] == "Ｃａｓｉｎｏ"
@@ -17,19 +17,305 @@ import json
 import time
 import uuid
 import os
-from typing import Dict, List, Optional
-from datetime import datetime
+import heapq
+import math
+import sqlite3
+import weakref
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from sortedcontainers import SortedList
+    SORTED_AVAILABLE = True
+except ImportError:
+    SORTED_AVAILABLE = False
+
+try:
+    # Dentro del paquete economia_inteligente; suelto, se usa la tasa fija
+    from ..precios_regionales import obtener_precios
+    PRECIOS_AVAILABLE = True
+except ImportError:
+    PRECIOS_AVAILABLE = False
+
+# Tasa FC -> USD de respaldo si no hay tabla de precios regionales
+TASA_USD_POR_DEFECTO = 0.10
+
+class _RunningSum:
+    """Suma incremental compensada (Neumaier): no acumula error de redondeo"""
+    
+    __slots__ = ("total", "_compensation")
+    
+    def __init__(self):
+        self.total = 0.0
+        self._compensation = 0.0
+    
+    def add(self, value: float):
+        t = self.total + value
+        if abs(self.total) >= abs(value):
+            self._compensation += (self.total - t) + value
+        else:
+            self._compensation += (value - t) + self.total
+        self.total = t
+    
+    @property
+    def value(self) -> float:
+        return self.total + self._compensation
+
+class TransactionHistory:
+    """
+    Historial append-only de una wallet, en orden de llegada (= orden temporal).
+    
+    Cada transacción tiene una posición fija (su número de secuencia), que
+    sirve de cursor estable para paginar. Las últimas N se sirven en O(N)
+    sin reordenar. Con `spill_path`, cuando en memoria hay más de
+    `max_in_memory` transacciones las más antiguas pasan a un archivo JSONL
+    y en memoria solo queda su offset.
+    """
+    
+    def __init__(self, spill_path: Optional[str] = None, max_in_memory: int = 10000):
+        self.spill_path = spill_path
+        self.max_in_memory = max_in_memory
+        self._recent: List[Dict] = []
+        self._spilled_offsets = array("Q")
+        self._spilled_end = 0
+        if spill_path and os.path.exists(spill_path):
+            self._load_spilled()
+    
+    def _load_spilled(self):
+        offset = 0
+        with open(self.spill_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._spilled_offsets.append(offset)
+                offset += len(line)
+        self._spilled_end = offset
+    
+    @property
+    def spilled(self) -> int:
+        return len(self._spilled_offsets)
+    
+    def append(self, tx: Dict):
+        self._recent.append(tx)
+        if self.spill_path and len(self._recent) > self.max_in_memory:
+            self._spill(len(self._recent) // 2)
+    
+    def extend(self, txs: List[Dict]):
+        self._recent.extend(txs)
+        if self.spill_path and len(self._recent) > self.max_in_memory:
+            self._spill(len(self._recent) - self.max_in_memory // 2)
+    
+    def _spill(self, n: int):
+        """Mueve las n transacciones más antiguas en memoria al archivo"""
+        lines = [json.dumps(tx, separators=(",", ":")).encode() + b"\n" for tx in self._recent[:n]]
+        with open(self.spill_path, "r+b" if os.path.exists(self.spill_path) else "wb") as f:
+            # Descarta una escritura cortada a medias antes de seguir añadiendo
+            f.truncate(self._spilled_end)
+            f.seek(self._spilled_end)
+            for line in lines:
+                self._spilled_offsets.append(self._spilled_end)
+                self._spilled_end += len(line)
+                f.write(line)
+        del self._recent[:n]
+    
+    def _read_spilled(self, start: int, end: int) -> List[Dict]:
+        if start >= end:
+            return []
+        stop = self._spilled_offsets[end] if end < self.spilled else self._spilled_end
+        with open(self.spill_path, "rb") as f:
+            f.seek(self._spilled_offsets[start])
+            data = f.read(stop - self._spilled_offsets[start])
+        return [json.loads(line) for line in data.splitlines()]
+    
+    def range(self, start: int, end: int) -> List[Dict]:
+        """Transacciones con secuencia en [start, end), de la más antigua a la más reciente"""
+        start, end = max(0, start), min(end, len(self))
+        spilled = self.spilled
+        result = self._read_spilled(start, min(end, spilled)) if start < spilled else []
+        result.extend(self._recent[max(start, spilled) - spilled:max(end, spilled) - spilled])
+        return result
+    
+    def latest(self, limit: int = 10, cursor: Optional[int] = None) -> List[Dict]:
+        """Las `limit` más recientes con secuencia < cursor, de la más nueva a la más antigua"""
+        end = len(self) if cursor is None else min(cursor, len(self))
+        page = self.range(end - limit, end)
+        page.reverse()
+        return page
+    
+    def __len__(self) -> int:
+        return self.spilled + len(self._recent)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transacción fuera de rango")
+        return self.range(index, index + 1)[0]
+    
+    def __iter__(self) -> Iterator[Dict]:
+        for start in range(0, len(self), 1000):
+            yield from self.range(start, start + 1000)
+
+class WalletStore:
+    """
+    Wallets y transacciones en SQLite (modo WAL). Una fila por wallet con su
+    saldo y su número de transacciones; cada transacción es un JSON con
+    clave (wallet_id, seq), así que paginar el historial es leer un rango
+    de la clave primaria.
+    """
+    
+    _UPSERT = ("INSERT INTO wallets (wallet_id, owner_id, owner_type, balance, created_at, tx_count) "
+               "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(wallet_id) DO UPDATE SET "
+               "balance = excluded.balance, tx_count = excluded.tx_count")
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS wallets (
+                wallet_id TEXT PRIMARY KEY,
+                owner_id TEXT NOT NULL,
+                owner_type TEXT NOT NULL,
+                balance REAL NOT NULL,
+                created_at REAL NOT NULL,
+                tx_count INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS wallets_by_balance ON wallets (balance, wallet_id);
+            CREATE TABLE IF NOT EXISTS transactions (
+                wallet_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (wallet_id, seq)
+            ) WITHOUT ROWID;
+        """)
+    
+    def load(self, wallet_id: str) -> Optional[Tuple]:
+        return self.conn.execute(
+            "SELECT wallet_id, owner_id, owner_type, balance, created_at, tx_count "
+            "FROM wallets WHERE wallet_id = ?", (wallet_id,)).fetchone()
+    
+    def exists(self, wallet_id: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM wallets WHERE wallet_id = ?", (wallet_id,)).fetchone() is not None
+    
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM wallets").fetchone()[0]
+    
+    def records(self, page: int = 1000) -> Iterator[Tuple]:
+        """Todas las wallets, por páginas de `page` filas (memoria constante)"""
+        last = ""
+        while True:
+            rows = self.conn.execute(
+                "SELECT wallet_id, owner_id, owner_type, balance, created_at, tx_count "
+                "FROM wallets WHERE wallet_id > ? ORDER BY wallet_id LIMIT ?", (last, page)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+    
+    def top(self, k: int) -> List[Tuple[float, str]]:
+        return self.conn.execute(
+            "SELECT balance, wallet_id FROM wallets ORDER BY balance DESC, wallet_id DESC LIMIT ?",
+            (k,)).fetchall()
+    
+    def read_transactions(self, wallet_id: str, start: int, end: int) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT data FROM transactions WHERE wallet_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (wallet_id, start, end))
+        return [json.loads(data) for data, in rows]
+    
+    def save(self, wallets: List[Tuple], transactions: List[Tuple[str, int, str]]):
+        """Escribe filas de wallets y de transacciones en una sola transacción"""
+        with self.conn:
+            if wallets:
+                self.conn.executemany(self._UPSERT, wallets)
+            if transactions:
+                self.conn.executemany("INSERT OR REPLACE INTO transactions VALUES (?, ?, ?)", transactions)
+    
+    def close(self):
+        self.conn.close()
+
+class StoredTransactionHistory(TransactionHistory):
+    """
+    Historial respaldado por WalletStore: las transacciones ya guardadas se
+    leen de SQLite por rango de secuencia y las nuevas esperan en memoria
+    hasta que la caché escribe la wallet (o hasta superar `max_in_memory`).
+    """
+    
+    def __init__(self, store: WalletStore, wallet_id: str, stored: int = 0, max_in_memory: int = 10000):
+        self.store = store
+        self.wallet_id = wallet_id
+        self.spill_path = store.path
+        self.max_in_memory = max_in_memory
+        self.stored = stored
+        self._recent: List[Dict] = []
+    
+    @property
+    def spilled(self) -> int:
+        return self.stored
+    
+    @property
+    def pending(self) -> int:
+        return len(self._recent)
+    
+    def pending_rows(self, n: Optional[int] = None) -> List[Tuple[str, int, str]]:
+        return [(self.wallet_id, self.stored + i, json.dumps(tx, separators=(",", ":")))
+                for i, tx in enumerate(self._recent[:n])]
+    
+    def mark_stored(self, n: Optional[int] = None):
+        n = len(self._recent) if n is None else n
+        self.stored += n
+        del self._recent[:n]
+    
+    def _spill(self, n: int):
+        self.store.save([], self.pending_rows(n))
+        self.mark_stored(n)
+    
+    def _read_spilled(self, start: int, end: int) -> List[Dict]:
+        return self.store.read_transactions(self.wallet_id, start, end) if start < end else []
+
 
 class ForgeCoinWallet:
     """Cartera digital de Forge Coins"""
     
-    def __init__(self, owner_id: str, owner_type: str = "usuario"):
+    def __init__(self, owner_id: str, owner_type: str = "usuario",
+                 spill_dir: Optional[str] = None, max_in_memory: int = 10000,
+                 store: Optional[WalletStore] = None):
         self.owner_id = owner_id
         self.owner_type = owner_type
         self.wallet_id = self._generate_id()
         self.balance = 0.0
-        self.transactions = []
+        if store is not None:
+            self.transactions = StoredTransactionHistory(store, self.wallet_id, 0, max_in_memory)
+        else:
+            self.transactions = TransactionHistory(
+                os.path.join(spill_dir, f"{self.wallet_id}.jsonl") if spill_dir else None,
+                max_in_memory
+            )
         self.created_at = time.time()
+        # ForgeCoinSystem se suscribe para mantener sus agregados al día
+        self._listener: Optional[Callable[["ForgeCoinWallet", float, float], None]] = None
+        # Saldo ya escrito en WalletStore (None: la wallet aún no está en disco)
+        self._stored_balance: Optional[float] = None
+    
+    @classmethod
+    def _from_record(cls, record: Tuple, store: WalletStore, max_in_memory: int = 10000) -> "ForgeCoinWallet":
+        """Reconstruye una wallet a partir de su fila en WalletStore"""
+        wallet_id, owner_id, owner_type, balance, created_at, tx_count = record
+        wallet = cls.__new__(cls)
+        wallet.owner_id = owner_id
+        wallet.owner_type = owner_type
+        wallet.wallet_id = wallet_id
+        wallet.balance = balance
+        wallet.transactions = StoredTransactionHistory(store, wallet_id, tx_count, max_in_memory)
+        wallet.created_at = created_at
+        wallet._listener = None
+        wallet._stored_balance = balance
+        return wallet
         
     def _generate_id(self) -> str:
         unique = f"{self.owner_id}_{self.owner_type}_{time.time()}"
@@ -48,8 +334,11 @@ class ForgeCoinWallet:
             "new_balance": self.balance + amount
         }
         
+        old_balance = self.balance
         self.balance += amount
         self.transactions.append(tx)
+        if self._listener:
+            self._listener(self, old_balance, self.balance)
         
         return tx
     
@@ -69,8 +358,11 @@ class ForgeCoinWallet:
             "new_balance": self.balance - amount
         }
         
+        old_balance = self.balance
         self.balance -= amount
         self.transactions.append(tx)
+        if self._listener:
+            self._listener(self, old_balance, self.balance)
         
         return tx
     
@@ -78,7 +370,22 @@ class ForgeCoinWallet:
         return self.balance
     
     def get_transactions(self, limit: int = 10) -> List[Dict]:
-        return sorted(self.transactions, key=lambda x: x['timestamp'], reverse=True)[:limit]
+        # El historial ya está en orden temporal: las últimas N cuestan O(N)
+        return self.transactions.latest(limit)
+    
+    def get_transactions_page(self, limit: int = 10, cursor: Optional[int] = None) -> Dict:
+        """
+        Página del historial, de la más reciente a la más antigua. `cursor`
+        es el `next_cursor` de la página anterior; es estable aunque lleguen
+        transacciones nuevas.
+        """
+        end = len(self.transactions) if cursor is None else min(cursor, len(self.transactions))
+        start = max(0, end - limit)
+        return {
+            "transactions": self.transactions.latest(limit, end),
+            "total": len(self.transactions),
+            "next_cursor": start if start > 0 else None
+        }
     
     def to_dict(self) -> Dict:
         return {
@@ -90,12 +397,156 @@ class ForgeCoinWallet:
             "transaction_count": len(self.transactions)
         }
 
+class WalletCache:
+    """
+    Caché LRU con write-back delante de WalletStore, con la interfaz de dict
+    que ForgeCoinSystem usa sobre `self.wallets`. Las wallets calientes se
+    sirven de memoria; al salir de la caché se escriben en disco si
+    cambiaron. Mientras alguien conserve una referencia a una wallet, pedir
+    su id devuelve ese mismo objeto aunque haya salido de la caché.
+    """
+    
+    def __init__(self, store: WalletStore, capacity: int = 10000, max_tx_in_memory: int = 10000):
+        self.store = store
+        self.capacity = max(1, capacity)
+        self.max_tx_in_memory = max_tx_in_memory
+        # Se asigna a cada wallet cargada de disco (ForgeCoinSystem._on_balance_change)
+        self.listener: Optional[Callable[[ForgeCoinWallet, float, float], None]] = None
+        self._hot: "OrderedDict[str, ForgeCoinWallet]" = OrderedDict()
+        self._live: "weakref.WeakValueDictionary[str, ForgeCoinWallet]" = weakref.WeakValueDictionary()
+        self._count = store.count()
+    
+    def _admit(self, wallet: ForgeCoinWallet):
+        self._hot[wallet.wallet_id] = wallet
+        self._hot.move_to_end(wallet.wallet_id)
+        self._live[wallet.wallet_id] = wallet
+        while len(self._hot) > self.capacity:
+            _, evicted = self._hot.popitem(last=False)
+            self._write([evicted])
+    
+    def _write(self, wallets) -> int:
+        """Escribe en disco las wallets con cambios; devuelve cuántas"""
+        dirty = [w for w in wallets if w.balance != w._stored_balance or w.transactions.pending]
+        if not dirty:
+            return 0
+        self.store.save(
+            [(w.wallet_id, w.owner_id, w.owner_type, w.balance, w.created_at, len(w.transactions))
+             for w in dirty],
+            [row for w in dirty for row in w.transactions.pending_rows()]
+        )
+        for w in dirty:
+            w._stored_balance = w.balance
+            w.transactions.mark_stored()
+        return len(dirty)
+    
+    def _load(self, record: Tuple) -> ForgeCoinWallet:
+        wallet = self._live.get(record[0])
+        if wallet is None:
+            wallet = ForgeCoinWallet._from_record(record, self.store, self.max_tx_in_memory)
+            wallet._listener = self.listener
+            self._live[wallet.wallet_id] = wallet
+        return wallet
+    
+    def add(self, wallet: ForgeCoinWallet):
+        """Registra una wallet nueva; se escribe en disco al salir de la caché o en flush()"""
+        if wallet.wallet_id not in self:
+            self._count += 1
+        self._admit(wallet)
+    
+    def touch(self, wallet: ForgeCoinWallet):
+        """Marca una wallet como recién usada (y la vuelve a traer si había salido)"""
+        if wallet.wallet_id in self._hot:
+            self._hot.move_to_end(wallet.wallet_id)
+        else:
+            self._admit(wallet)
+    
+    def get(self, wallet_id: str, default=None) -> Optional[ForgeCoinWallet]:
+        wallet = self._hot.get(wallet_id)
+        if wallet is not None:
+            self._hot.move_to_end(wallet_id)
+            return wallet
+        wallet = self._live.get(wallet_id)
+        if wallet is None:
+            record = self.store.load(wallet_id)
+            if record is None:
+                return default
+            wallet = self._load(record)
+        self._admit(wallet)
+        return wallet
+    
+    def __getitem__(self, wallet_id: str) -> ForgeCoinWallet:
+        wallet = self.get(wallet_id)
+        if wallet is None:
+            raise KeyError(wallet_id)
+        return wallet
+    
+    def __setitem__(self, wallet_id: str, wallet: ForgeCoinWallet):
+        self.add(wallet)
+    
+    def __contains__(self, wallet_id: str) -> bool:
+        return wallet_id in self._hot or wallet_id in self._live or self.store.exists(wallet_id)
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __iter__(self) -> Iterator[str]:
+        return (wallet_id for wallet_id, _ in self.items())
+    
+    def items(self) -> Iterator[Tuple[str, ForgeCoinWallet]]:
+        """Recorre todas las wallets desde disco sin meterlas en la caché"""
+        self.flush()
+        for record in self.store.records():
+            yield record[0], self._hot.get(record[0]) or self._load(record)
+    
+    def values(self) -> Iterator[ForgeCoinWallet]:
+        return (wallet for _, wallet in self.items())
+    
+    def flush(self) -> int:
+        """Escribe todas las wallets calientes con cambios pendientes"""
+        return self._write(list(self._hot.values()))
+    
+    @property
+    def hot(self) -> int:
+        return len(self._hot)
+
 class ForgeCoinSystem:
     """Sistema global de Forge Coins"""
     
-    def __init__(self):
-        self.wallets: Dict[str, ForgeCoinWallet] = {}
-        self.exchange_rate_usd = 0.10
+    def __init__(self, spill_dir: Optional[str] = None, max_tx_in_memory: int = 10000,
+                 db_path: Optional[str] = None, cache_size: int = 10000, precios=None):
+        # Tasa FC -> USD de la tabla de precios regionales (recarga en caliente)
+        if precios is None and PRECIOS_AVAILABLE:
+            try:
+                precios = obtener_precios()
+            except (OSError, ValueError, KeyError):
+                precios = None
+        self.precios = precios
+        # Con spill_dir, el historial antiguo de cada wallet se vuelca a disco
+        self.spill_dir = spill_dir
+        self.max_tx_in_memory = max_tx_in_memory
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        
+        # Con db_path, wallets e historiales viven en SQLite y en memoria solo
+        # quedan las `cache_size` wallets más usadas
+        self.store = WalletStore(db_path) if db_path else None
+        if self.store is not None:
+            self.wallets = WalletCache(self.store, cache_size, max_tx_in_memory)
+            self.wallets.listener = self._on_balance_change
+        else:
+            self.wallets: Dict[str, ForgeCoinWallet] = {}
+        
+        # Agregados incrementales: se actualizan en cada cambio de saldo.
+        # Con WalletStore el ranking completo no cabe en memoria: los top
+        # holders salen del índice por saldo de SQLite
+        self._supply = _RunningSum()
+        self._supply_by_type: Dict[str, _RunningSum] = {}
+        self._count_by_type: Dict[str, int] = {}
+        self._ranking = SortedList() if SORTED_AVAILABLE and self.store is None else None
+        if self.store is not None:
+            self._load_aggregates()
+        # Suscriptores externos a altas y cambios de saldo (p. ej. la conciliación)
+        self._observers: List[Callable[[ForgeCoinWallet, float, float], None]] = []
         
         print("""
 ╔════════════════════════════════════════════════════════════╗
@@ -106,10 +557,46 @@ class ForgeCoinSystem:
     
     def create_wallet(self, owner_id: str, owner_type: str = "usuario") -> ForgeCoinWallet:
         """Crea una nueva wallet"""
-        wallet = ForgeCoinWallet(owner_id, owner_type)
+        wallet = ForgeCoinWallet(owner_id, owner_type, self.spill_dir, self.max_tx_in_memory, self.store)
         self.wallets[wallet.wallet_id] = wallet
+        self._track(wallet)
+        for observer in self._observers:
+            observer(wallet, wallet.balance, wallet.balance)
         return wallet
     
+    def add_balance_observer(self, observer: Callable[[ForgeCoinWallet, float, float], None]):
+        """Llama a observer(wallet, old, new) al crear una wallet y en cada cambio de saldo"""
+        self._observers.append(observer)
+    
+    def _load_aggregates(self):
+        """Reconstruye supply y conteos recorriendo las wallets guardadas"""
+        for _, _, owner_type, balance, _, _ in self.store.records():
+            self._count_by_type[owner_type] = self._count_by_type.get(owner_type, 0) + 1
+            self._supply.add(balance)
+            self._supply_by_type.setdefault(owner_type, _RunningSum()).add(balance)
+    
+    def _track(self, wallet: ForgeCoinWallet):
+        """Incorpora una wallet a los agregados y se suscribe a sus cambios de saldo"""
+        self._count_by_type[wallet.owner_type] = self._count_by_type.get(wallet.owner_type, 0) + 1
+        if wallet.owner_type not in self._supply_by_type:
+            self._supply_by_type[wallet.owner_type] = _RunningSum()
+        self._supply.add(wallet.balance)
+        self._supply_by_type[wallet.owner_type].add(wallet.balance)
+        if self._ranking is not None:
+            self._ranking.add((wallet.balance, wallet.wallet_id))
+        wallet._listener = self._on_balance_change
+    
+    def _on_balance_change(self, wallet: ForgeCoinWallet, old: float, new: float):
+        self._supply.add(new - old)
+        self._supply_by_type[wallet.owner_type].add(new - old)
+        if self._ranking is not None:
+            self._ranking.remove((old, wallet.wallet_id))
+            self._ranking.add((new, wallet.wallet_id))
+        if self.store is not None:
+            self.wallets.touch(wallet)
+        for observer in self._observers:
+            observer(wallet, old, new)
+    
     def get_wallet(self, wallet_id: str) -> Optional[ForgeCoinWallet]:
         return self.wallets.get(wallet_id)
     
@@ -124,6 +611,73 @@ class ForgeCoinSystem:
             return tx
         
         return None
+
+    def transfer_batch(self, transfers: List[Tuple[str, str, float, str]]) -> Dict:
+        """
+        Transferencias en bloque, todo o nada: [(from, to, amount, concept), ...].
+
+        Primero se valida todo (wallets existentes y distintas, montos
+        positivos) y se compensan los montos por wallet: el lote se acepta si ningún saldo
+        final queda negativo. Después se aplica sin posibilidad de fallo a
+        medias: un cambio de saldo por wallet, un timestamp y un id de lote
+        para todas las transacciones.
+
+        El lote es atómico, así que los saldos intermedios nunca existen:
+        cada transacción registra como `new_balance` el saldo final de su
+        wallet tras el lote y lleva `batch_id` para agrupar el historial
+        (débito y crédito tienen cada uno su propio `id`).
+        """
+        wallets = self.wallets
+        net: Dict[str, float] = {}
+        net_get = net.get
+        for k, (from_wallet, to_wallet, amount, _) in enumerate(transfers):
+            if from_wallet not in wallets or to_wallet not in wallets:
+                return {"ok": False, "error": "Wallet no encontrada", "index": k}
+            if from_wallet == to_wallet:
+                # Se compensaría a cero y cualquier monto pasaría la validación
+                return {"ok": False, "error": "Origen y destino iguales", "index": k}
+            if not amount > 0:
+                return {"ok": False, "error": "Monto inválido", "index": k}
+            net[from_wallet] = net_get(from_wallet, 0.0) - amount
+            net[to_wallet] = net_get(to_wallet, 0.0) + amount
+
+        insufficient = [w for w, delta in net.items() if wallets[w].balance + delta < 0]
+        if insufficient:
+            return {"ok": False, "error": "Saldo insuficiente", "wallets": insufficient}
+
+        batch_id = str(uuid.uuid4())
+        timestamp = time.time()
+        old_balances = {w: wallets[w].balance for w in net}
+        final = {w: old_balances[w] + delta for w, delta in net.items()}
+        histories: Dict[str, List[Dict]] = {w: [] for w in net}
+        total = 0.0
+        for k, (from_wallet, to_wallet, amount, concept) in enumerate(transfers):
+            histories[from_wallet].append({
+                "id": f"{batch_id}-{k}-d", "batch_id": batch_id, "tipo": "debito", "from": from_wallet, "to": to_wallet,
+                "amount": amount, "concept": concept, "timestamp": timestamp, "new_balance": final[from_wallet]
+            })
+            histories[to_wallet].append({
+                "id": f"{batch_id}-{k}-c", "batch_id": batch_id, "tipo": "credito", "from": from_wallet, "to": to_wallet,
+                "amount": amount, "concept": concept, "timestamp": timestamp, "new_balance": final[to_wallet]
+            })
+            total += amount
+
+        for wallet_id, old_balance in old_balances.items():
+            wallet = wallets[wallet_id]
+            wallet.transactions.extend(histories[wallet_id])
+            wallet.balance = final[wallet_id]
+            if wallet._listener:
+                wallet._listener(wallet, old_balance, wallet.balance)
+
+        return {"ok": True, "batch_id": batch_id, "count": len(transfers),
+                "total_amount": total, "wallets_affected": len(net)}
+
+    @property
+    def exchange_rate_usd(self) -> float:
+        """Tasa FC -> USD vigente: la de precios regionales o, sin ella, la de respaldo"""
+        if self.precios is not None:
+            return self.precios.tabla().tasa_fc_usd
+        return TASA_USD_POR_DEFECTO
     
     def convert_to_usd(self, fc_amount: float) -> float:
         """Convierte Forge Coins a USD"""
@@ -134,8 +688,93 @@ class ForgeCoinSystem:
         return usd_amount / self.exchange_rate_usd
     
     def get_total_supply(self) -> float:
-        """Obtiene el total de Forge Coins en circulación"""
-        return sum(w.balance for w in self.wallets.values())
+        """Obtiene el total de Forge Coins en circulación (O(1))"""
+        return self._supply.value
+    
+    def get_supply_by_owner_type(self, owner_type: Optional[str] = None):
+        """Supply por tipo de dueño, o el de un tipo concreto (O(1))"""
+        if owner_type is not None:
+            suma = self._supply_by_type.get(owner_type)
+            return suma.value if suma else 0.0
+        return {tipo: suma.value for tipo, suma in self._supply_by_type.items()}
+    
+    def get_wallet_counts(self) -> Dict:
+        """Número de wallets, total y por tipo de dueño (O(1) por tipo)"""
+        return {"total": len(self.wallets), "by_owner_type": dict(self._count_by_type)}
+    
+    def get_top_holders(self, k: int = 10) -> List[Dict]:
+        """Las k wallets con más saldo; O(log n + k) con sortedcontainers"""
+        if self._ranking is not None:
+            top = [(balance, wallet_id) for balance, wallet_id in reversed(self._ranking[-k:])] if k > 0 else []
+        elif self.store is not None:
+            self.wallets.flush()
+            top = self.store.top(k) if k > 0 else []
+        else:
+            top = heapq.nlargest(k, ((w.balance, w.wallet_id) for w in self.wallets.values()))
+        return [{"wallet_id": wallet_id, "owner_id": self.wallets[wallet_id].owner_id,
+                 "owner_type": self.wallets[wallet_id].owner_type, "balance": balance}
+                for balance, wallet_id in top]
+    
+    def get_aggregates(self, top_k: int = 10) -> Dict:
+        """Totales para el dashboard sin recorrer las wallets"""
+        return {
+            "total_supply": self.get_total_supply(),
+            "total_supply_usd": self.convert_to_usd(self.get_total_supply()),
+            "supply_by_owner_type": self.get_supply_by_owner_type(),
+            "wallet_counts": self.get_wallet_counts(),
+            "top_holders": self.get_top_holders(top_k)
+        }
+    
+    def check_consistency(self, repair: bool = False, tolerance: float = 1e-6) -> Dict:
+        """
+        Recalcula todos los agregados desde cero y los compara con los
+        incrementales. Con `repair`, reconstruye los incrementales (p. ej.
+        tras añadir wallets a `self.wallets` sin pasar por create_wallet).
+        """
+        supply = math.fsum(w.balance for w in self.wallets.values())
+        by_type: Dict[str, List[float]] = {}
+        for w in self.wallets.values():
+            by_type.setdefault(w.owner_type, []).append(w.balance)
+        
+        discrepancies = []
+        if not math.isclose(supply, self._supply.value, rel_tol=tolerance, abs_tol=tolerance):
+            discrepancies.append({"aggregate": "total_supply", "expected": supply,
+                                  "incremental": self._supply.value})
+        for owner_type in set(by_type) | set(self._supply_by_type):
+            expected = math.fsum(by_type.get(owner_type, []))
+            incremental = self.get_supply_by_owner_type(owner_type)
+            if not math.isclose(expected, incremental, rel_tol=tolerance, abs_tol=tolerance):
+                discrepancies.append({"aggregate": f"supply_by_owner_type.{owner_type}",
+                                      "expected": expected, "incremental": incremental})
+            if len(by_type.get(owner_type, [])) != self._count_by_type.get(owner_type, 0):
+                discrepancies.append({"aggregate": f"wallet_counts.{owner_type}",
+                                      "expected": len(by_type.get(owner_type, [])),
+                                      "incremental": self._count_by_type.get(owner_type, 0)})
+        if self._ranking is not None:
+            expected_ranking = sorted((w.balance, w.wallet_id) for w in self.wallets.values())
+            if list(self._ranking) != expected_ranking:
+                discrepancies.append({"aggregate": "top_holders", "expected": len(expected_ranking),
+                                      "incremental": len(self._ranking)})
+        
+        if repair and discrepancies:
+            self._supply = _RunningSum()
+            self._supply_by_type = {}
+            self._count_by_type = {}
+            self._ranking = SortedList() if SORTED_AVAILABLE and self.store is None else None
+            for w in self.wallets.values():
+                self._track(w)
+        
+        return {"consistent": not discrepancies, "repaired": repair and bool(discrepancies),
+                "wallets": len(self.wallets), "discrepancies": discrepancies}
+    
+    def flush(self) -> int:
+        """Con WalletStore, escribe en disco las wallets de la caché con cambios"""
+        return self.wallets.flush() if self.store is not None else 0
+    
+    def close(self):
+        if self.store is not None:
+            self.wallets.flush()
+            self.store.close()
 
 # Ejemplo
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Pruebas del sistema Forge Coin
+Ejecuta: python -m pytest test_forge_coin.py
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from economia_inteligente.moneda_interna.forge_coin import ForgeCoinSystem
+from economia_inteligente.precios_regionales import PreciosRegionales, obtener_precios
+
+
+def _sistema_con_saldos(*saldos):
+    sistema = ForgeCoinSystem()
+    wallets = []
+    for k, saldo in enumerate(saldos):
+        wallet = sistema.create_wallet(f"u{k}")
+        if saldo:
+            wallet.add_funds(saldo, "fondeo")
+        wallets.append(wallet)
+    return sistema, wallets
+
+
+def test_transfer_batch_rechaza_autotransferencia():
+    """Origen = destino se compensaría a cero: no debe pasar la validación de saldo"""
+    sistema, (a,) = _sistema_con_saldos(10.0)
+    resultado = sistema.transfer_batch([(a.wallet_id, a.wallet_id, 1e9, "auto")])
+    assert resultado == {"ok": False, "error": "Origen y destino iguales", "index": 0}
+    assert a.balance == 10.0
+    assert len(a.transactions) == 1
+
+
+def test_transfer_batch_insuficiente_no_cambia_nada():
+    """Si una wallet no alcanza, el lote completo se rechaza sin tocar saldos ni historiales"""
+    sistema, (a, b, c) = _sistema_con_saldos(100.0, 5.0, 0.0)
+    antes = {w.wallet_id: (w.balance, len(w.transactions)) for w in (a, b, c)}
+    supply = sistema.get_total_supply()
+
+    resultado = sistema.transfer_batch([
+        (a.wallet_id, c.wallet_id, 50.0, "ok"),
+        (b.wallet_id, c.wallet_id, 20.0, "insuficiente"),
+    ])
+
+    assert resultado["ok"] is False
+    assert resultado["wallets"] == [b.wallet_id]
+    assert {w.wallet_id: (w.balance, len(w.transactions)) for w in (a, b, c)} == antes
+    assert sistema.get_total_supply() == supply
+
+
+def test_transfer_batch_ids_unicos_por_asiento():
+    sistema, (a, b) = _sistema_con_saldos(100.0, 0.0)
+    resultado = sistema.transfer_batch([
+        (a.wallet_id, b.wallet_id, 10.0, "uno"),
+        (a.wallet_id, b.wallet_id, 20.0, "dos"),
+    ])
+
+    assert resultado["ok"] is True
+    asientos = list(a.transactions)[1:] + list(b.transactions)
+    assert len({t["id"] for t in asientos}) == 4
+    assert {t["batch_id"] for t in asientos} == {resultado["batch_id"]}
+    assert (a.balance, b.balance) == (70.0, 30.0)
+
+
+def _precios_con_tasa(ruta, tasa):
+    with open(ruta, "w") as f:
+        json.dump({"factores": {"US": 1.0}, "precio_base_global_usd": 10.0,
+                   "forge_coin_exchange_rate_usd": tasa}, f)
+    return PreciosRegionales(str(ruta), intervalo_revision=0.0)
+
+
+def test_conversion_usa_precios_regionales():
+    sistema = ForgeCoinSystem()
+    assert sistema.precios is obtener_precios()
+    tasa = obtener_precios().tabla().tasa_fc_usd
+    assert sistema.convert_to_usd(50.0) == 50.0 * tasa
+    assert sistema.convert_from_usd(5.0) == 5.0 / tasa
+
+
+def test_conversion_sigue_la_recarga_de_la_tabla(tmp_path):
+    ruta = tmp_path / "costos_regiones.json"
+    sistema = ForgeCoinSystem(precios=_precios_con_tasa(ruta, 0.25))
+    assert sistema.convert_to_usd(8.0) == 2.0
+    assert sistema.convert_from_usd(2.0) == 8.0
+
+    _precios_con_tasa(ruta, 0.5)
+    sistema.precios.recargar()
+    assert sistema.exchange_rate_usd == 0.5
+    assert sistema.convert_to_usd(8.0) == 4.0
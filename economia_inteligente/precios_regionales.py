@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+================================================================================
+                         🚀 NEURAFORGEAI® 🚀
+              Desarrollado con orgullo por el equipo
+================================================================================
+
+PRECIOS REGIONALES - Precio justo según el país
+"El mismo producto, al alcance de cada región"
+
+Carga `config/costos_regiones.json` una sola vez en una tabla inmutable con
+los precios ya calculados, ofrece conversiones vectorizadas para arrays de
+(país, monto) y recarga la tabla cuando cambia el mtime del archivo.
+
+Desarrollado por: Miguel Chávez & AMI (IA Colaborativa)
+Filosofía: "No importa qué vendes, importa cómo lo haces mejor"
+================================================================================
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from types import MappingProxyType
+from typing import Dict, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger("PreciosRegionales")
+
+RUTA_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "config", "costos_regiones.json")
+
+# Países sin factor propio pagan el precio base
+FACTOR_POR_DEFECTO = 1.0
+
+# ==================== TABLA INMUTABLE ====================
+
+class TablaPrecios:
+    """
+    Instantánea inmutable de costos_regiones.json.
+
+    Al construirla se precalculan el precio base en USD y en FC de cada
+    país, así que consultar un precio es un acceso a diccionario. Para
+    conversiones en bloque, los códigos de país se guardan ordenados junto a
+    sus factores y se buscan con `searchsorted`. Los códigos se normalizan a
+    mayúsculas al cargar y al consultar.
+    """
+
+    __slots__ = ("factores", "precio_base_usd", "tasa_fc_usd", "actualizado", "version",
+                 "_precios_usd", "_precios_fc", "_paises", "_factores")
+
+    def __init__(self, datos: Dict, version: Tuple[int, int] = (0, 0)):
+        factores = {str(pais).upper(): float(factor) for pais, factor in datos["factores"].items()}
+        tasa = float(datos["forge_coin_exchange_rate_usd"])
+        if tasa <= 0:
+            raise ValueError(f"Tasa ForgeCoin inválida: {tasa}")
+        base = float(datos["precio_base_global_usd"])
+        setattr_ = object.__setattr__
+        setattr_(self, "factores", MappingProxyType(factores))
+        setattr_(self, "precio_base_usd", base)
+        setattr_(self, "tasa_fc_usd", tasa)
+        setattr_(self, "actualizado", datos.get("actualizado"))
+        # (mtime_ns, tamaño) del archivo del que sale la tabla
+        setattr_(self, "version", version)
+        setattr_(self, "_precios_usd", MappingProxyType({p: base * f for p, f in factores.items()}))
+        setattr_(self, "_precios_fc", MappingProxyType({p: base * f / tasa for p, f in factores.items()}))
+        paises = sorted(factores)
+        if NUMPY_AVAILABLE:
+            # Ancho del dtype según el código más largo: nada se trunca
+            codigos = np.array(paises, dtype=f"U{max(map(len, paises), default=1)}")
+            valores = np.array([factores[p] for p in paises], dtype=np.float64)
+            codigos.setflags(write=False)
+            valores.setflags(write=False)
+            setattr_(self, "_paises", codigos)
+            setattr_(self, "_factores", valores)
+        else:
+            setattr_(self, "_paises", tuple(paises))
+            setattr_(self, "_factores", tuple(factores[p] for p in paises))
+
+    def __setattr__(self, nombre, valor):
+        raise AttributeError("TablaPrecios es inmutable")
+
+    @classmethod
+    def desde_archivo(cls, ruta: str) -> "TablaPrecios":
+        estado = os.stat(ruta)
+        with open(ruta, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        return cls(datos, (estado.st_mtime_ns, estado.st_size))
+
+    # ---------- consultas escalares (ruta de checkout) ----------
+
+    def factor(self, pais: str) -> float:
+        return self.factores.get(pais.upper(), FACTOR_POR_DEFECTO)
+
+    def precio_usd(self, pais: str, monto_usd: Optional[float] = None) -> float:
+        """Precio regional en USD del producto base, o de `monto_usd` si se da"""
+        pais = pais.upper()
+        if monto_usd is None:
+            precio = self._precios_usd.get(pais)
+            return precio if precio is not None else self.precio_base_usd * FACTOR_POR_DEFECTO
+        return monto_usd * self.factores.get(pais, FACTOR_POR_DEFECTO)
+
+    def precio_fc(self, pais: str, monto_usd: Optional[float] = None) -> float:
+        """Precio regional en ForgeCoins del producto base, o de `monto_usd` si se da"""
+        pais = pais.upper()
+        if monto_usd is None:
+            precio = self._precios_fc.get(pais)
+            return precio if precio is not None else self.precio_base_usd * FACTOR_POR_DEFECTO / self.tasa_fc_usd
+        return monto_usd * self.factores.get(pais, FACTOR_POR_DEFECTO) / self.tasa_fc_usd
+
+    # ---------- conversiones vectorizadas ----------
+
+    def factores_de(self, paises: Sequence[str]):
+        """Factor de cada país de la secuencia (array de NumPy si está disponible)"""
+        if not NUMPY_AVAILABLE:
+            return [self.factores.get(p.upper(), FACTOR_POR_DEFECTO) for p in paises]
+        paises = np.char.upper(np.asarray(paises, dtype=str))
+        if len(self._paises) == 0:
+            return np.full(paises.shape, FACTOR_POR_DEFECTO)
+        posiciones = np.searchsorted(self._paises, paises)
+        posiciones[posiciones == len(self._paises)] = 0
+        conocidos = self._paises[posiciones] == paises
+        return np.where(conocidos, self._factores[posiciones], FACTOR_POR_DEFECTO)
+
+    def ajustar_usd(self, paises: Sequence[str], montos_usd: Sequence[float]):
+        """Montos USD base -> USD regionales, elemento a elemento"""
+        if not NUMPY_AVAILABLE:
+            return [m * f for m, f in zip(montos_usd, self.factores_de(paises))]
+        return np.asarray(montos_usd, dtype=np.float64) * self.factores_de(paises)
+
+    def a_fc(self, paises: Sequence[str], montos_usd: Sequence[float]):
+        """Montos USD base -> ForgeCoins al precio regional, elemento a elemento"""
+        if not NUMPY_AVAILABLE:
+            return [m / self.tasa_fc_usd for m in self.ajustar_usd(paises, montos_usd)]
+        return self.ajustar_usd(paises, montos_usd) / self.tasa_fc_usd
+
+    def usd_a_fc(self, montos_usd: Sequence[float]):
+        if not NUMPY_AVAILABLE:
+            return [m / self.tasa_fc_usd for m in montos_usd]
+        return np.asarray(montos_usd, dtype=np.float64) / self.tasa_fc_usd
+
+    def fc_a_usd(self, montos_fc: Sequence[float]):
+        if not NUMPY_AVAILABLE:
+            return [m * self.tasa_fc_usd for m in montos_fc]
+        return np.asarray(montos_fc, dtype=np.float64) * self.tasa_fc_usd
+
+# ==================== RECARGA EN CALIENTE ====================
+
+class PreciosRegionales:
+    """
+    Punto de acceso a la tabla vigente, con recarga en caliente.
+
+    Los lectores nunca esperan: `tabla()` devuelve la instantánea actual y,
+    como mucho una vez cada `intervalo_revision` segundos, mira el mtime del
+    archivo. Si cambió, un único hilo construye la tabla nueva y la publica
+    cambiando la referencia; el resto sigue con la anterior mientras tanto.
+    Un archivo inválido (p. ej. a medio escribir) deja la tabla anterior.
+    """
+
+    def __init__(self, ruta: Optional[str] = None, intervalo_revision: float = 1.0):
+        self.ruta = os.path.abspath(ruta or RUTA_POR_DEFECTO)
+        self.intervalo_revision = intervalo_revision
+        self._tabla = TablaPrecios.desde_archivo(self.ruta)
+        self._proxima_revision = time.monotonic() + intervalo_revision
+        self._recargando = threading.Lock()
+        self.recargas = 0
+
+    def tabla(self) -> TablaPrecios:
+        if time.monotonic() >= self._proxima_revision:
+            self._revisar()
+        return self._tabla
+
+    def _revisar(self):
+        if not self._recargando.acquire(blocking=False):
+            return
+        try:
+            self._proxima_revision = time.monotonic() + self.intervalo_revision
+            estado = os.stat(self.ruta)
+            if (estado.st_mtime_ns, estado.st_size) != self._tabla.version:
+                self._tabla = TablaPrecios.desde_archivo(self.ruta)
+                self.recargas += 1
+                logger.info(f"💱 Precios regionales recargados ({self._tabla.actualizado})")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"⚠️ No se pudo recargar {self.ruta}: {e}")
+        finally:
+            self._recargando.release()
+
+    def recargar(self) -> bool:
+        """Fuerza la revisión del archivo ahora; True si la tabla cambió"""
+        anterior = self._tabla
+        self._proxima_revision = 0.0
+        self._revisar()
+        return self._tabla is not anterior
+
+    # Atajos sobre la tabla vigente
+
+    def precio_usd(self, pais: str, monto_usd: Optional[float] = None) -> float:
+        return self.tabla().precio_usd(pais, monto_usd)
+
+    def precio_fc(self, pais: str, monto_usd: Optional[float] = None) -> float:
+        return self.tabla().precio_fc(pais, monto_usd)
+
+    def ajustar_usd(self, paises: Sequence[str], montos_usd: Sequence[float]):
+        return self.tabla().ajustar_usd(paises, montos_usd)
+
+    def a_fc(self, paises: Sequence[str], montos_usd: Sequence[float]):
+        return self.tabla().a_fc(paises, montos_usd)
+
+    def usd_a_fc(self, montos_usd: Sequence[float]):
+        return self.tabla().usd_a_fc(montos_usd)
+
+    def fc_a_usd(self, montos_fc: Sequence[float]):
+        return self.tabla().fc_a_usd(montos_fc)
+
+_instancias: Dict[str, PreciosRegionales] = {}
+_lock_instancias = threading.Lock()
+
+def obtener_precios(ruta: Optional[str] = None) -> PreciosRegionales:
+    """Instancia compartida por archivo: cada archivo se carga una sola vez por proceso"""
+    ruta = os.path.abspath(ruta or RUTA_POR_DEFECTO)
+    precios = _instancias.get(ruta)
+    if precios is None:
+        with _lock_instancias:
+            precios = _instancias.get(ruta)
+            if precios is None:
+                precios = _instancias[ruta] = PreciosRegionales(ruta)
+    return precios
+
+# Ejemplo
+if __name__ == "__main__":
+    precios = obtener_precios()
+    for pais in ("US", "MX", "IN", "JP", "XX"):
+        print(f"{pais}: ${precios.precio_usd(pais):.2f} = {precios.precio_fc(pais):.1f} FC")
+    print(precios.a_fc(["MX", "BR", "US"], [10.0, 10.0, 10.0]))
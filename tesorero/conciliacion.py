@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+================================================================================
+                         🚀 NEURAFORGEAI® 🚀
+              Desarrollado con orgullo por el equipo
+================================================================================
+
+CONCILIACIÓN FORGECOIN - Tesorería Orion vs ForgeCoinSystem
+"Cada ForgeCoin cuadra en los dos libros"
+
+Compara los saldos de `ForgeCoinSystem` con los de `OrionTreasury.wallets`
+y explica cada descuadre con los últimos movimientos de ambos lados.
+
+Desarrollado por: Miguel Chávez & AMI (IA Colaborativa)
+Filosofía: "No importa qué vendes, importa cómo lo haces mejor"
+================================================================================
+"""
+
+import os
+import sys
+import time
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+def _indexar(indice: Dict, clave: Tuple, wallet_id: str):
+    """Añade wallet_id a las wallets de `clave`; casi todos los dueños tienen una sola"""
+    actual = indice.get(clave)
+    if actual is None:
+        indice[clave] = wallet_id
+    elif isinstance(actual, str):
+        if actual != wallet_id:
+            indice[clave] = [actual, wallet_id]
+    elif wallet_id not in actual:
+        actual.append(wallet_id)
+
+
+def _wallets_de(indice: Dict, claves: Iterable[Tuple]) -> set:
+    ids = set()
+    for clave in claves:
+        actual = indice.get(clave)
+        if isinstance(actual, str):
+            ids.add(actual)
+        elif actual:
+            ids.update(actual)
+    return ids
+
+
+class ConciliadorForgeCoin:
+    """
+    Concilia los saldos de un ForgeCoinSystem con los de `OrionTreasury.wallets`.
+    Ambos sistemas se reciben ya construidos; este módulo no los importa.
+
+    Los wallet_id de la tesorería y los de ForgeCoin son espacios distintos
+    (cada sistema genera los suyos), así que el cruce se hace por `clave`:
+
+    - "owner" (por defecto): el dueño `(owner_type, owner_id)`, sumando todas
+      sus wallets en cada lado.
+    - "wallet_id": el mismo id en ambos lados; solo tiene sentido si las
+      wallets se dan de alta con ids espejo.
+
+    Cada pasada carga los dos lados en arrays alineados por clave y compara
+    en bloque con NumPy. Tras una pasada completa, las siguientes parten de la
+    marca de agua: solo revisan las claves con bloques posteriores a la
+    posición ya conciliada, las que ForgeCoinSystem notificó como creadas o
+    cambiadas y las discrepancias que seguían abiertas. Cada discrepancia
+    lleva los últimos bloques y transacciones de sus wallets, marcando los
+    que coinciden con la diferencia.
+    """
+
+    def __init__(self, tesoreria, forge, clave: str = "owner",
+                 tolerancia: float = 1e-6, max_detalle: int = 100, movimientos: int = 10):
+        if clave not in ("owner", "wallet_id"):
+            raise ValueError(f"Clave de conciliación desconocida: {clave}")
+        self.tesoreria = tesoreria
+        self.forge = forge
+        self.clave = clave
+        self.tolerancia = tolerancia
+        self.max_detalle = max_detalle
+        self.movimientos = movimientos
+        self.marca_agua: Optional[Dict] = None
+        self.abiertas: Dict = {}
+        self._cambiadas: set = set()
+        self._n_wallets_tesoreria = 0
+        # Con clave "owner": dueño -> wallet_id (o lista) en cada lado
+        self._dueno_t: Dict[Tuple, object] = {}
+        self._dueno_f: Dict[Tuple, object] = {}
+        # Sin avisos de ForgeCoinSystem todas las pasadas son completas
+        self.incremental = hasattr(forge, "add_balance_observer")
+        if self.incremental:
+            forge.add_balance_observer(self._anotar)
+
+    def _anotar(self, wallet, anterior: float, nuevo: float):
+        self._cambiadas.add(wallet.wallet_id)
+        if self.clave == "owner":
+            _indexar(self._dueno_f, (wallet.owner_type, wallet.owner_id), wallet.wallet_id)
+
+    def _claves(self, ids: List[str], wallets: List, de_tesoreria: bool) -> List:
+        if self.clave == "wallet_id":
+            return ids
+        if de_tesoreria:
+            return [(w["owner_type"], w["owner_id"]) for w in wallets]
+        return [(w.owner_type, w.owner_id) for w in wallets]
+
+    def _tocadas(self, desde: int, hasta: int) -> set:
+        """wallet_ids que aparecen en los bloques de las posiciones [desde, hasta)"""
+        transacciones = self.tesoreria.transacciones
+        # AlmacenColumnar (cadena en memoria): columnas de códigos de wallet
+        if NUMPY_AVAILABLE and hasattr(transacciones, "origenes"):
+            with transacciones._lock:
+                codigos = np.union1d(np.frombuffer(transacciones.origenes, dtype=np.uint32)[desde:hasta],
+                                     np.frombuffer(transacciones.destinos, dtype=np.uint32)[desde:hasta])
+            return {transacciones.wallets[c] for c in codigos.tolist()}
+        tocadas = set()
+        for bloque in transacciones.iterar(desde, hasta):
+            tocadas.add(bloque.from_wallet)
+            tocadas.add(bloque.to_wallet)
+        return tocadas
+
+    def _cargar_tesoreria(self, cambiadas: Optional[set]) -> Tuple[List[str], List[Dict], int]:
+        """
+        Wallets de la tesorería y posición conciliada, leídas juntas bajo el
+        lock de la cadena. Con `cambiadas` (claves candidatas), solo las
+        wallets de la pasada incremental; el conjunto se amplía con las
+        claves que cambiaron en la tesorería.
+        """
+        tesoreria = self.tesoreria
+        por_dueno = self.clave == "owner"
+        with tesoreria._lock_cadena:
+            posicion = tesoreria.indice_actual
+            if cambiadas is None and por_dueno:
+                self._dueno_t = {}
+                self._n_wallets_tesoreria = 0
+            nuevas = list(islice(tesoreria.wallets, self._n_wallets_tesoreria, None))
+            self._n_wallets_tesoreria = len(tesoreria.wallets)
+            if por_dueno:
+                for wallet_id in nuevas:
+                    w = tesoreria.wallets[wallet_id]
+                    _indexar(self._dueno_t, (w["owner_type"], w["owner_id"]), wallet_id)
+            if cambiadas is None:
+                wallets = list(tesoreria.wallets.values())
+            else:
+                tocadas = self._tocadas(self.marca_agua["posicion"], posicion)
+                tocadas.update(nuevas)
+                if por_dueno:
+                    cambiadas.update((w["owner_type"], w["owner_id"])
+                                     for w in map(tesoreria.wallets.get, tocadas) if w is not None)
+                    ids = _wallets_de(self._dueno_t, cambiadas)
+                else:
+                    cambiadas |= tocadas
+                    ids = cambiadas
+                wallets = [w for w in map(tesoreria.wallets.get, ids) if w is not None]
+            # Copia de los saldos: la cadena puede seguir avanzando al soltar el lock
+            wallets = [{"wallet_id": w["wallet_id"], "owner_id": w["owner_id"],
+                        "owner_type": w["owner_type"], "balance_fc": w["balance_fc"]} for w in wallets]
+        return [w["wallet_id"] for w in wallets], wallets, posicion
+
+    def _cargar_forge(self, cambiadas: Optional[set]) -> Tuple[List[str], List]:
+        wallets = self.forge.wallets
+        if cambiadas is None:
+            lista = list(wallets.values())
+            if self.clave == "owner":
+                self._dueno_f = {}
+                for w in lista:
+                    _indexar(self._dueno_f, (w.owner_type, w.owner_id), w.wallet_id)
+        else:
+            ids = _wallets_de(self._dueno_f, cambiadas) if self.clave == "owner" else cambiadas
+            lista = [w for w in map(wallets.get, ids) if w is not None]
+        return [w.wallet_id for w in lista], lista
+
+    def _candidatas(self, cambiadas_f: set) -> set:
+        """Claves a revisar por los cambios notificados por ForgeCoin y las discrepancias abiertas"""
+        if self.clave == "wallet_id":
+            return cambiadas_f | set(self.abiertas)
+        claves = set(self.abiertas)
+        for wallet in map(self.forge.wallets.get, cambiadas_f):
+            if wallet is not None:
+                claves.add((wallet.owner_type, wallet.owner_id))
+        return claves
+
+    def _comparar(self, claves_f: List, saldos_f: List[float], claves_t: List,
+                  saldos_t: List[float]) -> List[Tuple]:
+        """
+        (clave, saldo_forgecoin, saldo_tesoreria) de las claves que no cuadran;
+        el saldo es None si la clave no existe en ese lado. Una clave presente
+        en un solo lado con saldo nulo no descuadra.
+        """
+        codigos: Dict = {}
+        cf = [codigos.setdefault(c, len(codigos)) for c in claves_f]
+        ct = [codigos.setdefault(c, len(codigos)) for c in claves_t]
+        claves = list(codigos)
+        n = len(claves)
+        tol = self.tolerancia
+        if NUMPY_AVAILABLE:
+            cf = np.asarray(cf, dtype=np.int64)
+            ct = np.asarray(ct, dtype=np.int64)
+            suma_f = np.bincount(cf, weights=np.asarray(saldos_f, dtype=np.float64), minlength=n)
+            suma_t = np.bincount(ct, weights=np.asarray(saldos_t, dtype=np.float64), minlength=n)
+            en_f = np.bincount(cf, minlength=n) > 0
+            en_t = np.bincount(ct, minlength=n) > 0
+            malas = np.flatnonzero(~np.isclose(suma_f, suma_t, rtol=tol, atol=tol))
+            return [(claves[k], float(suma_f[k]) if en_f[k] else None, float(suma_t[k]) if en_t[k] else None)
+                    for k in malas.tolist()]
+        suma_f: Dict[int, float] = {}
+        suma_t: Dict[int, float] = {}
+        for codigo, saldo in zip(cf, saldos_f):
+            suma_f[codigo] = suma_f.get(codigo, 0.0) + saldo
+        for codigo, saldo in zip(ct, saldos_t):
+            suma_t[codigo] = suma_t.get(codigo, 0.0) + saldo
+        resultado = []
+        for k in range(n):
+            a, b = suma_f.get(k, 0.0), suma_t.get(k, 0.0)
+            if abs(a - b) > tol + tol * abs(b):
+                resultado.append((claves[k], suma_f.get(k), suma_t.get(k)))
+        return resultado
+
+    def _explicar(self, ids_f: List[str], ids_t: List[str], diferencia: float, desde: int) -> Dict:
+        """Últimos movimientos de las wallets implicadas, marcando los que igualan la diferencia"""
+        objetivo = abs(diferencia)
+        tol = self.tolerancia + self.tolerancia * objetivo
+        bloques = []
+        for wallet_id in ids_t[:10]:
+            for m in self.tesoreria.historial_wallet(wallet_id, limit=self.movimientos)["movimientos"]:
+                bloques.append({"wallet_id": wallet_id, "bloque": m["bloque"], "timestamp": m["timestamp"],
+                                "tipo": m["tipo"], "direccion": m["direccion"], "monto_fc": m["monto_fc"],
+                                "tras_marca": m["bloque"] > desde,
+                                "coincide": abs(m["monto_fc"] - objetivo) <= tol})
+        transacciones = []
+        for wallet_id in ids_f[:10]:
+            wallet = self.forge.wallets.get(wallet_id)
+            if wallet is None:
+                continue
+            for tx in wallet.get_transactions(self.movimientos):
+                transacciones.append({"wallet_id": wallet_id, "id": tx["id"], "timestamp": tx["timestamp"],
+                                      "tipo": tx["tipo"], "amount": tx["amount"],
+                                      "coincide": abs(tx["amount"] - objetivo) <= tol})
+        return {"bloques": bloques, "transacciones": transacciones}
+
+    def conciliar(self, completa: bool = False) -> Dict:
+        """
+        Una pasada de conciliación: completa la primera vez (o si se pide),
+        incremental desde la marca de agua en las siguientes. Devuelve las
+        discrepancias abiertas tras la pasada y la nueva marca de agua.
+        """
+        inicio = time.perf_counter()
+        # Los cambios que lleguen durante la pasada quedan para la siguiente
+        cambiadas, self._cambiadas = self._cambiadas, set()
+        incremental = self.incremental and self.marca_agua is not None and not completa
+        desde = self.marca_agua["posicion"] if self.marca_agua else 0
+        cambiadas = self._candidatas(cambiadas) if incremental else None
+
+        ids_t, wallets_t, posicion = self._cargar_tesoreria(cambiadas)
+        ids_f, wallets_f = self._cargar_forge(cambiadas)
+        claves_f = self._claves(ids_f, wallets_f, False)
+        claves_t = self._claves(ids_t, wallets_t, True)
+        malas = self._comparar(claves_f, [w.balance for w in wallets_f],
+                               claves_t, [w["balance_fc"] for w in wallets_t])
+
+        previas = self.abiertas
+        if incremental:
+            self.abiertas = {c: d for c, d in previas.items() if c not in cambiadas}
+        else:
+            self.abiertas = {}
+
+        # Wallets de cada clave descuadrada (con clave wallet_id, la propia wallet)
+        if self.clave == "wallet_id":
+            por_clave = {c: ([c], [c]) for c, _, _ in malas}
+        else:
+            por_clave = {c: ([], []) for c, _, _ in malas}
+            for clave, wallet_id in zip(claves_f, ids_f):
+                if clave in por_clave:
+                    por_clave[clave][0].append(wallet_id)
+            for clave, wallet_id in zip(claves_t, ids_t):
+                if clave in por_clave:
+                    por_clave[clave][1].append(wallet_id)
+
+        detalladas = 0
+        for clave, saldo_f, saldo_t in malas:
+            diferencia = (saldo_f or 0.0) - (saldo_t or 0.0)
+            anterior = previas.get(clave)
+            if anterior is not None and abs(anterior["diferencia"] - diferencia) <= self.tolerancia:
+                self.abiertas[clave] = anterior
+                continue
+            discrepancia = {
+                "clave": clave,
+                "tipo": ("solo_tesoreria" if saldo_f is None else
+                         "solo_forgecoin" if saldo_t is None else "saldo_distinto"),
+                "saldo_forgecoin": saldo_f,
+                "saldo_tesoreria": saldo_t,
+                "diferencia": diferencia,
+                "detectada": time.time()
+            }
+            if detalladas < self.max_detalle:
+                ids_clave_f, ids_clave_t = por_clave[clave]
+                discrepancia["explicacion"] = self._explicar(ids_clave_f, ids_clave_t, diferencia, desde)
+                detalladas += 1
+            self.abiertas[clave] = discrepancia
+
+        self.marca_agua = {"posicion": posicion, "timestamp": time.time()}
+        return {
+            "completa": not incremental,
+            "revisadas": len(set(claves_f).union(claves_t)),
+            "total_discrepancias": len(self.abiertas),
+            "nuevas": sum(1 for c in self.abiertas if c not in previas),
+            "resueltas": sum(1 for c in previas if c not in self.abiertas),
+            "discrepancias": list(islice(self.abiertas.values(), self.max_detalle)),
+            "marca_agua": dict(self.marca_agua),
+            "segundos": round(time.perf_counter() - inicio, 3)
+        }
+
+
+# Ejemplo
+if __name__ == "__main__":
+    # Como script, la carpeta tesorero ya está en sys.path; ForgeCoin es un
+    # paquete de la raíz del repositorio
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from orion_treasury import OrionTreasury
+    from economia_inteligente.moneda_interna.forge_coin import ForgeCoinSystem
+
+    tesoreria = OrionTreasury()
+    forge = ForgeCoinSystem()
+    conciliador = ConciliadorForgeCoin(tesoreria, forge)
+
+    for dueno in ("miguel", "comunidad"):
+        destino = tesoreria.crear_wallet(dueno, "usuario")
+        tesoreria.emitir_forgecoins(100, 10, destino, "alta")
+        forge.create_wallet(dueno, "usuario").add_funds(100, "alta")
+    print(conciliador.conciliar()["total_discrepancias"])
+
+    tesoreria.emitir_forgecoins(25, 2.5, destino, "bono sin reflejar")
+    resultado = conciliador.conciliar()
+    for d in resultado["discrepancias"]:
+        print(d["clave"], d["tipo"], d["diferencia"])
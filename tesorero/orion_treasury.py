@@ -14,27 +14,48 @@ Filosofía: "No importa qué vendes, importa cómo lo haces mejor"
 """
 
 import os
+import sys
 import json
 import hashlib
 import hmac
 import time
 import logging
+import struct
+import zlib
+import mmap
+import bisect
+import threading
+import queue
+from array import array
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import uuid
 import base64
 
 try:
-    from cryptography.fernet import Fernet
-    from cryptography.hazmat.primitives import hashes
-    from cryptography.hazmat.primitives.asymmetric import rsa, padding
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+    from cryptography.exceptions import InvalidSignature
     CRYPTO_AVAILABLE = True
 except ImportError:
     CRYPTO_AVAILABLE = False
     print("⚠️ cryptography no disponible - instalando modo básico")
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("OrionTreasury")
@@ -56,6 +77,11 @@ class TipoTransaccion(Enum):
     QUEMA = "quema"
     DISTRIBUCION = "distribucion"
 
+# Versión 1: hash sobre f-string + json.dumps (cadenas antiguas)
+# Versión 2: hash sobre la codificación binaria canónica
+VERSION_LEGADO = 1
+VERSION_CANONICA = 2
+
 @dataclass
 class BloqueTransaccion:
     index: int
@@ -70,15 +96,2283 @@ class BloqueTransaccion:
     firma: str
     metadata: Dict
     nonce: int
+    # Sin versión explícita el bloque es legado; los nuevos se sellan con VERSION_CANONICA
+    version: int = VERSION_LEGADO
+    clave_id: str = ""
+
+# ==================== CODIFICACIÓN CANÓNICA ====================
+
+_TIPOS = list(TipoTransaccion)
+_CODIGO_TIPO = {tipo: i for i, tipo in enumerate(_TIPOS)}
+
+# version, index, timestamp, tipo, monto_fc, monto_usd, nonce, hash_anterior,
+# longitudes de from/to y número de entradas de metadata
+_CANONICO_FIJO = struct.Struct("<BQdBddq32sHHI")
+# longitud de clave y de valor de cada entrada de metadata
+_CANONICO_ENTRADA = struct.Struct("<HI")
+
+
+def codificar_canonico(bloque: BloqueTransaccion) -> bytes:
+    """
+    Codificación canónica v2 del bloque.
+
+    Campos numéricos de ancho fijo (montos como float64), cadenas con prefijo
+    de longitud y metadata ordenada por clave; los valores str van como texto
+    ("s") y el resto como JSON canónico ("j").
+    """
+    origen = bloque.from_wallet.encode()
+    destino = bloque.to_wallet.encode()
+    metadata = bloque.metadata
+    partes = [
+        _CANONICO_FIJO.pack(
+            VERSION_CANONICA, bloque.index, bloque.timestamp, _CODIGO_TIPO[bloque.tipo],
+            bloque.monto_fc, bloque.monto_usd, bloque.nonce,
+            bytes.fromhex(bloque.hash_anterior), len(origen), len(destino), len(metadata)
+        ),
+        origen,
+        destino
+    ]
+    for clave in sorted(metadata):
+        valor = metadata[clave]
+        clave_bytes = str(clave).encode()
+        if valor.__class__ is str:
+            valor_bytes = b"s" + valor.encode()
+        else:
+            valor_bytes = b"j" + json.dumps(valor, sort_keys=True, separators=(",", ":")).encode()
+        partes += (_CANONICO_ENTRADA.pack(len(clave_bytes), len(valor_bytes)), clave_bytes, valor_bytes)
+    return b"".join(partes)
+
+
+def calcular_hash(bloque: BloqueTransaccion) -> str:
+    """Hash del bloque según su versión de codificación"""
+    if bloque.version == VERSION_LEGADO:
+        contenido = f"{bloque.index}{bloque.timestamp}{bloque.tipo.value}{bloque.from_wallet}{bloque.to_wallet}{bloque.monto_fc}{bloque.monto_usd}{bloque.hash_anterior}{bloque.nonce}{json.dumps(bloque.metadata)}"
+        return hashlib.sha256(contenido.encode()).hexdigest()
+    return hashlib.sha256(codificar_canonico(bloque)).hexdigest()
+
+# ==================== PERSISTENCIA ====================
+
+# Cabecera de segmento: magic, versión, reservado, índice del primer bloque
+_CABECERA_SEGMENTO = struct.Struct("<4sHHQ")
+_MAGIC_SEGMENTO = b"ORSG"
+_VERSION_SEGMENTO = 1
+
+# Cada registro: longitud del payload + crc32 del payload
+_CABECERA_REGISTRO = struct.Struct("<II")
+
+# Archivo frío: magic, versión, reservado, primer índice, bloques, bloques por
+# tramo, tramos, hash previo al primer bloque, hash del último y raíz Merkle;
+# después, la tabla de tramos (offset, longitud comprimida, longitud, crc32)
+_CABECERA_ARCHIVO = struct.Struct("<4sHHQQII32s32s32s")
+_MAGIC_ARCHIVO = b"ORAR"
+_VERSION_ARCHIVO = 1
+_ENTRADA_TRAMO = struct.Struct("<QIII")
+
+# Payload: index, timestamp, tipo, flags, monto_fc, monto_usd, nonce,
+# hash_anterior, hash_actual, longitudes de from/to/firma/metadata
+_BLOQUE_FIJO = struct.Struct("<QdBBddq32s32sHHHI")
+_OFFSET_HASH_ACTUAL = struct.calcsize("<QdBBddq32s")
+_TIMESTAMP = struct.Struct("<d")
+
+# Los montos enteros se marcan para reconstruir el mismo valor que se hasheó;
+# con _FLAG_CLAVE el campo firma es id de clave (8 bytes) + firma Ed25519;
+# los 4 bits altos guardan la versión del bloque (0 = legado)
+_FLAG_FC_ENTERO = 1
+_FLAG_USD_ENTERO = 2
+_FLAG_CLAVE = 4
+_FLAG_SIN_FIRMA = 8
+_FLAG_VERSION_BIT = 4
+
+
+def _flags_bloque(bloque: BloqueTransaccion) -> int:
+    return ((_FLAG_FC_ENTERO if isinstance(bloque.monto_fc, int) else 0) |
+            (_FLAG_USD_ENTERO if isinstance(bloque.monto_usd, int) else 0) |
+            (_FLAG_CLAVE if bloque.clave_id else 0) |
+            (_FLAG_SIN_FIRMA if not bloque.firma else 0) |
+            ((bloque.version if bloque.version != VERSION_LEGADO else 0) << _FLAG_VERSION_BIT))
+
+
+def _serializar_bloque(bloque: BloqueTransaccion) -> bytes:
+    """Codifica un bloque para el registro en disco"""
+    origen = bloque.from_wallet.encode()
+    destino = bloque.to_wallet.encode()
+    firma = bytes.fromhex(bloque.clave_id + bloque.firma)
+    metadata = json.dumps(bloque.metadata, separators=(",", ":")).encode()
+    flags = _flags_bloque(bloque)
+    fijo = _BLOQUE_FIJO.pack(
+        bloque.index, bloque.timestamp, _CODIGO_TIPO[bloque.tipo], flags,
+        bloque.monto_fc, bloque.monto_usd, bloque.nonce,
+        bytes.fromhex(bloque.hash_anterior), bytes.fromhex(bloque.hash_actual),
+        len(origen), len(destino), len(firma), len(metadata)
+    )
+    return b"".join((fijo, origen, destino, firma, metadata))
+
+
+def _deserializar_bloque(buf, offset: int = 0) -> BloqueTransaccion:
+    """Decodifica un bloque desde un buffer (bytes o mmap)"""
+    (index, timestamp, tipo, flags, monto_fc, monto_usd, nonce, hash_anterior, hash_actual,
+     l_origen, l_destino, l_firma, l_meta) = _BLOQUE_FIJO.unpack_from(buf, offset)
+    if flags & _FLAG_FC_ENTERO:
+        monto_fc = int(monto_fc)
+    if flags & _FLAG_USD_ENTERO:
+        monto_usd = int(monto_usd)
+    pos = offset + _BLOQUE_FIJO.size
+    origen = bytes(buf[pos:pos + l_origen]).decode()
+    pos += l_origen
+    destino = bytes(buf[pos:pos + l_destino]).decode()
+    pos += l_destino
+    firma = bytes(buf[pos:pos + l_firma]).hex()
+    pos += l_firma
+    clave_id = ""
+    if flags & _FLAG_CLAVE:
+        clave_id, firma = firma[:16], firma[16:]
+    metadata = json.loads(bytes(buf[pos:pos + l_meta]))
+    return BloqueTransaccion(
+        index=index,
+        timestamp=timestamp,
+        tipo=_TIPOS[tipo],
+        from_wallet=origen,
+        to_wallet=destino,
+        monto_fc=monto_fc,
+        monto_usd=monto_usd,
+        hash_anterior=hash_anterior.hex(),
+        hash_actual=hash_actual.hex(),
+        firma=firma,
+        metadata=metadata,
+        nonce=nonce,
+        version=(flags >> _FLAG_VERSION_BIT) or VERSION_LEGADO,
+        clave_id=clave_id
+    )
+
+
+class _Segmento:
+    """Archivo de segmento: cabecera + registros de bloques consecutivos"""
+
+    archivado = False
+
+    def __init__(self, ruta: str, primer_indice: int):
+        self.ruta = ruta
+        self.primer_indice = primer_indice
+        self.offsets: Optional[array] = None
+        self.mapa: Optional[mmap.mmap] = None
+
+    @property
+    def ruta_indice(self) -> str:
+        return self.ruta[:-4] + ".idx"
+
+    def escanear(self) -> int:
+        """Recorre los registros validando crc; devuelve el fin del último válido"""
+        offsets = array("Q")
+        with open(self.ruta, "rb") as f:
+            datos = f.read()
+        pos = _CABECERA_SEGMENTO.size
+        while pos + _CABECERA_REGISTRO.size <= len(datos):
+            longitud, crc = _CABECERA_REGISTRO.unpack_from(datos, pos)
+            inicio = pos + _CABECERA_REGISTRO.size
+            fin = inicio + longitud
+            if fin > len(datos) or zlib.crc32(datos[inicio:fin]) != crc:
+                break
+            offsets.append(inicio)
+            pos = fin
+        self.offsets = offsets
+        return pos
+
+    def cargar_offsets(self):
+        """Carga el índice de offsets del segmento sellado (o lo reconstruye)"""
+        if self.offsets is not None:
+            return
+        if os.path.exists(self.ruta_indice):
+            offsets = array("Q")
+            with open(self.ruta_indice, "rb") as f:
+                offsets.frombytes(f.read())
+            self.offsets = offsets
+        else:
+            self.escanear()
+
+    def sellar(self):
+        """Escribe el índice de offsets junto al segmento"""
+        with open(self.ruta_indice, "wb") as f:
+            f.write(self.offsets.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def mapear(self, tamano_minimo: int = 0) -> mmap.mmap:
+        """Devuelve un mmap de solo lectura que cubre al menos tamano_minimo bytes"""
+        if self.mapa is None or len(self.mapa) < tamano_minimo:
+            self.liberar()
+            with open(self.ruta, "rb") as f:
+                self.mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mapa
+
+    def liberar(self):
+        # Se suelta la referencia sin cerrar: un lector concurrente puede seguir
+        # usando el mapa anterior, que se cierra al dejar de estar referenciado
+        self.mapa = None
+
+    @property
+    def abierto(self) -> bool:
+        return self.mapa is not None
+
+    def tramo(self, relativo: int) -> Tuple[mmap.mmap, array, int]:
+        """Buffer, offsets y primer relativo que cubren el bloque (segmento sellado)"""
+        self.cargar_offsets()
+        return self.mapear(), self.offsets, 0
+
+    def descargar(self):
+        """Libera mapa e índice de offsets (se recargan del .idx al volver a leer)"""
+        self.liberar()
+        self.offsets = None
+
+    def fin_datos(self) -> int:
+        """Fin del último registro del segmento sellado"""
+        self.cargar_offsets()
+        if not self.offsets:
+            return _CABECERA_SEGMENTO.size
+        with open(self.ruta, "rb") as f:
+            f.seek(self.offsets[-1] - _CABECERA_REGISTRO.size)
+            longitud, _ = _CABECERA_REGISTRO.unpack(f.read(_CABECERA_REGISTRO.size))
+        return self.offsets[-1] + longitud
+
+
+class _SegmentoArchivado:
+    """
+    Segmento frío e inmutable: los mismos registros que un segmento sellado,
+    comprimidos con zlib en tramos de `por_tramo` bloques (precedidos de sus
+    offsets) para poder leer un bloque suelto descomprimiendo solo su tramo. La cabecera fija los hashes
+    de frontera (previo al primer bloque y del último) y la raíz Merkle de
+    los bloques del archivo.
+    """
+
+    archivado = True
+
+    def __init__(self, ruta: str, max_tramos: int = 4):
+        self.ruta = ruta
+        self.max_tramos = max_tramos
+        with open(ruta, "rb") as f:
+            cabecera = f.read(_CABECERA_ARCHIVO.size)
+            (magic, version, _, self.primer_indice, self.total, self.por_tramo, n_tramos,
+             hash_anterior, hash_ultimo, raiz) = _CABECERA_ARCHIVO.unpack(cabecera)
+            if magic != _MAGIC_ARCHIVO or version != _VERSION_ARCHIVO:
+                raise ValueError(f"Archivo frío no reconocido: {ruta}")
+            tabla = f.read(_ENTRADA_TRAMO.size * n_tramos)
+        self.hash_anterior = hash_anterior.hex()
+        self.hash_ultimo = hash_ultimo.hex()
+        self.raiz_merkle = raiz.hex()
+        self._tramos = [_ENTRADA_TRAMO.unpack_from(tabla, k * _ENTRADA_TRAMO.size)
+                        for k in range(n_tramos)]
+        self._cache: Dict[int, Tuple[bytes, Tuple[int, ...]]] = {}
+
+    @property
+    def abierto(self) -> bool:
+        return bool(self._cache)
+
+    def _descomprimir(self, k: int) -> Tuple[bytes, Tuple[int, ...]]:
+        offset, comprimido, longitud, crc = self._tramos[k]
+        with open(self.ruta, "rb") as f:
+            f.seek(offset)
+            try:
+                datos = zlib.decompress(f.read(comprimido))
+            except zlib.error as e:
+                raise ValueError(f"Tramo {k} corrupto en {self.ruta}: {e}")
+        if len(datos) != longitud or zlib.crc32(datos) != crc:
+            raise ValueError(f"Tramo {k} corrupto en {self.ruta}")
+        # El tramo empieza con los offsets de sus registros (uint32)
+        n = min(self.por_tramo, self.total - k * self.por_tramo)
+        return datos, struct.unpack_from(f"<{n}I", datos)
+
+    def tramo(self, relativo: int) -> Tuple[bytes, Tuple[int, ...], int]:
+        k = relativo // self.por_tramo
+        tramo = self._cache.pop(k, None)
+        if tramo is None:
+            tramo = self._descomprimir(k)
+            if len(self._cache) >= self.max_tramos:
+                del self._cache[next(iter(self._cache))]
+        self._cache[k] = tramo
+        return tramo[0], tramo[1], k * self.por_tramo
+
+    def liberar(self):
+        self._cache = {}
+
+    descargar = liberar
+
+    def verificar(self) -> List[str]:
+        """Recalcula hashes, encadenamiento, fronteras y raíz Merkle del archivo"""
+        errores = []
+        hashes_bloque = []
+        arbol = ArbolMerkle(lambda p: hashes_bloque[p])
+        anterior = self.hash_anterior
+        for k in range(len(self._tramos)):
+            try:
+                datos, offsets = self._descomprimir(k)
+            except ValueError as e:
+                return errores + [str(e)]
+            for offset in offsets:
+                bloque = _deserializar_bloque(datos, offset)
+                if bloque.hash_actual != calcular_hash(bloque):
+                    errores.append(f"Hash inválido en bloque {bloque.index - 1}")
+                if bloque.hash_anterior != anterior:
+                    errores.append(f"Encadenamiento roto en bloque {bloque.index - 1}")
+                anterior = bloque.hash_actual
+                hashes_bloque.append(bytes.fromhex(bloque.hash_actual))
+                arbol.agregar(hashes_bloque[-1])
+        if len(hashes_bloque) != self.total:
+            errores.append(f"{self.ruta}: {len(hashes_bloque)} bloques, la cabecera declara {self.total}")
+        if anterior != self.hash_ultimo:
+            errores.append(f"{self.ruta}: hash final no coincide con la cabecera")
+        if arbol.raiz().hex() != self.raiz_merkle:
+            errores.append(f"{self.ruta}: raíz Merkle no coincide con la cabecera")
+        return errores
+
+    @staticmethod
+    def escribir(segmento: _Segmento, ruta: str, por_tramo: int = 256, nivel: int = 6):
+        """Comprime un segmento sellado a un archivo frío (escritura atómica)"""
+        segmento.cargar_offsets()
+        offsets = segmento.offsets
+        total = len(offsets)
+        with open(segmento.ruta, "rb") as f:
+            datos = f.read(segmento.fin_datos())
+
+        hashes_bloque = []
+        for offset in offsets:
+            longitud, crc = _CABECERA_REGISTRO.unpack_from(datos, offset - _CABECERA_REGISTRO.size)
+            if zlib.crc32(datos[offset:offset + longitud]) != crc:
+                raise ValueError(f"Registro corrupto en {segmento.ruta} (offset {offset})")
+            hashes_bloque.append(datos[offset + _OFFSET_HASH_ACTUAL:offset + _OFFSET_HASH_ACTUAL + 32])
+        arbol = ArbolMerkle(lambda p: hashes_bloque[p])
+        for h in hashes_bloque:
+            arbol.agregar(h)
+        hash_anterior = _deserializar_bloque(datos, offsets[0]).hash_anterior if total else "0" * 64
+
+        tramos = []
+        for k in range(0, total, por_tramo):
+            inicio = offsets[k] - _CABECERA_REGISTRO.size
+            fin = offsets[k + por_tramo] - _CABECERA_REGISTRO.size if k + por_tramo < total else len(datos)
+            n = min(por_tramo, total - k)
+            crudo = struct.pack(f"<{n}I", *(offsets[k + j] - inicio + 4 * n for j in range(n))) + datos[inicio:fin]
+            tramos.append((zlib.compress(crudo, nivel), len(crudo), zlib.crc32(crudo)))
+
+        cabecera = _CABECERA_ARCHIVO.pack(
+            _MAGIC_ARCHIVO, _VERSION_ARCHIVO, 0, segmento.primer_indice, total, por_tramo, len(tramos),
+            bytes.fromhex(hash_anterior), hashes_bloque[-1] if hashes_bloque else bytes(32), arbol.raiz()
+        )
+        offset = len(cabecera) + _ENTRADA_TRAMO.size * len(tramos)
+        tabla = []
+        for comprimido, longitud, crc in tramos:
+            tabla.append(_ENTRADA_TRAMO.pack(offset, len(comprimido), longitud, crc))
+            offset += len(comprimido)
+
+        temporal = ruta + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(cabecera)
+            f.write(b"".join(tabla))
+            for comprimido, _, _ in tramos:
+                f.write(comprimido)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+
+
+class RegistroSegmentos:
+    """
+    Registro append-only de bloques en segmentos rotativos.
+
+    Los bloques se acumulan en memoria y se escriben con un único fsync por
+    grupo (group commit): cada `fsync_cada` bloques o cada `fsync_intervalo`
+    segundos, o al llamar a `sync()`. Las lecturas se hacen vía mmap.
+    Al reabrir solo se escanea el segmento final; los segmentos sellados
+    guardan su índice de offsets en un archivo .idx que se carga bajo demanda.
+    Los segmentos sellados antiguos pueden archivarse en frío (`archivar`):
+    se comprimen en un archivo inmutable y se siguen leyendo igual.
+
+    Se comporta como una secuencia de BloqueTransaccion, por lo que puede
+    sustituir a la lista `OrionTreasury.transacciones`.
+    """
+
+    def __init__(self, directorio: str, tamano_segmento: int = 64 * 1024 * 1024,
+                 fsync_cada: int = 256, fsync_intervalo: float = 0.05,
+                 max_mapas: int = 32, solo_lectura: bool = False):
+        self.directorio = directorio
+        self.solo_lectura = solo_lectura
+        self.tamano_segmento = tamano_segmento
+        self.fsync_cada = fsync_cada
+        self.fsync_intervalo = fsync_intervalo
+        self.max_mapas = max_mapas
+
+        self._segmentos: List[_Segmento] = []
+        self._primeros: List[int] = []
+        self._activo = None
+        self._tamano_activo = 0
+        self._buffer = bytearray()
+        self._pendientes = 0
+        self._sin_fsync = 0
+        self._ultimo_fsync = time.monotonic()
+        self._mapas_abiertos: List[_Segmento] = []
+        self._lock = threading.RLock()
+        self.ultimo_hash = "0" * 64
+        self.total = 0
+        # Firma del último bloque de cada group commit (la asigna la tesorería)
+        self.firmante: Optional[Callable[[BloqueTransaccion], None]] = None
+        self._ultimo_pendiente: Optional[Tuple[BloqueTransaccion, int]] = None
+
+        if not solo_lectura:
+            os.makedirs(directorio, exist_ok=True)
+        self._abrir()
+
+    # ---------- apertura y recuperación ----------
+
+    def _abrir(self):
+        nombres = os.listdir(self.directorio)
+        archivados = {int(n[4:-4]): n for n in nombres if n.startswith("arc_") and n.endswith(".orz")}
+        segmentos = {int(n[4:-4]): n for n in nombres if n.startswith("seg_") and n.endswith(".log")}
+        for primer in sorted(set(archivados) | set(segmentos)):
+            if primer in archivados:
+                self._segmentos.append(_SegmentoArchivado(os.path.join(self.directorio, archivados[primer])))
+                if primer in segmentos and not self.solo_lectura:
+                    # Archivado completo antes de un corte: el original sobra
+                    self._borrar_segmento(os.path.join(self.directorio, segmentos[primer]))
+            else:
+                self._segmentos.append(_Segmento(os.path.join(self.directorio, segmentos[primer]), primer))
+            self._primeros.append(primer)
+
+        if not self._segmentos:
+            if not self.solo_lectura:
+                self._nuevo_segmento(1)
+            return
+
+        # Solo se escanea el segmento final; se truncan escrituras incompletas
+        cola = self._segmentos[-1]
+        fin_valido = cola.escanear()
+        if not self.solo_lectura:
+            with open(cola.ruta, "r+b") as f:
+                f.truncate(fin_valido)
+            self._activo = open(cola.ruta, "ab")
+        self._tamano_activo = fin_valido
+        self.total = cola.primer_indice - 1 + len(cola.offsets)
+
+        if self.total:
+            self.ultimo_hash = self[self.total - 1].hash_actual
+        logger.info(f"📂 Registro reabierto: {self.total} bloques en {len(self._segmentos)} segmentos")
+
+    def _nuevo_segmento(self, primer_indice: int):
+        ruta = os.path.join(self.directorio, f"seg_{primer_indice:012d}.log")
+        with open(ruta, "wb") as f:
+            f.write(_CABECERA_SEGMENTO.pack(_MAGIC_SEGMENTO, _VERSION_SEGMENTO, 0, primer_indice))
+            f.flush()
+            os.fsync(f.fileno())
+        segmento = _Segmento(ruta, primer_indice)
+        segmento.offsets = array("Q")
+        self._segmentos.append(segmento)
+        self._primeros.append(primer_indice)
+        self._activo = open(ruta, "ab")
+        self._tamano_activo = _CABECERA_SEGMENTO.size
+        self._fsync_directorio()
+
+    @staticmethod
+    def _borrar_segmento(ruta: str):
+        for ruta_archivo in (ruta, ruta[:-4] + ".idx"):
+            if os.path.exists(ruta_archivo):
+                os.remove(ruta_archivo)
+
+    def _fsync_directorio(self):
+        fd = os.open(self.directorio, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # ---------- escritura ----------
+
+    def append(self, bloque: BloqueTransaccion):
+        """Añade un bloque al registro (durable tras el siguiente group commit)"""
+        if self.solo_lectura:
+            raise PermissionError("Registro abierto en solo lectura")
+        with self._lock:
+            if bloque.index != self.total + 1:
+                raise ValueError(f"Índice {bloque.index} no consecutivo (esperado {self.total + 1})")
+
+            self._encolar(_serializar_bloque(bloque), bloque)
+
+            if (self._pendientes >= self.fsync_cada or
+                    time.monotonic() - self._ultimo_fsync >= self.fsync_intervalo):
+                self.sync()
+
+    def extend(self, bloques: List[BloqueTransaccion], sync: bool = True):
+        """
+        Añade un lote de bloques. Con `sync` el lote se confirma con un único
+        fsync; sin él sigue la política de group commit de `append`.
+        """
+        if self.solo_lectura:
+            raise PermissionError("Registro abierto en solo lectura")
+        # Codificar todo antes de tocar el estado: un fallo no deja medio lote
+        payloads = [_serializar_bloque(bloque) for bloque in bloques]
+        with self._lock:
+            for k, bloque in enumerate(bloques):
+                if bloque.index != self.total + 1 + k:
+                    raise ValueError(f"Índice {bloque.index} no consecutivo (esperado {self.total + 1 + k})")
+
+            for bloque, payload in zip(bloques, payloads):
+                self._encolar(payload, bloque)
+            if (sync or self._pendientes >= self.fsync_cada or
+                    time.monotonic() - self._ultimo_fsync >= self.fsync_intervalo):
+                self.sync()
+
+    def _encolar(self, payload: bytes, bloque: BloqueTransaccion):
+        self._ultimo_pendiente = (bloque, len(self._buffer))
+        self._buffer += _CABECERA_REGISTRO.pack(len(payload), zlib.crc32(payload))
+        self._segmentos[-1].offsets.append(self._tamano_activo + len(self._buffer))
+        self._buffer += payload
+        self._pendientes += 1
+        self.total += 1
+        self.ultimo_hash = bloque.hash_actual
+
+        if self._tamano_activo + len(self._buffer) >= self.tamano_segmento:
+            self._rotar()
+
+    def _vaciar(self):
+        """Escribe el buffer al archivo activo sin forzar fsync"""
+        if self._buffer:
+            if self.firmante is not None:
+                self._firmar_pendiente()
+            self._activo.write(self._buffer)
+            self._activo.flush()
+            self._tamano_activo += len(self._buffer)
+            self._sin_fsync += self._pendientes
+            self._buffer = bytearray()
+            self._pendientes = 0
+            self._ultimo_pendiente = None
+
+    def _firmar_pendiente(self):
+        """
+        Firma el último bloque del buffer antes de escribirlo: una firma por
+        group commit, que por encadenamiento cubre a todos los anteriores.
+        La cabecera tiene tamaño fijo, así que el offset del registro no cambia.
+        """
+        bloque, inicio = self._ultimo_pendiente
+        if bloque.clave_id:
+            return
+        self.firmante(bloque)
+        payload = _serializar_bloque(bloque)
+        del self._buffer[inicio:]
+        self._buffer += _CABECERA_REGISTRO.pack(len(payload), zlib.crc32(payload))
+        self._buffer += payload
+
+    def sync(self):
+        """Group commit: escribe lo pendiente y hace un único fsync"""
+        with self._lock:
+            self._vaciar()
+            if self._sin_fsync:
+                os.fsync(self._activo.fileno())
+                self._sin_fsync = 0
+            self._ultimo_fsync = time.monotonic()
+
+    def _rotar(self):
+        self.sync()
+        self._activo.close()
+        self._segmentos[-1].sellar()
+        self._segmentos[-1].descargar()
+        self._nuevo_segmento(self.total + 1)
+
+    def cerrar(self):
+        """Hace el último group commit y libera archivos y mapas"""
+        with self._lock:
+            if self._activo is not None:
+                self.sync()
+                self._activo.close()
+                self._activo = None
+            for segmento in self._segmentos:
+                segmento.liberar()
+            self._mapas_abiertos = []
+
+    # ---------- lectura ----------
+
+    def _localizar(self, posicion: int) -> Tuple[_Segmento, int]:
+        indice = posicion + 1
+        s = bisect.bisect_right(self._primeros, indice) - 1
+        return self._segmentos[s], indice - self._primeros[s]
+
+    def _tramo(self, segmento, relativo: int) -> Tuple[object, object, int]:
+        """
+        Buffer, offsets y primer relativo del tramo que contiene el bloque.
+        Solo los segmentos usados recientemente (`max_mapas`) quedan abiertos.
+        """
+        if segmento is self._segmentos[-1]:
+            # Segmento activo: lo escrito en buffer debe llegar al archivo antes de mapear
+            self._vaciar()
+            return segmento.mapear(self._tamano_activo), segmento.offsets, 0
+        if not segmento.abierto:
+            self._mapas_abiertos.append(segmento)
+            if len(self._mapas_abiertos) > self.max_mapas:
+                self._mapas_abiertos.pop(0).descargar()
+        return segmento.tramo(relativo)
+
+    def _ubicar(self, posicion: int) -> Tuple[object, int]:
+        with self._lock:
+            segmento, relativo = self._localizar(posicion)
+            buf, offsets, base = self._tramo(segmento, relativo)
+            return buf, offsets[relativo - base]
+
+    def leer(self, posicion: int) -> BloqueTransaccion:
+        return _deserializar_bloque(*self._ubicar(posicion))
+
+    def hash_bloque(self, posicion: int) -> bytes:
+        """hash_actual binario de un bloque, sin decodificar el resto"""
+        buf, offset = self._ubicar(posicion)
+        return bytes(buf[offset + _OFFSET_HASH_ACTUAL:offset + _OFFSET_HASH_ACTUAL + 32])
+
+    def timestamp_bloque(self, posicion: int) -> float:
+        buf, offset = self._ubicar(posicion)
+        return _TIMESTAMP.unpack_from(buf, offset + 8)[0]
+
+    def iterar(self, desde: int = 0, hasta: Optional[int] = None) -> Iterator[BloqueTransaccion]:
+        """Recorre bloques por posición [desde, hasta) leyendo tramo a tramo"""
+        hasta = self.total if hasta is None else min(hasta, self.total)
+        posicion = desde
+        while posicion < hasta:
+            with self._lock:
+                segmento, relativo = self._localizar(posicion)
+                buf, offsets, base = self._tramo(segmento, relativo)
+            fin = min(base + len(offsets), relativo + hasta - posicion)
+            for k in range(relativo, fin):
+                yield _deserializar_bloque(buf, offsets[k - base])
+            posicion += fin - relativo
+
+    # ---------- archivo en frío ----------
+
+    def archivar(self, hasta_timestamp: float, por_tramo: int = 256) -> List[Dict]:
+        """
+        Comprime en archivos fríos los segmentos sellados cuyo último bloque
+        es anterior a `hasta_timestamp`. El segmento activo nunca se archiva.
+        """
+        if self.solo_lectura:
+            raise PermissionError("Registro abierto en solo lectura")
+        archivados = []
+        for s in range(len(self._segmentos) - 1):
+            segmento = self._segmentos[s]
+            if segmento.archivado:
+                continue
+            ultimo = self._primeros[s + 1] - 2
+            if self.timestamp_bloque(ultimo) >= hasta_timestamp:
+                break
+            ruta = os.path.join(self.directorio, f"arc_{segmento.primer_indice:012d}.orz")
+            _SegmentoArchivado.escribir(segmento, ruta, por_tramo)
+            self._fsync_directorio()
+            with self._lock:
+                archivo = _SegmentoArchivado(ruta)
+                self._segmentos[s] = archivo
+                if segmento in self._mapas_abiertos:
+                    self._mapas_abiertos.remove(segmento)
+                segmento.descargar()
+            antes = os.path.getsize(segmento.ruta)
+            self._borrar_segmento(segmento.ruta)
+            self._fsync_directorio()
+            archivados.append({
+                "primer_indice": archivo.primer_indice,
+                "bloques": archivo.total,
+                "bytes_antes": antes,
+                "bytes_despues": os.path.getsize(ruta),
+                "raiz_merkle": archivo.raiz_merkle
+            })
+        if archivados:
+            logger.info(f"🧊 {len(archivados)} segmentos archivados en frío")
+        return archivados
+
+    def archivos(self) -> List["_SegmentoArchivado"]:
+        return [segmento for segmento in self._segmentos if segmento.archivado]
+
+    def verificar_archivos(self) -> List[str]:
+        """
+        Verifica cada archivo frío por separado y sus fronteras con los
+        segmentos vecinos (hash previo y hash final de la cabecera).
+        """
+        errores = []
+        for s, segmento in enumerate(self._segmentos):
+            if not segmento.archivado:
+                continue
+            errores.extend(segmento.verificar())
+            primero = segmento.primer_indice - 1
+            try:
+                if s > 0:
+                    previo = self._segmentos[s - 1]
+                    hash_previo = (previo.hash_ultimo if previo.archivado
+                                   else self.hash_bloque(primero - 1).hex())
+                    if hash_previo != segmento.hash_anterior:
+                        errores.append(f"Frontera rota antes de {segmento.ruta}")
+                if s + 1 < len(self._segmentos) and not self._segmentos[s + 1].archivado:
+                    if self.leer(primero + segmento.total).hash_anterior != segmento.hash_ultimo:
+                        errores.append(f"Frontera rota después de {segmento.ruta}")
+            except ValueError as e:
+                errores.append(str(e))
+        return errores
+
+    def rangos_fisicos(self, desde: int, hasta: int, tamano_rango: int) -> List[Tuple]:
+        """
+        Describe las posiciones [desde, hasta) como rangos físicos que otro
+        proceso puede leer sin abrir el registro: ("segmento", inicio, ruta,
+        byte_inicio, byte_fin) con los offsets del .idx (o del índice en
+        memoria del segmento activo), o ("archivo", inicio, ruta, tramo_desde,
+        tramo_hasta, fin) para archivos fríos. Ningún rango cruza segmentos.
+        """
+        self.sync()
+        rangos = []
+        with self._lock:
+            hasta = min(hasta, self.total)
+            s = bisect.bisect_right(self._primeros, desde + 1) - 1
+            posicion = desde
+            while posicion < hasta:
+                segmento = self._segmentos[s]
+                primera = segmento.primer_indice - 1
+                fin_segmento = min(hasta, self._primeros[s + 1] - 1 if s + 1 < len(self._segmentos) else self.total)
+                if segmento.archivado:
+                    por_tramo = segmento.por_tramo
+                    paso = max(1, tamano_rango // por_tramo)
+                    ultimo = -(-(fin_segmento - primera) // por_tramo)
+                    for k in range((posicion - primera) // por_tramo, ultimo, paso):
+                        rangos.append(("archivo", max(posicion, primera + k * por_tramo), segmento.ruta,
+                                       k, min(k + paso, ultimo), min(fin_segmento, primera + (k + paso) * por_tramo)))
+                else:
+                    activo = segmento is self._segmentos[-1]
+                    cargado = segmento.offsets is not None
+                    segmento.cargar_offsets()
+                    offsets = segmento.offsets
+                    fin_datos = self._tamano_activo if activo else segmento.fin_datos()
+                    for a in range(posicion, fin_segmento, tamano_rango):
+                        ra, rb = a - primera, min(a + tamano_rango, fin_segmento) - primera
+                        rangos.append(("segmento", a, segmento.ruta,
+                                       offsets[ra] - _CABECERA_REGISTRO.size,
+                                       offsets[rb] - _CABECERA_REGISTRO.size if rb < len(offsets) else fin_datos))
+                    if not cargado and not activo:
+                        segmento.descargar()
+                posicion = fin_segmento
+                s += 1
+        return rangos
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __getitem__(self, posicion):
+        if isinstance(posicion, slice):
+            inicio, fin, paso = posicion.indices(self.total)
+            if paso == 1:
+                return list(self.iterar(inicio, fin))
+            return [self.leer(i) for i in range(inicio, fin, paso)]
+        if posicion < 0:
+            posicion += self.total
+        if not 0 <= posicion < self.total:
+            raise IndexError("bloque fuera de rango")
+        return self.leer(posicion)
+
+    def __iter__(self) -> Iterator[BloqueTransaccion]:
+        return self.iterar()
+
+
+class RegistroCheckpoints:
+    """
+    Checkpoints de integridad firmados con HMAC-SHA256.
+
+    Cada checkpoint fija (índice, hash) de un bloque; una auditoría puede
+    anclarse en el último checkpoint confiable y verificar solo lo posterior.
+    La clave viene del parámetro o de ORION_CLAVE_CHECKPOINT.
+    """
+
+    def __init__(self, clave: Optional[bytes] = None, ruta: Optional[str] = None,
+                 total_bloques: int = 0):
+        if clave is None and os.environ.get("ORION_CLAVE_CHECKPOINT"):
+            clave = os.environ["ORION_CLAVE_CHECKPOINT"].encode()
+        if clave is None:
+            clave = os.urandom(32)
+            if ruta:
+                logger.warning("⚠️ Sin clave de checkpoint: los checkpoints previos no serán confiables al reiniciar")
+        self._clave = clave
+        self.ruta = ruta
+        self.checkpoints: List[Dict] = []
+        self._indices: List[int] = []
+        if ruta:
+            self._cargar(total_bloques)
+
+    def _firmar(self, indice: int, hash_bloque: str) -> str:
+        return hmac.new(self._clave, f"{indice}:{hash_bloque}".encode(), hashlib.sha256).hexdigest()
+
+    def _cargar(self, total_bloques: int):
+        if not os.path.exists(self.ruta):
+            return
+        descartados = 0
+        with open(self.ruta, "r") as f:
+            for linea in f:
+                try:
+                    checkpoint = json.loads(linea)
+                except ValueError:
+                    descartados += 1
+                    continue
+                # Un checkpoint posterior al último bloque durable no sobrevive
+                if checkpoint["indice"] > total_bloques or (
+                        self._indices and checkpoint["indice"] <= self._indices[-1]):
+                    descartados += 1
+                    continue
+                self.checkpoints.append(checkpoint)
+                self._indices.append(checkpoint["indice"])
+        if descartados:
+            with open(self.ruta, "w") as f:
+                for checkpoint in self.checkpoints:
+                    f.write(json.dumps(checkpoint) + "\n")
+
+    def registrar(self, indice: int, hash_bloque: str) -> Dict:
+        checkpoint = {
+            "indice": indice,
+            "hash": hash_bloque,
+            "firma": self._firmar(indice, hash_bloque),
+            "timestamp": time.time()
+        }
+        self.checkpoints.append(checkpoint)
+        self._indices.append(indice)
+        if self.ruta:
+            with open(self.ruta, "a") as f:
+                f.write(json.dumps(checkpoint) + "\n")
+        return checkpoint
+
+    def es_valido(self, checkpoint: Dict) -> bool:
+        esperada = self._firmar(checkpoint["indice"], checkpoint["hash"])
+        return hmac.compare_digest(esperada, checkpoint["firma"])
+
+    def anteriores_a(self, posicion: int) -> Iterator[Dict]:
+        """Checkpoints con firma válida e índice <= posicion, del más reciente al más antiguo"""
+        k = bisect.bisect_right(self._indices, posicion)
+        for checkpoint in reversed(self.checkpoints[:k]):
+            if self.es_valido(checkpoint):
+                yield checkpoint
+
+    def __len__(self) -> int:
+        return len(self.checkpoints)
+
+
+class RegistroWallets:
+    """
+    Log append-only de wallets creadas, con la posición de la cadena en que
+    se crearon, para poder reconstruir `OrionTreasury.wallets` al reabrir.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._archivo = open(ruta, "ab")
+
+    @property
+    def offset(self) -> int:
+        return self._archivo.tell()
+
+    def registrar(self, indice: int, wallet: Dict):
+        self._archivo.write(json.dumps({"indice": indice, "wallet": wallet}).encode() + b"\n")
+        self._archivo.flush()
+
+    def leer_desde(self, offset: int = 0) -> Iterator[Dict]:
+        """Entradas a partir de un offset; una última línea incompleta se ignora"""
+        with open(self.ruta, "rb") as f:
+            f.seek(offset)
+            for linea in f:
+                try:
+                    yield json.loads(linea)
+                except ValueError:
+                    break
+
+    def sync(self):
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+
+    def cerrar(self):
+        if not self._archivo.closed:
+            self.sync()
+            self._archivo.close()
+
+
+class AlmacenSnapshots:
+    """
+    Snapshots compactos de saldos ligados a (índice, hash) de un bloque.
+
+    Cada archivo tiene una línea de cabecera (índice, hash, offset del log de
+    wallets, sha256 del contenido) y una línea con las wallets en filas. Se
+    escriben en un temporal y se renombran, así que un snapshot a medias
+    nunca se considera válido. En segundo plano, un hilo escritor obtiene
+    las filas con la función de copia del llamador, las serializa y las
+    escribe sin detener las emisiones; no se hace fork() de un proceso con
+    hilos vivos.
+    """
+
+    CAMPOS = ["wallet_id", "owner_id", "owner_type", "balance_fc", "balance_usd",
+              "creada", "ultima_actualizacion"]
+    FILAS_POR_TROZO = 2048
+
+    def __init__(self, directorio: str, max_snapshots: int = 3):
+        self.directorio = directorio
+        self.max_snapshots = max_snapshots
+        self._escritor: Optional[threading.Thread] = None
+        os.makedirs(directorio, exist_ok=True)
+
+    def _rutas(self) -> List[str]:
+        nombres = sorted(n for n in os.listdir(self.directorio)
+                         if n.startswith("snap_") and n.endswith(".json"))
+        return [os.path.join(self.directorio, n) for n in nombres]
+
+    @classmethod
+    def filas(cls, wallets) -> List[List]:
+        """Copia de las wallets en filas según CAMPOS (independiente de los dicts vivos)"""
+        return [[w.get(c) for c in cls.CAMPOS] for w in wallets]
+
+    def escribir(self, indice: int, hash_bloque: str, wallets: Dict[str, Dict],
+                 offset_wallets: int) -> str:
+        return self._escribir_filas(indice, hash_bloque, self.filas(wallets.values()), offset_wallets)
+
+    def _escribir_filas(self, indice: int, hash_bloque: str, filas: List[List],
+                        offset_wallets: int) -> str:
+        # Por trozos: un único json.dumps retendría el GIL y frenaría las emisiones
+        trozos = [json.dumps(filas[k:k + self.FILAS_POR_TROZO], separators=(",", ":"))[1:-1]
+                  for k in range(0, len(filas), self.FILAS_POR_TROZO)]
+        contenido = ("[" + ",".join(trozos) + "]").encode()
+        cabecera = {
+            "version": 1,
+            "indice": indice,
+            "hash": hash_bloque,
+            "timestamp": time.time(),
+            "offset_wallets": offset_wallets,
+            "campos": self.CAMPOS,
+            "wallets": len(filas),
+            "sha256": hashlib.sha256(contenido).hexdigest()
+        }
+        ruta = os.path.join(self.directorio, f"snap_{indice:012d}.json")
+        temporal = ruta + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(json.dumps(cabecera).encode() + b"\n")
+            f.write(contenido)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+        fd = os.open(self.directorio, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        for antigua in self._rutas()[:-self.max_snapshots]:
+            os.remove(antigua)
+        return ruta
+
+    def escribir_en_segundo_plano(self, indice: int, hash_bloque: str,
+                                  copiar_filas: Callable[[], List[List]], offset_wallets: int) -> bool:
+        """
+        Escribe en un hilo escritor las filas que devuelve `copiar_filas()`,
+        llamada ya en ese hilo; devuelve False si ya hay un snapshot en curso.
+        """
+        if self.en_curso():
+            return False
+        self._escritor = threading.Thread(
+            target=self._escribir_en_hilo, args=(indice, hash_bloque, copiar_filas, offset_wallets),
+            name="orion-snapshot", daemon=True
+        )
+        self._escritor.start()
+        return True
+
+    def _escribir_en_hilo(self, indice: int, hash_bloque: str, copiar_filas: Callable[[], List[List]],
+                          offset_wallets: int):
+        try:
+            self._escribir_filas(indice, hash_bloque, copiar_filas(), offset_wallets)
+        except OSError as e:
+            logger.error(f"❌ Snapshot en bloque {indice} fallido: {e}")
+
+    def en_curso(self) -> bool:
+        return self._escritor is not None and self._escritor.is_alive()
+
+    def esperar(self):
+        if self._escritor is not None:
+            self._escritor.join()
+            self._escritor = None
+
+    def cargar_valido(self, validar) -> Optional[Tuple[Dict, Dict[str, Dict]]]:
+        """Carga el snapshot más reciente íntegro y aceptado por `validar(cabecera)`"""
+        for ruta in reversed(self._rutas()):
+            try:
+                with open(ruta, "rb") as f:
+                    cabecera = json.loads(f.readline())
+                    contenido = f.read()
+            except (OSError, ValueError):
+                continue
+            if hashlib.sha256(contenido).hexdigest() != cabecera.get("sha256"):
+                logger.warning(f"⚠️ Snapshot corrupto: {ruta}")
+                continue
+            if not validar(cabecera):
+                logger.warning(f"⚠️ Snapshot no coincide con la cadena: {ruta}")
+                continue
+            campos = cabecera["campos"]
+            wallets = {}
+            for fila in json.loads(contenido):
+                wallet = dict(zip(campos, fila))
+                wallets[wallet["wallet_id"]] = wallet
+            return cabecera, wallets
+        return None
+
+
+# ==================== ALMACÉN COLUMNAR ====================
+
+def _tamano_dict(d: Dict) -> int:
+    """Bytes de un dict auxiliar: la tabla más sus claves y valores"""
+    if not d:
+        return 0
+    return sys.getsizeof(d) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in d.items())
+
+
+def _tamano_lista(valores: List) -> int:
+    return sys.getsizeof(valores) + sum(sys.getsizeof(v) for v in valores)
+
+
+class _Arena:
+    """Valores de longitud variable concatenados en un bytearray con tabla de offsets"""
+
+    def __init__(self):
+        self.datos = bytearray()
+        self.offsets = array("Q", [0])
+
+    def append(self, valor: bytes):
+        self.datos += valor
+        self.offsets.append(len(self.datos))
+
+    def __getitem__(self, posicion: int) -> bytes:
+        return bytes(self.datos[self.offsets[posicion]:self.offsets[posicion + 1]])
+
+    def memoria(self) -> int:
+        return len(self.datos) + self.offsets.itemsize * len(self.offsets)
+
+
+class _ArenaInternada:
+    """Arena de valores distintos más una columna de ids; los repetidos cuestan 4 bytes"""
+
+    def __init__(self, max_cache: int = 4096):
+        self.valores = _Arena()
+        self.ids = array("I")
+        self._cache: Dict[bytes, int] = {}
+        self.max_cache = max_cache
+
+    def append(self, valor: bytes):
+        codigo = self._cache.get(valor)
+        if codigo is None:
+            codigo = len(self.valores.offsets) - 1
+            self.valores.append(valor)
+            if len(self._cache) >= self.max_cache:
+                self._cache.clear()
+            self._cache[valor] = codigo
+        self.ids.append(codigo)
+
+    def __getitem__(self, posicion: int) -> bytes:
+        return self.valores[self.ids[posicion]]
+
+    def __setitem__(self, posicion: int, valor: bytes):
+        self.ids[posicion] = len(self.valores.offsets) - 1
+        self.valores.append(valor)
+
+    def memoria(self) -> int:
+        return self.valores.memoria() + self.ids.itemsize * len(self.ids) + _tamano_dict(self._cache) + _tamano_dict(self._cache)
+
+
+class _ColumnaFija:
+    """Valores binarios de ancho fijo; los de otro ancho se guardan aparte"""
+
+    def __init__(self, ancho: int):
+        self.ancho = ancho
+        self.datos = bytearray()
+        self.excepciones: Dict[int, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self.datos) // self.ancho
+
+    def append(self, valor: bytes):
+        if len(valor) != self.ancho:
+            self.excepciones[len(self)] = valor
+            valor = bytes(self.ancho)
+        self.datos += valor
+
+    def rellenar(self, n: int):
+        """Extiende la columna con ceros hasta tener `n` filas"""
+        if n > len(self):
+            self.datos += bytes(self.ancho * (n - len(self)))
+
+    def insertar(self, posicion: int, valor: bytes):
+        self.excepciones = {(p + 1 if p >= posicion else p): v for p, v in self.excepciones.items()}
+        if len(valor) != self.ancho:
+            self.excepciones[posicion] = valor
+            valor = bytes(self.ancho)
+        self.datos[self.ancho * posicion:self.ancho * posicion] = valor
+
+    def borrar(self, posicion: int):
+        self.excepciones.pop(posicion, None)
+        self.excepciones = {(p - 1 if p > posicion else p): v for p, v in self.excepciones.items()}
+        del self.datos[self.ancho * posicion:self.ancho * (posicion + 1)]
+
+    def __getitem__(self, posicion: int) -> bytes:
+        if self.excepciones and posicion in self.excepciones:
+            return self.excepciones[posicion]
+        return bytes(self.datos[self.ancho * posicion:self.ancho * (posicion + 1)])
+
+    def __setitem__(self, posicion: int, valor: bytes):
+        self.excepciones.pop(posicion, None)
+        if len(valor) != self.ancho:
+            self.excepciones[posicion] = valor
+            valor = bytes(self.ancho)
+        self.datos[self.ancho * posicion:self.ancho * (posicion + 1)] = valor
+
+    def memoria(self) -> int:
+        return len(self.datos) + _tamano_dict(self.excepciones)
+
+
+class _FirmasCommit:
+    """
+    Firmas Ed25519 de los bloques que cierran un commit.
+
+    Solo esas filas tienen firma, así que se guardan dispersas: posiciones
+    ordenadas en un `array`, la firma en una columna de 64 bytes y el id de
+    clave como índice a la tabla (corta) de claves usadas.
+    """
+
+    def __init__(self):
+        self.posiciones = array("I")
+        self.firmas = _ColumnaFija(64)
+        self.claves = array("H")
+        self.ids_clave: List[str] = []
+        self._codigo_clave: Dict[str, int] = {}
+
+    def _codigo(self, clave_id: str) -> int:
+        codigo = self._codigo_clave.get(clave_id)
+        if codigo is None:
+            codigo = self._codigo_clave[clave_id] = len(self.ids_clave)
+            self.ids_clave.append(clave_id)
+        return codigo
+
+    def _buscar(self, posicion: int) -> Tuple[int, bool]:
+        k = bisect.bisect_left(self.posiciones, posicion)
+        return k, k < len(self.posiciones) and self.posiciones[k] == posicion
+
+    def poner(self, posicion: int, clave_id: str, firma: bytes):
+        codigo = self._codigo(clave_id)
+        if not self.posiciones or posicion > self.posiciones[-1]:
+            self.posiciones.append(posicion)
+            self.firmas.append(firma)
+            self.claves.append(codigo)
+            return
+        k, existe = self._buscar(posicion)
+        if existe:
+            self.firmas[k] = firma
+            self.claves[k] = codigo
+        else:
+            self.posiciones.insert(k, posicion)
+            self.firmas.insertar(k, firma)
+            self.claves.insert(k, codigo)
+
+    def quitar(self, posicion: int):
+        k, existe = self._buscar(posicion)
+        if existe:
+            del self.posiciones[k]
+            self.firmas.borrar(k)
+            del self.claves[k]
+
+    def obtener(self, posicion: int) -> Optional[Tuple[str, bytes]]:
+        k, existe = self._buscar(posicion)
+        if not existe:
+            return None
+        return self.ids_clave[self.claves[k]], self.firmas[k]
+
+    def rango(self, desde: int, hasta: int) -> Iterator[Tuple[int, str, bytes]]:
+        """(posición, id de clave, firma) de las filas firmadas en [desde, hasta)"""
+        inicio = bisect.bisect_left(self.posiciones, desde)
+        fin = bisect.bisect_left(self.posiciones, hasta)
+        for k in range(inicio, fin):
+            yield self.posiciones[k], self.ids_clave[self.claves[k]], self.firmas[k]
+
+    def memoria(self) -> int:
+        return (self.posiciones.itemsize * len(self.posiciones) + self.firmas.memoria() +
+                self.claves.itemsize * len(self.claves) + _tamano_lista(self.ids_clave) +
+                _tamano_dict(self._codigo_clave))
+
+
+class AlmacenColumnar:
+    """
+    Almacén de bloques en columnas compactas.
+
+    Timestamp, montos y códigos de tipo viven en `array` (el índice es
+    implícito por posición); las wallets se internan en una tabla y se
+    guardan como enteros; los hashes son digests binarios de ancho fijo y la
+    metadata va a una arena que deduplica valores repetidos. Las firmas
+    Ed25519 (solo en el bloque que cierra cada commit) van en una columna
+    dispersa de 64 bytes; las firmas legadas de 32 bytes en una columna densa
+    que solo crece hasta el último bloque que la usa. El
+    hash_anterior y el nonce solo se guardan cuando no son los esperados
+    (hash del bloque previo y 0). Expone la misma interfaz de secuencia que una lista de
+    BloqueTransaccion (los bloques se materializan al leerlos) y consultas
+    vectorizadas sobre las columnas cuando NumPy está disponible.
+    """
+
+    def __init__(self, primer_indice: int = 1):
+        self.primer_indice = primer_indice
+        self.timestamps = array("d")
+        self.tipos = array("B")
+        self.flags = array("B")
+        self.montos_fc = array("d")
+        self.montos_usd = array("d")
+        self.origenes = array("I")
+        self.destinos = array("I")
+        self.hashes = bytearray()
+        self.firmas = _ColumnaFija(32)
+        self.firmas_commit = _FirmasCommit()
+        self.metadata = _ArenaInternada()
+        self._anteriores: Dict[int, bytes] = {}
+        self._nonces: Dict[int, int] = {}
+        self.wallets: List[str] = []
+        self._id_wallet: Dict[str, int] = {}
+        # Las vistas NumPy exportan el buffer de las columnas: mientras existen
+        # no se puede redimensionar, así que escrituras y consultas se excluyen
+        self._lock = threading.RLock()
+
+    def _internar(self, wallet_id: str) -> int:
+        codigo = self._id_wallet.get(wallet_id)
+        if codigo is None:
+            codigo = self._id_wallet[wallet_id] = len(self.wallets)
+            self.wallets.append(wallet_id)
+        return codigo
+
+    def _hash_previo(self, posicion: int) -> bytes:
+        if posicion == 0:
+            return bytes(32)
+        return bytes(self.hashes[32 * (posicion - 1):32 * posicion])
+
+    # ---------- escritura ----------
+
+    def append(self, bloque: BloqueTransaccion):
+        with self._lock:
+            self._append(bloque)
+
+    def _append(self, bloque: BloqueTransaccion):
+        posicion = len(self.timestamps)
+        if bloque.index != self.primer_indice + posicion:
+            raise ValueError(f"Índice {bloque.index} no consecutivo (esperado {self.primer_indice + posicion})")
+
+        anterior = bytes.fromhex(bloque.hash_anterior)
+        if anterior != self._hash_previo(posicion):
+            self._anteriores[posicion] = anterior
+        self.timestamps.append(bloque.timestamp)
+        self.tipos.append(_CODIGO_TIPO[bloque.tipo])
+        self.flags.append(_flags_bloque(bloque))
+        self.montos_fc.append(bloque.monto_fc)
+        self.montos_usd.append(bloque.monto_usd)
+        if bloque.nonce:
+            self._nonces[posicion] = bloque.nonce
+        self.origenes.append(self._internar(bloque.from_wallet))
+        self.destinos.append(self._internar(bloque.to_wallet))
+        self.hashes += bytes.fromhex(bloque.hash_actual)
+        if bloque.clave_id:
+            self.firmas_commit.poner(posicion, bloque.clave_id, bytes.fromhex(bloque.firma))
+        elif bloque.firma:
+            self.firmas.rellenar(posicion)
+            self.firmas.append(bytes.fromhex(bloque.firma))
+        self.metadata.append(json.dumps(bloque.metadata, separators=(",", ":")).encode())
+
+    def extend(self, bloques: List[BloqueTransaccion]):
+        with self._lock:
+            for k, bloque in enumerate(bloques):
+                if bloque.index != self.primer_indice + len(self) + k:
+                    raise ValueError(f"Índice {bloque.index} no consecutivo (esperado {self.primer_indice + len(self) + k})")
+            for bloque in bloques:
+                self._append(bloque)
+
+    def __setitem__(self, posicion: int, bloque: BloqueTransaccion):
+        """Sustituye un bloque en su posición (auditorías y pruebas de manipulación)"""
+        with self._lock:
+            self._reemplazar(posicion, bloque)
+
+    def firmar(self, posicion: int, clave_id: str, firma: str):
+        """Añade la firma de commit a un bloque ya anexado (cierre de group commit)"""
+        with self._lock:
+            self.firmas_commit.poner(posicion, clave_id, bytes.fromhex(firma))
+            self.flags[posicion] = (self.flags[posicion] | _FLAG_CLAVE) & ~_FLAG_SIN_FIRMA
+
+    def _reemplazar(self, posicion: int, bloque: BloqueTransaccion):
+        if posicion < 0:
+            posicion += len(self)
+        if bloque.index != self.primer_indice + posicion:
+            raise ValueError("El índice del bloque no corresponde a la posición")
+        anterior = bytes.fromhex(bloque.hash_anterior)
+        if anterior != self._hash_previo(posicion):
+            self._anteriores[posicion] = anterior
+        else:
+            self._anteriores.pop(posicion, None)
+        # El siguiente bloque conserva su hash_anterior aunque cambie este hash
+        if posicion + 1 < len(self) and posicion + 1 not in self._anteriores:
+            self._anteriores[posicion + 1] = bytes(self.hashes[32 * posicion:32 * (posicion + 1)])
+        self.timestamps[posicion] = bloque.timestamp
+        self.tipos[posicion] = _CODIGO_TIPO[bloque.tipo]
+        self.flags[posicion] = _flags_bloque(bloque)
+        self.montos_fc[posicion] = bloque.monto_fc
+        self.montos_usd[posicion] = bloque.monto_usd
+        if bloque.nonce:
+            self._nonces[posicion] = bloque.nonce
+        else:
+            self._nonces.pop(posicion, None)
+        self.origenes[posicion] = self._internar(bloque.from_wallet)
+        self.destinos[posicion] = self._internar(bloque.to_wallet)
+        self.hashes[32 * posicion:32 * (posicion + 1)] = bytes.fromhex(bloque.hash_actual)
+        if bloque.clave_id:
+            self.firmas_commit.poner(posicion, bloque.clave_id, bytes.fromhex(bloque.firma))
+        else:
+            self.firmas_commit.quitar(posicion)
+        if bloque.firma and not bloque.clave_id:
+            self.firmas.rellenar(posicion + 1)
+            self.firmas[posicion] = bytes.fromhex(bloque.firma)
+        elif posicion < len(self.firmas):
+            self.firmas[posicion] = bytes(32)
+        self.metadata[posicion] = json.dumps(bloque.metadata, separators=(",", ":")).encode()
+
+    # ---------- lectura ----------
+
+    def leer(self, posicion: int) -> BloqueTransaccion:
+        flags = self.flags[posicion]
+        monto_fc = self.montos_fc[posicion]
+        monto_usd = self.montos_usd[posicion]
+        if flags & _FLAG_FC_ENTERO:
+            monto_fc = int(monto_fc)
+        if flags & _FLAG_USD_ENTERO:
+            monto_usd = int(monto_usd)
+        anterior = self._anteriores.get(posicion)
+        if anterior is None:
+            anterior = self._hash_previo(posicion)
+        clave_id, firma = "", ""
+        if flags & _FLAG_CLAVE:
+            clave_id, binaria = self.firmas_commit.obtener(posicion)
+            firma = binaria.hex()
+        elif not flags & _FLAG_SIN_FIRMA:
+            firma = self.firmas[posicion].hex()
+        return BloqueTransaccion(
+            index=self.primer_indice + posicion,
+            timestamp=self.timestamps[posicion],
+            tipo=_TIPOS[self.tipos[posicion]],
+            from_wallet=self.wallets[self.origenes[posicion]],
+            to_wallet=self.wallets[self.destinos[posicion]],
+            monto_fc=monto_fc,
+            monto_usd=monto_usd,
+            hash_anterior=anterior.hex(),
+            hash_actual=self.hashes[32 * posicion:32 * (posicion + 1)].hex(),
+            firma=firma,
+            metadata=json.loads(self.metadata[posicion]),
+            nonce=self._nonces.get(posicion, 0),
+            version=(flags >> _FLAG_VERSION_BIT) or VERSION_LEGADO,
+            clave_id=clave_id
+        )
+
+    def hash_bloque(self, posicion: int) -> bytes:
+        """hash_actual binario de un bloque, sin materializarlo"""
+        return bytes(self.hashes[32 * posicion:32 * (posicion + 1)])
+
+    def timestamp_bloque(self, posicion: int) -> float:
+        return self.timestamps[posicion]
+
+    def firmados(self, desde: int = 0, hasta: Optional[int] = None) -> List[Tuple[int, str, str, str]]:
+        """(posición, hash, id de clave, firma) de los bloques con firma Ed25519 en [desde, hasta)"""
+        hasta = len(self) if hasta is None else min(hasta, len(self))
+        return [(p, self.hashes[32 * p:32 * (p + 1)].hex(), clave_id, firma.hex())
+                for p, clave_id, firma in self.firmas_commit.rango(desde, hasta)]
+
+    def iterar(self, desde: int = 0, hasta: Optional[int] = None) -> Iterator[BloqueTransaccion]:
+        hasta = len(self) if hasta is None else min(hasta, len(self))
+        for posicion in range(desde, hasta):
+            yield self.leer(posicion)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, posicion):
+        if isinstance(posicion, slice):
+            return [self.leer(i) for i in range(*posicion.indices(len(self)))]
+        if posicion < 0:
+            posicion += len(self)
+        if not 0 <= posicion < len(self):
+            raise IndexError("bloque fuera de rango")
+        return self.leer(posicion)
+
+    def __iter__(self) -> Iterator[BloqueTransaccion]:
+        return self.iterar()
+
+    @property
+    def ultimo_hash(self) -> str:
+        return self.hashes[-32:].hex() if self.hashes else "0" * 64
+
+    def columnas_rango(self, desde: int, hasta: int) -> "AlmacenColumnar":
+        """
+        Subalmacén autónomo con las posiciones [desde, hasta): copias de las
+        columnas de ese tramo (`array` y bytearray) y solo las wallets,
+        metadatas y firmas que usa, en dicts código -> valor. Se serializa
+        barato para enviarlo a otro proceso, que lee los bloques con `iterar()`.
+        """
+        with self._lock:
+            hasta = min(hasta, len(self))
+            sub = AlmacenColumnar(self.primer_indice + desde)
+            for nombre in ("timestamps", "tipos", "flags", "montos_fc", "montos_usd", "origenes", "destinos"):
+                setattr(sub, nombre, getattr(self, nombre)[desde:hasta])
+            sub.wallets = {c: self.wallets[c] for c in set(sub.origenes).union(sub.destinos)}
+            sub.hashes = self.hashes[32 * desde:32 * hasta]
+            sub._anteriores = {p - desde: h for p, h in self._anteriores.items() if desde <= p < hasta}
+            if desde and hasta > desde and 0 not in sub._anteriores:
+                sub._anteriores[0] = self._hash_previo(desde)
+            sub._nonces = {p - desde: n for p, n in self._nonces.items() if desde <= p < hasta}
+            sub.firmas.datos = self.firmas.datos[32 * desde:32 * hasta]
+            sub.firmas.excepciones = {p - desde: v for p, v in self.firmas.excepciones.items()
+                                      if desde <= p < hasta}
+            for p, clave_id, firma in self.firmas_commit.rango(desde, hasta):
+                sub.firmas_commit.poner(p - desde, clave_id, firma)
+            sub.metadata.ids = self.metadata.ids[desde:hasta]
+            sub.metadata.valores = {c: self.metadata.valores[c] for c in set(sub.metadata.ids)}
+        return sub
+
+    def __getstate__(self) -> Dict:
+        estado = dict(self.__dict__)
+        del estado["_lock"]
+        return estado
+
+    def __setstate__(self, estado: Dict):
+        self.__dict__.update(estado)
+        self._lock = threading.RLock()
+
+    def memoria(self) -> int:
+        """Bytes ocupados por columnas, arenas, firmas, excepciones y tabla de wallets"""
+        columnas = (self.timestamps, self.tipos, self.flags, self.montos_fc, self.montos_usd,
+                    self.origenes, self.destinos)
+        return (sum(c.itemsize * len(c) for c in columnas) + len(self.hashes) +
+                self.firmas.memoria() + self.firmas_commit.memoria() + self.metadata.memoria() +
+                _tamano_dict(self._anteriores) + _tamano_dict(self._nonces) +
+                _tamano_lista(self.wallets) + _tamano_dict(self._id_wallet))
+
+    # ---------- consultas vectorizadas ----------
+
+    def rango_tiempo(self, desde_ts: Optional[float] = None,
+                     hasta_ts: Optional[float] = None) -> Tuple[int, int]:
+        """Posiciones [inicio, fin) con desde_ts <= timestamp <= hasta_ts (búsqueda binaria)"""
+        inicio = 0 if desde_ts is None else bisect.bisect_left(self.timestamps, desde_ts)
+        fin = len(self) if hasta_ts is None else bisect.bisect_right(self.timestamps, hasta_ts)
+        return inicio, max(inicio, fin)
+
+    def _mascara(self, inicio: int, fin: int, tipo: Optional[TipoTransaccion],
+                 wallet: Optional[str]):
+        mascara = np.ones(fin - inicio, dtype=bool)
+        if tipo is not None:
+            mascara &= np.frombuffer(self.tipos, dtype=np.uint8)[inicio:fin] == _CODIGO_TIPO[tipo]
+        if wallet is not None:
+            codigo = self._id_wallet.get(wallet)
+            if codigo is None:
+                return np.zeros(fin - inicio, dtype=bool)
+            origenes = np.frombuffer(self.origenes, dtype=np.uint32)[inicio:fin]
+            destinos = np.frombuffer(self.destinos, dtype=np.uint32)[inicio:fin]
+            mascara &= (origenes == codigo) | (destinos == codigo)
+        return mascara
+
+    def _coincide(self, posicion: int, tipo: Optional[TipoTransaccion], wallet: Optional[str]) -> bool:
+        if tipo is not None and self.tipos[posicion] != _CODIGO_TIPO[tipo]:
+            return False
+        if wallet is not None:
+            codigo = self._id_wallet.get(wallet)
+            return codigo is not None and codigo in (self.origenes[posicion], self.destinos[posicion])
+        return True
+
+    def posiciones(self, tipo: Optional[TipoTransaccion] = None, wallet: Optional[str] = None,
+                   desde_ts: Optional[float] = None, hasta_ts: Optional[float] = None) -> List[int]:
+        """Posiciones de los bloques que cumplen el filtro"""
+        inicio, fin = self.rango_tiempo(desde_ts, hasta_ts)
+        if tipo is None and wallet is None:
+            return list(range(inicio, fin))
+        if NUMPY_AVAILABLE:
+            with self._lock:
+                return (np.flatnonzero(self._mascara(inicio, fin, tipo, wallet)) + inicio).tolist()
+        return [p for p in range(inicio, fin) if self._coincide(p, tipo, wallet)]
+
+    def suma(self, columna: str = "monto_fc", tipo: Optional[TipoTransaccion] = None,
+             wallet: Optional[str] = None, desde_ts: Optional[float] = None,
+             hasta_ts: Optional[float] = None) -> float:
+        """Suma de `monto_fc` o `monto_usd` sobre los bloques que cumplen el filtro"""
+        valores = self.montos_fc if columna == "monto_fc" else self.montos_usd
+        inicio, fin = self.rango_tiempo(desde_ts, hasta_ts)
+        if NUMPY_AVAILABLE:
+            with self._lock:
+                vista = np.frombuffer(valores, dtype=np.float64)[inicio:fin]
+                if tipo is not None or wallet is not None:
+                    vista = vista[self._mascara(inicio, fin, tipo, wallet)]
+                total = float(vista.sum())
+                del vista
+                return total
+        return sum(valores[p] for p in range(inicio, fin) if self._coincide(p, tipo, wallet))
+
+# ==================== FIRMAS ====================
+
+def _mensaje_firma(clave_id: str, hash_bloque: str) -> bytes:
+    return b"ORION/BLOQUE/1" + bytes.fromhex(clave_id) + bytes.fromhex(hash_bloque)
+
+
+class ClavesFirma:
+    """
+    Claves Ed25519 de la tesorería.
+
+    La clave activa firma el último bloque de cada commit; como ese hash
+    encadena a todos los anteriores, una firma cubre el lote entero. Cada
+    firma lleva el id de su clave (8 bytes del sha256 de la pública) y las
+    públicas de todas las claves usadas se conservan, así que rotar la
+    clave no invalida lo firmado antes. La privada viene del parámetro
+    (semilla de 32 bytes) o de ORION_CLAVE_FIRMA (hex).
+    """
+
+    def __init__(self, clave: Optional[bytes] = None, ruta: Optional[str] = None):
+        if clave is None and os.environ.get("ORION_CLAVE_FIRMA"):
+            clave = bytes.fromhex(os.environ["ORION_CLAVE_FIRMA"])
+        if clave is None:
+            clave = os.urandom(32)
+            if ruta:
+                logger.warning("⚠️ Sin clave de firma: se usa una clave efímera (su pública queda registrada)")
+        self.ruta = ruta
+        self.publicas: Dict[str, bytes] = {}
+        if ruta and os.path.exists(ruta):
+            with open(ruta, "r") as f:
+                self.publicas = {k: bytes.fromhex(v) for k, v in json.load(f).items()}
+        self._activar(clave)
+
+    @staticmethod
+    def id_de(publica: bytes) -> str:
+        return hashlib.sha256(publica).digest()[:8].hex()
+
+    def _activar(self, clave: bytes):
+        from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+        self._privada = Ed25519PrivateKey.from_private_bytes(clave)
+        publica = self._privada.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        self.clave_id = self.id_de(publica)
+        if self.clave_id not in self.publicas:
+            self.publicas[self.clave_id] = publica
+            self._guardar()
+
+    def _guardar(self):
+        if not self.ruta:
+            return
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w") as f:
+            json.dump({k: v.hex() for k, v in self.publicas.items()}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta)
+
+    def rotar(self, clave: Optional[bytes] = None) -> str:
+        """Activa una clave nueva (o la dada); las anteriores siguen verificando"""
+        self._activar(clave or os.urandom(32))
+        logger.info(f"🔑 Clave de firma rotada: {self.clave_id}")
+        return self.clave_id
+
+    def firmar(self, hash_bloque: str) -> str:
+        return self._privada.sign(_mensaje_firma(self.clave_id, hash_bloque)).hex()
+
+    def firmar_bloque(self, bloque: BloqueTransaccion):
+        """Firma el bloque con la clave activa"""
+        bloque.clave_id = self.clave_id
+        bloque.firma = self.firmar(bloque.hash_actual)
+
+
+# ==================== VERIFICACIÓN PARALELA ====================
+
+def _bloques_de_segmento(ruta: str, byte_inicio: int, byte_fin: int) -> Iterator[BloqueTransaccion]:
+    """Decodifica los registros de [byte_inicio, byte_fin) mapeando solo ese tramo del segmento"""
+    base = byte_inicio - byte_inicio % mmap.ALLOCATIONGRANULARITY
+    with open(ruta, "rb") as f:
+        mapa = mmap.mmap(f.fileno(), byte_fin - base, access=mmap.ACCESS_READ, offset=base)
+    try:
+        pos, fin = byte_inicio - base, byte_fin - base
+        while pos < fin:
+            longitud, _ = _CABECERA_REGISTRO.unpack_from(mapa, pos)
+            pos += _CABECERA_REGISTRO.size
+            yield _deserializar_bloque(mapa, pos)
+            pos += longitud
+    finally:
+        mapa.close()
+
+
+def _bloques_de_archivo(ruta: str, tramo_desde: int, tramo_hasta: int,
+                        inicio: int, fin: int) -> Iterator[BloqueTransaccion]:
+    """Bloques de las posiciones [inicio, fin) descomprimiendo solo sus tramos del archivo frío"""
+    archivo = _SegmentoArchivado(ruta)
+    for k in range(tramo_desde, tramo_hasta):
+        datos, offsets = archivo._descomprimir(k)
+        for offset in offsets:
+            bloque = _deserializar_bloque(datos, offset)
+            if inicio < bloque.index <= fin:
+                yield bloque
+
+
+def _bloques_de_tarea(tarea: Tuple) -> Tuple[int, Iterator[BloqueTransaccion]]:
+    """
+    (posición inicial, bloques) de una tarea de verificación:
+    ("columnas", inicio, subalmacén), ("bloques", inicio, lista) o uno de
+    los rangos físicos de `RegistroSegmentos.rangos_fisicos`.
+    """
+    tipo, inicio = tarea[0], tarea[1]
+    if tipo == "columnas":
+        return inicio, tarea[2].iterar()
+    if tipo == "bloques":
+        return inicio, iter(tarea[2])
+    if tipo == "segmento":
+        return inicio, _bloques_de_segmento(*tarea[2:])
+    _, _, ruta, tramo_desde, tramo_hasta, fin = tarea
+    return inicio, _bloques_de_archivo(ruta, tramo_desde, tramo_hasta, inicio, fin)
+
+
+def _tareas_lectura(transacciones, inicio: int, total: int, tamano_rango: int) -> Iterator[Tuple]:
+    """Tareas autocontenidas para leer [inicio, total) en otro proceso sin reabrir el ledger"""
+    if isinstance(transacciones, RegistroSegmentos):
+        yield from transacciones.rangos_fisicos(inicio, total, tamano_rango)
+        return
+    columnar = isinstance(transacciones, AlmacenColumnar)
+    for desde in range(inicio, total, tamano_rango):
+        hasta = min(desde + tamano_rango, total)
+        if columnar:
+            yield ("columnas", desde, transacciones.columnas_rango(desde, hasta))
+        else:
+            yield ("bloques", desde, transacciones[desde:hasta])
+
+
+def _verificar_rango(tarea: Tuple) -> Tuple[int, str, str, List[str]]:
+    """
+    Verifica un rango contiguo en un proceso del pool.
+
+    `tarea` es una de las de `_tareas_lectura`: el proceso recibe las
+    columnas del rango o su ubicación física en disco, nunca el ledger.
+    Devuelve el hash_anterior del primer bloque y el hash del último para
+    que el proceso padre cosa los enlaces entre rangos.
+    """
+    inicio, bloques = _bloques_de_tarea(tarea)
+    errores = []
+    primer_anterior = None
+    hash_anterior = None
+    for i, bloque in enumerate(bloques, start=inicio):
+        if calcular_hash(bloque) != bloque.hash_actual:
+            errores.append(f"Hash inválido en bloque {i}")
+        if hash_anterior is None:
+            primer_anterior = bloque.hash_anterior
+        elif bloque.hash_anterior != hash_anterior:
+            errores.append(f"Encadenamiento roto en bloque {i}")
+        hash_anterior = bloque.hash_actual
+    return inicio, primer_anterior, hash_anterior, errores
+
+
+def verificar_cadena_paralela(transacciones, inicio: int = 0, hash_inicial: str = "0" * 64,
+                              procesos: Optional[int] = None,
+                              tamano_rango: Optional[int] = None) -> List[str]:
+    """
+    Verifica la cadena repartiendo rangos contiguos en un pool de procesos.
+
+    Acepta una lista de bloques, un AlmacenColumnar (cada proceso recibe las
+    columnas de su rango) o un RegistroSegmentos (cada proceso mapea solo su
+    tramo de segmento). Devuelve la misma lista de errores, en el mismo
+    orden, que la verificación secuencial.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    procesos = procesos or os.cpu_count() or 1
+    total = len(transacciones)
+    if total <= inicio:
+        return []
+    if tamano_rango is None:
+        # Varios rangos por proceso para equilibrar la carga
+        tamano_rango = max(1000, -(-(total - inicio) // (procesos * 4)))
+    
+    errores = []
+    hash_anterior = hash_inicial
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        tareas = _tareas_lectura(transacciones, inicio, total, tamano_rango)
+        for desde, primer_anterior, ultimo_hash, errores_rango in pool.map(_verificar_rango, tareas):
+            # Coser el enlace con el rango previo, tras el error de hash del bloque si lo hay
+            if primer_anterior != hash_anterior:
+                pos = 1 if errores_rango[:1] == [f"Hash inválido en bloque {desde}"] else 0
+                errores_rango.insert(pos, f"Encadenamiento roto en bloque {desde}")
+            errores.extend(errores_rango)
+            hash_anterior = ultimo_hash
+    return errores
+
+
+def _verificar_firmas(tarea: Tuple) -> Tuple[int, int, List[str]]:
+    """
+    Verifica las firmas Ed25519 de un rango en un proceso del pool.
+
+    `tarea` es (publicas, firmados) con tuplas (posición, hash, clave, firma)
+    ya extraídas, o (publicas, rango) con un rango físico del registro en
+    disco. Devuelve cuántas firmas hay, la posición de la última firmada
+    (-1 si ninguna) y los errores.
+    """
+    publicas, firmados = tarea
+    if firmados and isinstance(firmados[0], str):
+        inicio, bloques = _bloques_de_tarea(firmados)
+        firmados = ((i, b.hash_actual, b.clave_id, b.firma)
+                    for i, b in enumerate(bloques, start=inicio) if b.clave_id)
+    
+    claves = {}
+    errores = []
+    n = 0
+    ultima = -1
+    for posicion, hash_bloque, clave_id, firma in firmados:
+        n += 1
+        ultima = posicion
+        clave = claves.get(clave_id)
+        if clave is None and clave_id in publicas:
+            clave = claves[clave_id] = Ed25519PublicKey.from_public_bytes(publicas[clave_id])
+        if clave is None:
+            errores.append(f"Clave desconocida {clave_id} en bloque {posicion}")
+            continue
+        try:
+            clave.verify(bytes.fromhex(firma), _mensaje_firma(clave_id, hash_bloque))
+        except (InvalidSignature, ValueError):
+            errores.append(f"Firma inválida en bloque {posicion}")
+    return n, ultima, errores
+
+
+def verificar_firmas_paralela(transacciones, publicas: Dict[str, bytes], inicio: int = 0,
+                              procesos: Optional[int] = None,
+                              tamano_rango: Optional[int] = None) -> Tuple[int, int, List[str]]:
+    """
+    Verifica en un pool de procesos las firmas Ed25519 de la cadena.
+
+    Devuelve (firmas verificadas, posición de la última firmada, errores en
+    orden de cadena). Los bloques posteriores a la última firma no están
+    cubiertos por ninguna.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    procesos = procesos or os.cpu_count() or 1
+    total = len(transacciones)
+    if total <= inicio:
+        return 0, -1, []
+    if tamano_rango is None:
+        tamano_rango = max(10000, -(-(total - inicio) // (procesos * 4)))
+    
+    def tareas():
+        if isinstance(transacciones, RegistroSegmentos):
+            for rango in transacciones.rangos_fisicos(inicio, total, tamano_rango):
+                yield (publicas, rango)
+            return
+        for desde in range(inicio, total, tamano_rango):
+            yield (publicas, transacciones.firmados(desde, min(desde + tamano_rango, total)))
+    
+    firmas = 0
+    ultima = -1
+    errores = []
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        for n, ultima_rango, errores_rango in pool.map(_verificar_firmas, tareas()):
+            firmas += n
+            ultima = max(ultima, ultima_rango)
+            errores.extend(errores_rango)
+    return firmas, ultima, errores
+
+
+# ==================== ÁRBOL MERKLE ====================
+
+def _hoja_merkle(hash_bloque: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + hash_bloque).digest()
+
+
+def _nodo_merkle(izquierdo: bytes, derecho: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + izquierdo + derecho).digest()
+
+
+class ArbolMerkle:
+    """
+    Árbol Merkle incremental sobre los hashes de los bloques.
+
+    Sigue la construcción de RFC 6962 (prefijos 0x00/0x01 para hojas y nodos,
+    el subárbol izquierdo siempre es completo), así que cada rango alineado
+    de `tamano_rango` bloques es un subárbol completo y su raíz es un nodo
+    más del árbol global. Solo se guardan los nodos de altura >= nivel_base;
+    los de debajo se recalculan desde los hashes de bloque (`hash_bloque`)
+    al generar una prueba, lo que deja el árbol en ~4 bytes por bloque.
+    """
+
+    def __init__(self, hash_bloque, nivel_base: int = 4, tamano_rango: int = 1024):
+        if tamano_rango & (tamano_rango - 1) or tamano_rango < (1 << nivel_base):
+            raise ValueError("tamano_rango debe ser potencia de 2 y >= 2^nivel_base")
+        self._hash_bloque = hash_bloque
+        self.nivel_base = nivel_base
+        self.nivel_rango = tamano_rango.bit_length() - 1
+        self.tamano_rango = tamano_rango
+        # niveles[j] = nodos completos de altura nivel_base + j, concatenados
+        self.niveles: List[bytearray] = []
+        # Hojas del grupo base aún incompleto
+        self._pendientes: List[bytes] = []
+        self.tamano = 0
+        self._ultima_raiz: Tuple[int, bytes] = (-1, b"")
+
+    # ---------- construcción ----------
+
+    def agregar(self, hash_bloque: bytes):
+        self._pendientes.append(_hoja_merkle(hash_bloque))
+        self.tamano += 1
+        if len(self._pendientes) == 1 << self.nivel_base:
+            nodo = self._perfecto(self._pendientes)
+            self._pendientes = []
+            nivel = 0
+            while True:
+                if nivel == len(self.niveles):
+                    self.niveles.append(bytearray())
+                fila = self.niveles[nivel]
+                fila += nodo
+                if len(fila) // 32 % 2:
+                    break
+                nodo = _nodo_merkle(bytes(fila[-64:-32]), bytes(fila[-32:]))
+                nivel += 1
+
+    @staticmethod
+    def _perfecto(hojas: List[bytes]) -> bytes:
+        while len(hojas) > 1:
+            hojas = [_nodo_merkle(hojas[i], hojas[i + 1]) for i in range(0, len(hojas), 2)]
+        return hojas[0]
+
+    # ---------- consulta ----------
+
+    def _hojas(self, desde: int, hasta: int) -> List[bytes]:
+        inicio_pendientes = self.tamano - len(self._pendientes)
+        return [self._pendientes[p - inicio_pendientes] if p >= inicio_pendientes
+                else _hoja_merkle(self._hash_bloque(p)) for p in range(desde, hasta)]
+
+    def _subarbol(self, inicio: int, n: int) -> bytes:
+        """Hash RFC 6962 de las hojas [inicio, inicio + n)"""
+        if n & (n - 1) == 0:
+            altura = n.bit_length() - 1
+            if altura >= self.nivel_base:
+                fila = self.niveles[altura - self.nivel_base]
+                q = inicio >> altura
+                return bytes(fila[32 * q:32 * (q + 1)])
+            return self._perfecto(self._hojas(inicio, inicio + n))
+        k = 1 << (n - 1).bit_length() - 1
+        return _nodo_merkle(self._subarbol(inicio, k), self._subarbol(inicio + k, n - k))
+
+    def raiz(self, tamano: Optional[int] = None) -> bytes:
+        """Raíz del árbol con los primeros `tamano` bloques (por defecto, todos)"""
+        tamano = self.tamano if tamano is None else tamano
+        if not 0 <= tamano <= self.tamano:
+            raise ValueError("tamaño de árbol fuera de rango")
+        if tamano == 0:
+            return hashlib.sha256(b"").digest()
+        if self._ultima_raiz[0] == tamano:
+            return self._ultima_raiz[1]
+        raiz = self._subarbol(0, tamano)
+        if tamano == self.tamano:
+            self._ultima_raiz = (tamano, raiz)
+        return raiz
+
+    def raiz_rango(self, numero: int) -> Optional[bytes]:
+        """Raíz del rango `numero` de bloques, o None si aún no está completo"""
+        if numero < 0 or (numero + 1) * self.tamano_rango > self.tamano:
+            return None
+        return self._subarbol(numero * self.tamano_rango, self.tamano_rango)
+
+    def ruta(self, posicion: int, tamano: Optional[int] = None) -> List[bytes]:
+        """Ruta de auditoría (hermanos de la hoja a la raíz) de una posición"""
+        tamano = self.tamano if tamano is None else tamano
+        if not 0 <= posicion < tamano <= self.tamano:
+            raise ValueError("posición fuera del árbol")
+        ruta = []
+        inicio, n = 0, tamano
+        while n > 1:
+            if n == 1 << self.nivel_base:
+                # Grupo base completo: sus hojas se leen una sola vez
+                fila = self._hojas(inicio, inicio + n)
+                q = posicion - inicio
+                inferior = []
+                while len(fila) > 1:
+                    inferior.append(fila[q ^ 1])
+                    fila = [_nodo_merkle(fila[i], fila[i + 1]) for i in range(0, len(fila), 2)]
+                    q >>= 1
+                ruta.reverse()
+                return inferior + ruta
+            k = 1 << (n - 1).bit_length() - 1
+            if posicion - inicio < k:
+                ruta.append(self._subarbol(inicio + k, n - k))
+                n = k
+            else:
+                ruta.append(self._subarbol(inicio, k))
+                inicio, n = inicio + k, n - k
+        ruta.reverse()
+        return ruta
+
+    def memoria(self) -> int:
+        return sum(len(fila) for fila in self.niveles) + 32 * len(self._pendientes)
+
+
+def verificar_prueba_inclusion(prueba: Dict, bloque: Optional[BloqueTransaccion] = None,
+                               raiz: Optional[str] = None) -> bool:
+    """
+    Verifica una prueba de `OrionTreasury.prueba_inclusion` sin acceso a la cadena.
+
+    Con `bloque`, comprueba además que su contenido produce el hash probado;
+    con `raiz`, que la prueba llega a esa raíz de confianza (p. ej. una raíz
+    publicada) en lugar de a la que trae la propia prueba. Si la prueba
+    incluye la raíz de su rango, también se comprueba el paso intermedio.
+    """
+    try:
+        m, n = prueba["indice"] - 1, prueba["tamano"]
+        if not 0 <= m < n:
+            return False
+        if bloque is not None and (bloque.index != prueba["indice"] or
+                                   calcular_hash(bloque) != prueba["hash_bloque"]):
+            return False
+        rango = prueba.get("rango")
+        actual = _hoja_merkle(bytes.fromhex(prueba["hash_bloque"]))
+        fn, sn = m, n - 1
+        for paso, hermano in enumerate(prueba["ruta"]):
+            if rango and paso == rango["altura"] and actual.hex() != rango["raiz"]:
+                return False
+            hermano = bytes.fromhex(hermano)
+            if sn == 0:
+                return False
+            if fn & 1 or fn == sn:
+                actual = _nodo_merkle(hermano, actual)
+                while not fn & 1 and fn:
+                    fn >>= 1
+                    sn >>= 1
+            else:
+                actual = _nodo_merkle(actual, hermano)
+            fn >>= 1
+            sn >>= 1
+        if sn != 0:
+            return False
+        if rango and rango["altura"] == len(prueba["ruta"]) and actual.hex() != rango["raiz"]:
+            return False
+        return hmac.compare_digest(actual.hex(), raiz if raiz is not None else prueba["raiz"])
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+# ==================== EXPORTACIÓN COLUMNAR ====================
+
+VERSION_ESQUEMA_EXPORTACION = 1
+
+
+def esquema_exportacion() -> "pa.Schema":
+    """Esquema estable de las exportaciones (cambios incompatibles suben la versión)"""
+    return pa.schema([
+        ("index", pa.uint64()),
+        ("timestamp", pa.float64()),
+        ("fecha", pa.timestamp("us", tz="UTC")),
+        ("tipo", pa.string()),
+        ("from_wallet", pa.string()),
+        ("to_wallet", pa.string()),
+        ("monto_fc", pa.float64()),
+        ("monto_usd", pa.float64()),
+        ("hash_anterior", pa.binary(32)),
+        ("hash_actual", pa.binary(32)),
+        ("firma", pa.binary()),
+        ("clave_id", pa.string()),
+        ("metadata", pa.string()),
+        ("nonce", pa.int64()),
+        ("version", pa.uint8()),
+    ], metadata={b"orion.esquema": str(VERSION_ESQUEMA_EXPORTACION).encode()})
+
+
+class ExportadorLedger:
+    """
+    Exporta la cadena a archivos columnares (Parquet o Arrow IPC) por tramos.
+
+    Se leen y escriben lotes de `filas_por_lote` bloques, así que la memoria
+    no depende del tamaño del ledger. Cada ejecución exporta solo lo añadido
+    desde la anterior: un manifiesto guarda los archivos, el número de bloques
+    exportados y el hash del último, y se rechaza una cadena que no
+    corresponde. Los archivos Arrow sin compresión se cargan con mmap sin
+    copiar datos.
+    """
+
+    MANIFIESTO = "manifiesto.json"
+
+    def __init__(self, directorio: str, formato: str = "parquet",
+                 filas_por_archivo: int = 1_000_000, filas_por_lote: int = 65536,
+                 compresion: Optional[str] = None):
+        if not ARROW_AVAILABLE:
+            raise ImportError("La exportación columnar requiere pyarrow")
+        if formato not in ("parquet", "arrow"):
+            raise ValueError("formato debe ser 'parquet' o 'arrow'")
+        self.directorio = directorio
+        self.formato = formato
+        self.filas_por_archivo = filas_por_archivo
+        self.filas_por_lote = filas_por_lote
+        # Parquet comprime por defecto; Arrow sin comprimir para poder mapear sin copia
+        self.compresion = compresion if compresion is not None else ("zstd" if formato == "parquet" else None)
+        self.esquema = esquema_exportacion()
+        os.makedirs(directorio, exist_ok=True)
+        self.manifiesto = self._leer_manifiesto()
+
+    def _leer_manifiesto(self) -> Dict:
+        ruta = os.path.join(self.directorio, self.MANIFIESTO)
+        if not os.path.exists(ruta):
+            return {"esquema": VERSION_ESQUEMA_EXPORTACION, "formato": self.formato,
+                    "bloques": 0, "ultimo_hash": "0" * 64, "archivos": []}
+        with open(ruta, "r") as f:
+            manifiesto = json.load(f)
+        if manifiesto["esquema"] != VERSION_ESQUEMA_EXPORTACION or manifiesto["formato"] != self.formato:
+            raise ValueError("La exportación existente usa otro esquema o formato")
+        return manifiesto
+
+    def _guardar_manifiesto(self):
+        ruta = os.path.join(self.directorio, self.MANIFIESTO)
+        with open(ruta + ".tmp", "w") as f:
+            json.dump(self.manifiesto, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta + ".tmp", ruta)
+
+    def _lote(self, bloques: List[BloqueTransaccion]) -> "pa.RecordBatch":
+        return pa.record_batch([
+            pa.array([b.index for b in bloques], pa.uint64()),
+            pa.array([b.timestamp for b in bloques], pa.float64()),
+            pa.array([int(b.timestamp * 1_000_000) for b in bloques], pa.int64()).cast(
+                pa.timestamp("us", tz="UTC")),
+            pa.array([b.tipo.value for b in bloques], pa.string()),
+            pa.array([b.from_wallet for b in bloques], pa.string()),
+            pa.array([b.to_wallet for b in bloques], pa.string()),
+            pa.array([float(b.monto_fc) for b in bloques], pa.float64()),
+            pa.array([float(b.monto_usd) for b in bloques], pa.float64()),
+            pa.array([bytes.fromhex(b.hash_anterior) for b in bloques], pa.binary(32)),
+            pa.array([bytes.fromhex(b.hash_actual) for b in bloques], pa.binary(32)),
+            pa.array([bytes.fromhex(b.firma) for b in bloques], pa.binary()),
+            pa.array([b.clave_id for b in bloques], pa.string()),
+            pa.array([json.dumps(b.metadata, separators=(",", ":")) for b in bloques], pa.string()),
+            pa.array([b.nonce for b in bloques], pa.int64()),
+            pa.array([b.version for b in bloques], pa.uint8()),
+        ], schema=self.esquema)
+
+    def _escribir(self, transacciones, desde: int, hasta: int) -> str:
+        nombre = f"bloques_{desde + 1:012d}.{self.formato}"
+        ruta = os.path.join(self.directorio, nombre)
+        if self.formato == "parquet":
+            escritor = pq.ParquetWriter(ruta + ".tmp", self.esquema, compression=self.compresion or "none")
+            escribir = escritor.write_batch
+        else:
+            sumidero = pa.OSFile(ruta + ".tmp", "wb")
+            escritor = pa.ipc.new_file(sumidero, self.esquema,
+                                       options=pa.ipc.IpcWriteOptions(compression=self.compresion))
+            escribir = escritor.write_batch
+        try:
+            lote = []
+            for bloque in transacciones.iterar(desde, hasta):
+                lote.append(bloque)
+                if len(lote) >= self.filas_por_lote:
+                    escribir(self._lote(lote))
+                    lote = []
+            if lote:
+                escribir(self._lote(lote))
+        finally:
+            escritor.close()
+            if self.formato == "arrow":
+                sumidero.close()
+        os.replace(ruta + ".tmp", ruta)
+        return nombre
+
+    def exportar(self, transacciones) -> Dict:
+        """Exporta los bloques posteriores a la última exportación"""
+        total = len(transacciones)
+        exportados = self.manifiesto["bloques"]
+        if exportados > total or (exportados and
+                                  transacciones.hash_bloque(exportados - 1).hex() != self.manifiesto["ultimo_hash"]):
+            raise ValueError("La cadena no corresponde con la exportación previa")
+        
+        archivos = []
+        for desde in range(exportados, total, self.filas_por_archivo):
+            hasta = min(desde + self.filas_por_archivo, total)
+            nombre = self._escribir(transacciones, desde, hasta)
+            # El manifiesto avanza archivo a archivo: una exportación cortada se reanuda
+            self.manifiesto["archivos"].append({"archivo": nombre, "desde": desde + 1, "hasta": hasta})
+            self.manifiesto["bloques"] = hasta
+            self.manifiesto["ultimo_hash"] = transacciones.hash_bloque(hasta - 1).hex()
+            self._guardar_manifiesto()
+            archivos.append(nombre)
+        
+        return {"bloques_nuevos": total - exportados, "bloques": total, "archivos": archivos}
+
+    def cargar(self, columnas: Optional[List[str]] = None) -> "pa.Table":
+        """Tabla con todo lo exportado; en formato Arrow, mapeada sin copia"""
+        rutas = [os.path.join(self.directorio, a["archivo"]) for a in self.manifiesto["archivos"]]
+        if not rutas:
+            return self.esquema.empty_table()
+        if self.formato == "parquet":
+            tablas = [pq.read_table(ruta, columns=columnas, memory_map=True) for ruta in rutas]
+        else:
+            tablas = []
+            for ruta in rutas:
+                tabla = pa.ipc.open_file(pa.memory_map(ruta, "r")).read_all()
+                tablas.append(tabla.select(columnas) if columnas else tabla)
+        return pa.concat_tables(tablas)
+
+
+# ==================== CONCURRENCIA ====================
+
+class _LocksOrdenados:
+    """Adquiere una lista de locks (ya ordenada) y los libera en orden inverso"""
+
+    def __init__(self, locks: List[threading.Lock]):
+        self.locks = locks
+
+    def __enter__(self):
+        for lock in self.locks:
+            lock.acquire()
+
+    def __exit__(self, *exc):
+        for lock in reversed(self.locks):
+            lock.release()
+
+
+class _Solicitud:
+    """Movimientos pendientes de encadenar y el evento que despierta al llamador"""
+
+    __slots__ = ("movimientos", "reservas", "sync", "bloques", "error", "evento")
+
+    def __init__(self, movimientos: List[Tuple], reservas: List[Tuple[str, float]], sync: bool):
+        self.movimientos = movimientos
+        self.reservas = reservas
+        self.sync = sync
+        self.bloques: Optional[List[BloqueTransaccion]] = None
+        self.error: Optional[Exception] = None
+        # Solo hace falta esperar cuando la confirma el hilo secuenciador
+        self.evento: Optional[threading.Event] = None
+
+    def completar(self, bloques: Optional[List[BloqueTransaccion]] = None,
+                  error: Optional[Exception] = None):
+        self.bloques = bloques
+        self.error = error
+        if self.evento:
+            self.evento.set()
+
+    def esperar(self) -> List[BloqueTransaccion]:
+        if self.evento:
+            self.evento.wait()
+        if self.error:
+            raise self.error
+        return self.bloques
+
+
+class _Secuenciador(threading.Thread):
+    """
+    Hilo único que encadena la cadena en modo concurrente.
+
+    Toma todas las solicitudes acumuladas en la cola (hasta `max_lote`) y las
+    confirma como un solo commit: un hash chain, un fsync. Mientras un commit
+    está en curso las nuevas solicitudes se acumulan para el siguiente.
+    """
+
+    def __init__(self, tesoreria: "OrionTreasury", max_lote: int = 4096):
+        super().__init__(name="orion-secuenciador", daemon=True)
+        self.tesoreria = tesoreria
+        self.max_lote = max_lote
+        self.cola: "queue.Queue[Optional[_Solicitud]]" = queue.Queue()
+
+    def enviar(self, solicitud: _Solicitud):
+        self.cola.put(solicitud)
+
+    def run(self):
+        activo = True
+        while activo:
+            solicitud = self.cola.get()
+            if solicitud is None:
+                break
+            lote = [solicitud]
+            movimientos = len(solicitud.movimientos)
+            while movimientos < self.max_lote:
+                try:
+                    siguiente = self.cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    activo = False
+                    break
+                lote.append(siguiente)
+                movimientos += len(siguiente.movimientos)
+            self.tesoreria._confirmar_solicitudes(lote)
+
+    def detener(self):
+        self.cola.put(None)
+        self.join()
+
 
 class OrionTreasury:
     """Tesoro Orion - Núcleo financiero inalterable"""
     
-    def __init__(self):
+    def __init__(self, directorio_ledger: Optional[str] = None,
+                 intervalo_checkpoint: int = 1000,
+                 clave_checkpoint: Optional[bytes] = None,
+                 clave_firma: Optional[bytes] = None,
+                 intervalo_snapshot: int = 100000,
+                 concurrente: bool = False,
+                 franjas_locks: int = 64,
+                 max_lote_secuenciador: int = 4096,
+                 tamano_rango_merkle: int = 1024,
+                 firma_cada: int = 256,
+                 firma_intervalo: float = 0.05,
+                 **opciones_registro):
         self.ultimo_hash = "0" * 64
         self.indice_actual = 0
-        self.transacciones = []
+        self.transacciones = AlmacenColumnar()
         self.wallets = {}
+        self.registro: Optional[RegistroSegmentos] = None
+        self.registro_wallets: Optional[RegistroWallets] = None
+        self.snapshots: Optional[AlmacenSnapshots] = None
+        self.intervalo_snapshot = intervalo_snapshot
+        # Copias previas (wallet_id -> fila) de las wallets que cambian mientras
+        # el hilo escritor copia un snapshot; None si no hay copia en curso
+        self._previas_snapshot: Optional[Dict[str, Optional[Dict]]] = None
+        
+        # Modo concurrente: franjas de locks por wallet + secuenciador de la cadena
+        self.concurrente = concurrente
+        self._lock_cadena = threading.RLock()
+        self._franjas = [threading.Lock() for _ in range(franjas_locks)]
+        self._reservado: Dict[str, List] = {}
+        self._secuenciador: Optional[_Secuenciador] = None
+        
+        # Con directorio, la cadena vive en un registro de segmentos en disco
+        if directorio_ledger:
+            self.registro = RegistroSegmentos(directorio_ledger, **opciones_registro)
+            self.transacciones = self.registro
+            self.ultimo_hash = self.registro.ultimo_hash
+            self.indice_actual = len(self.registro)
+        self._ultimo_timestamp = (self.transacciones.timestamp_bloque(len(self.transacciones) - 1)
+                                  if len(self.transacciones) else 0.0)
+        
+        # Checkpoints de integridad firmados cada N bloques
+        self.intervalo_checkpoint = intervalo_checkpoint
+        # Firma Ed25519 por commit (sin cryptography, firma legada por bloque)
+        self.claves_firma: Optional[ClavesFirma] = None
+        if CRYPTO_AVAILABLE:
+            self.claves_firma = ClavesFirma(
+                clave_firma,
+                os.path.join(directorio_ledger, "claves_firma.json") if directorio_ledger else None
+            )
+        # Una firma por group commit: en disco firma el registro al vaciar su
+        # buffer; en memoria, cada `firma_cada` bloques o `firma_intervalo` segundos
+        self.firma_cada = firma_cada
+        self.firma_intervalo = firma_intervalo
+        self._sin_firmar = 0
+        self._ultima_firma = time.monotonic()
+        if self.claves_firma and self.registro is not None:
+            self.registro.firmante = self.claves_firma.firmar_bloque
+        
+        self.checkpoints = RegistroCheckpoints(
+            clave_checkpoint,
+            os.path.join(directorio_ledger, "checkpoints.jsonl") if directorio_ledger else None,
+            self.indice_actual
+        )
+        
+        # Índices secundarios wallet -> posiciones (envío y recepción) y
+        # tipo -> posiciones; con un registro existente se completan bajo demanda
+        self._indice_wallets: Dict[str, array] = {}
+        self._indice_tipos: Dict[TipoTransaccion, array] = {}
+        self._posiciones_indexadas = 0
+        
+        # Árbol Merkle sobre los hashes de bloque; como el índice de wallets,
+        # con un registro existente se completa en la primera prueba
+        self.merkle = ArbolMerkle(self.transacciones.hash_bloque, tamano_rango=tamano_rango_merkle)
+        
+        # Saldos: último snapshot válido + replay de los bloques posteriores
+        if directorio_ledger:
+            self.registro_wallets = RegistroWallets(os.path.join(directorio_ledger, "wallets.jsonl"))
+            self.snapshots = AlmacenSnapshots(os.path.join(directorio_ledger, "snapshots"))
+            self._restaurar_wallets()
+        
+        if concurrente:
+            self._secuenciador = _Secuenciador(self, max_lote_secuenciador)
+            self._secuenciador.start()
         
         print("""
 ╔════════════════════════════════════════════════════════════╗
@@ -92,6 +2386,10 @@ class OrionTreasury:
         """Crea una nueva wallet"""
         wallet_id = hashlib.sha256(f"{owner_id}_{time.time()}".encode()).hexdigest()[:16]
         
+        previas = self._previas_snapshot
+        if previas is not None:
+            # Posterior al snapshot en curso: la recupera el log de wallets
+            previas.setdefault(wallet_id, None)
         self.wallets[wallet_id] = {
             "wallet_id": wallet_id,
             "owner_id": owner_id,
@@ -101,44 +2399,581 @@ class OrionTreasury:
             "creada": time.time(),
             "ultima_actualizacion": time.time()
         }
+        if self.registro_wallets:
+            # Bajo el lock de la cadena: la posición registrada es coherente con los bloques
+            with self._lock_cadena:
+                self.registro_wallets.registrar(self.indice_actual, self.wallets[wallet_id])
         
         logger.info(f"💰 Wallet creada: {wallet_id} para {owner_id}")
         return wallet_id
     
-    def emitir_forgecoins(self, monto_fc: float, monto_usd: float, destino: str, razon: str) -> Dict:
-        """Emite nuevos ForgeCoins"""
-        bloque = BloqueTransaccion(
-            index=self.indice_actual + 1,
-            timestamp=time.time(),
-            tipo=TipoTransaccion.EMISION,
-            from_wallet="SISTEMA",
-            to_wallet=destino,
-            monto_fc=monto_fc,
-            monto_usd=monto_usd,
-            hash_anterior=self.ultimo_hash,
-            hash_actual="",
-            firma="",
-            metadata={"razon": razon},
-            nonce=0
-        )
+    def _anexar_lote(self, bloques: List[BloqueTransaccion], reservas: List[Tuple[str, float]] = (),
+                     sync: bool = True):
+        """Añade bloques encadenados de una sola vez y aplica sus efectos"""
+        if not bloques:
+            return
+        if self.registro:
+            self.registro.extend(bloques, sync=sync)
+        else:
+            self.transacciones.extend(bloques)
+        self._tras_anexar(bloques, reservas)
+    
+    def _tras_anexar(self, bloques: List[BloqueTransaccion], reservas: List[Tuple[str, float]] = ()):
+        """Saldos, índice, checkpoints y snapshots tras anexar bloques"""
+        self.ultimo_hash = bloques[-1].hash_actual
+        self.indice_actual = bloques[-1].index
+        self._ultimo_timestamp = bloques[-1].timestamp
+        if self.concurrente:
+            implicadas = {w for b in bloques for w in (b.from_wallet, b.to_wallet)}
+            implicadas.update(w for w, _ in reservas)
+            with self._bloquear_wallets(implicadas):
+                self._aplicar_bloques(bloques)
+                self._liberar_reservas(reservas)
+        else:
+            self._aplicar_bloques(bloques)
+        self._indexar_bloques(bloques)
+        if self.claves_firma and self.registro is None:
+            self._sin_firmar += len(bloques)
+            if (self._sin_firmar >= self.firma_cada or
+                    time.monotonic() - self._ultima_firma >= self.firma_intervalo):
+                self._firmar_cola()
+        if self.merkle.tamano == bloques[0].index - 1:
+            for bloque in bloques:
+                self.merkle.agregar(bytes.fromhex(bloque.hash_actual))
         
-        # Calcular hash
-        contenido = f"{bloque.index}{bloque.timestamp}{bloque.tipo.value}{bloque.from_wallet}{bloque.to_wallet}{bloque.monto_fc}{bloque.monto_usd}{bloque.hash_anterior}{bloque.nonce}{json.dumps(bloque.metadata)}"
-        bloque.hash_actual = hashlib.sha256(contenido.encode()).hexdigest()
+        primero = bloques[0].index
+        if self.intervalo_checkpoint:
+            n = self.intervalo_checkpoint
+            for indice in range(-(-primero // n) * n, self.indice_actual + 1, n):
+                self.checkpoints.registrar(indice, bloques[indice - primero].hash_actual)
         
-        # Firmar (simulado)
-        bloque.firma = hashlib.sha256(f"{bloque.hash_actual}_FIRMA".encode()).hexdigest()
+        if self.snapshots and self.intervalo_snapshot:
+            n = self.intervalo_snapshot
+            if (primero - 1) // n != self.indice_actual // n:
+                self.guardar_snapshot()
+    
+    def _firmar_cola(self):
+        """Cierra el group commit en memoria firmando el último bloque de la cadena"""
+        if self._sin_firmar:
+            self.transacciones.firmar(len(self.transacciones) - 1, self.claves_firma.clave_id,
+                                      self.claves_firma.firmar(self.ultimo_hash))
+            self._sin_firmar = 0
+        self._ultima_firma = time.monotonic()
+    
+    def _aplicar_bloques(self, bloques: List[BloqueTransaccion]):
+        """
+        Aplica a los saldos el efecto de bloques ya encadenados, en orden.
         
-        # Guardar
-        self.transacciones.append(bloque)
-        self.ultimo_hash = bloque.hash_actual
-        self.indice_actual = bloque.index
+        Es la misma regla para emisiones en vivo y para el replay al arrancar,
+        así los saldos reconstruidos coinciden exactamente.
+        """
+        wallets = self.wallets
+        previas = self._previas_snapshot
+        for bloque in bloques:
+            if previas is not None:
+                # Copy-on-write: el snapshot en curso conserva el saldo anterior
+                for wallet_id in (bloque.from_wallet, bloque.to_wallet):
+                    if wallet_id not in previas and wallet_id in wallets:
+                        previas[wallet_id] = dict(wallets[wallet_id])
+            origen = wallets.get(bloque.from_wallet)
+            if origen is not None:
+                origen["balance_fc"] -= bloque.monto_fc
+                origen["balance_usd"] -= bloque.monto_usd
+            destino = wallets.get(bloque.to_wallet)
+            if destino is not None:
+                destino["balance_fc"] += bloque.monto_fc
+                destino["balance_usd"] += bloque.monto_usd
+                if bloque.tipo == TipoTransaccion.EMISION:
+                    destino["ultima_actualizacion"] = bloque.timestamp
+    
+    def _restaurar_wallets(self):
+        """Carga el último snapshot válido y reproduce solo los bloques posteriores"""
+        inicio = time.time()
+        
+        def validar(cabecera: Dict) -> bool:
+            indice = cabecera["indice"]
+            if indice > len(self.transacciones):
+                return False
+            if indice == 0:
+                return cabecera["hash"] == "0" * 64
+            return self.transacciones[indice - 1].hash_actual == cabecera["hash"]
+        
+        cargado = self.snapshots.cargar_valido(validar)
+        if cargado:
+            cabecera, self.wallets = cargado
+            desde, offset = cabecera["indice"], cabecera["offset_wallets"]
+        else:
+            desde, offset = 0, 0
+        self._indice_snapshot = desde
+        
+        # Wallets creadas tras el snapshot, agrupadas por la posición de la cadena
+        creaciones: Dict[int, List[Dict]] = {}
+        for entrada in self.registro_wallets.leer_desde(offset):
+            if entrada["wallet"]["wallet_id"] not in self.wallets:
+                creaciones.setdefault(entrada["indice"], []).append(entrada["wallet"])
+        
+        def crear_hasta(indice: int):
+            for wallet in creaciones.pop(indice, ()):
+                self.wallets[wallet["wallet_id"]] = wallet
+        
+        crear_hasta(desde)
+        for bloque in self.transacciones.iterar(desde):
+            self._aplicar_bloques([bloque])
+            crear_hasta(bloque.index)
+        for indice in sorted(creaciones):
+            crear_hasta(indice)
+        
+        logger.info(f"♻️ Saldos restaurados: snapshot en bloque {desde}, "
+                    f"{len(self.transacciones) - desde} bloques reproducidos en {time.time() - inicio:.3f}s")
+    
+    def guardar_snapshot(self, en_segundo_plano: bool = True) -> bool:
+        """Guarda un snapshot de saldos ligado al último bloque"""
+        if not self.snapshots:
+            return False
+        if en_segundo_plano and self.snapshots.en_curso():
+            return False
+        if not en_segundo_plano:
+            # El snapshot no debe referenciar bloques ni wallets que no sean durables
+            self.sync()
+            self._indice_snapshot = self.indice_actual
+            self.snapshots.escribir(self.indice_actual, self.ultimo_hash, self.wallets,
+                                    self.registro_wallets.offset)
+            return True
+        # Solo se fija la marca (índice, hash, offset) y se activa el copy-on-write;
+        # la copia y el fsync los hace el hilo escritor sin detener las emisiones
+        with self._lock_cadena:
+            self._indice_snapshot = self.indice_actual
+            self._previas_snapshot = {}
+            return self.snapshots.escribir_en_segundo_plano(
+                self.indice_actual, self.ultimo_hash, self._copiar_filas_snapshot,
+                self.registro_wallets.offset)
+    
+    def _copiar_filas_snapshot(self) -> List[List]:
+        """
+        Filas del snapshot en curso, en el hilo escritor y sin locks.
+        
+        Cada wallet se lee viva y después se consulta su copia previa: quien
+        la modifica guarda la copia antes de tocarla, así que si hay copia la
+        lectura pudo ver un cambio y se usa la copia; si no, la lectura es la
+        del estado marcado.
+        """
+        previas = self._previas_snapshot
+        try:
+            # Lo marcado debe ser durable antes de escribir el snapshot
+            self.registro.sync()
+            self.registro_wallets.sync()
+            campos = AlmacenSnapshots.CAMPOS
+            filas = []
+            for wallet_id, wallet in list(self.wallets.items()):
+                fila = [wallet.get(c) for c in campos]
+                if wallet_id in previas:
+                    previa = previas[wallet_id]
+                    if previa is None:
+                        continue
+                    fila = [previa.get(c) for c in campos]
+                filas.append(fila)
+            return filas
+        finally:
+            self._previas_snapshot = None
+    
+    def _indexar_bloques(self, bloques: List[BloqueTransaccion]):
+        """Añade bloques recién anexados a los índices de wallets y tipos si están al día"""
+        if self._posiciones_indexadas != bloques[0].index - 1:
+            return
+        indice = self._indice_wallets
+        tipos = self._indice_tipos
+        for bloque in bloques:
+            posicion = bloque.index - 1
+            por_tipo = tipos.get(bloque.tipo)
+            if por_tipo is None:
+                por_tipo = tipos[bloque.tipo] = array("I")
+            por_tipo.append(posicion)
+            for wallet_id in (bloque.from_wallet, bloque.to_wallet):
+                posiciones = indice.get(wallet_id)
+                if posiciones is None:
+                    posiciones = indice[wallet_id] = array("I")
+                if not posiciones or posiciones[-1] != posicion:
+                    posiciones.append(posicion)
+        self._posiciones_indexadas = bloques[-1].index
+    
+    def _completar_indices(self):
+        """Indexa los bloques que aún no están en los índices (p. ej. tras reabrir)"""
+        if len(self.transacciones) == self._posiciones_indexadas:
+            return
+        with self._lock_cadena:
+            pendientes = len(self.transacciones) - self._posiciones_indexadas
+            lote = []
+            for bloque in self.transacciones.iterar(self._posiciones_indexadas, len(self.transacciones)):
+                lote.append(bloque)
+                if len(lote) >= 10000:
+                    self._indexar_bloques(lote)
+                    lote = []
+            if lote:
+                self._indexar_bloques(lote)
+        logger.info(f"🗂️ Índices completados: {pendientes} bloques")
+    
+    def historial_wallet(self, wallet_id: str, cursor: Optional[int] = None,
+                         limit: int = 50) -> Dict:
+        """
+        Historial de una wallet, del más reciente al más antiguo.
+        
+        `cursor` es el número de bloque devuelto como `siguiente_cursor` por la
+        página anterior; como la cadena es append-only, los cursores son
+        estables aunque lleguen bloques nuevos. Cada página cuesta O(limit).
+        """
+        self._completar_indices()
+        posiciones = self._indice_wallets.get(wallet_id)
+        if not posiciones:
+            return {"wallet_id": wallet_id, "total": 0, "movimientos": [], "siguiente_cursor": None}
+        
+        # Posiciones estrictamente anteriores al bloque del cursor
+        fin = len(posiciones) if cursor is None else bisect.bisect_left(posiciones, cursor - 1)
+        inicio = max(0, fin - limit)
+        
+        movimientos = []
+        for k in range(fin - 1, inicio - 1, -1):
+            bloque = self.transacciones[posiciones[k]]
+            movimientos.append({
+                "bloque": bloque.index,
+                "timestamp": bloque.timestamp,
+                "tipo": bloque.tipo.value,
+                "desde": bloque.from_wallet,
+                "hacia": bloque.to_wallet,
+                "monto_fc": bloque.monto_fc,
+                "monto_usd": bloque.monto_usd,
+                "direccion": "entrada" if bloque.to_wallet == wallet_id else "salida",
+                "metadata": bloque.metadata,
+                "hash": bloque.hash_actual
+            })
+        
+        return {
+            "wallet_id": wallet_id,
+            "total": len(posiciones),
+            "movimientos": movimientos,
+            "siguiente_cursor": movimientos[-1]["bloque"] if inicio > 0 else None
+        }
+    
+    def _buscar_timestamp(self, timestamp: float, n: int, derecha: bool) -> int:
+        """Primera posición en [0, n) con timestamp >= (o > si `derecha`) el dado"""
+        timestamp_bloque = self.transacciones.timestamp_bloque
+        inicio, fin = 0, n
+        while inicio < fin:
+            medio = (inicio + fin) // 2
+            valor = timestamp_bloque(medio)
+            if valor < timestamp or (derecha and valor == timestamp):
+                inicio = medio + 1
+            else:
+                fin = medio
+        return inicio
+    
+    def consultar(self, desde_ts: Optional[float] = None, hasta_ts: Optional[float] = None,
+                  tipo: Optional[TipoTransaccion] = None,
+                  wallet: Optional[str] = None) -> Iterator[BloqueTransaccion]:
+        """
+        Bloques con desde_ts <= timestamp <= hasta_ts, en orden de cadena,
+        filtrados opcionalmente por tipo y wallet (origen o destino).
+        
+        Los timestamps no decrecen, así que el rango se acota por bisección;
+        los filtros usan las listas de posiciones por tipo y por wallet (con
+        ambos, se recorre la más corta y se busca en la otra). El coste es
+        proporcional al resultado, no al tamaño del ledger, y los bloques se
+        materializan a medida que se consumen.
+        """
+        self._completar_indices()
+        with self._lock_cadena:
+            n = self._posiciones_indexadas
+            inicio = 0 if desde_ts is None else self._buscar_timestamp(desde_ts, n, False)
+            fin = n if hasta_ts is None else self._buscar_timestamp(hasta_ts, n, True)
+            listas = []
+            if tipo is not None:
+                listas.append(self._indice_tipos.get(tipo, array("I")))
+            if wallet is not None:
+                listas.append(self._indice_wallets.get(wallet, array("I")))
+            # Las listas solo crecen por el final: estos tramos quedan fijos
+            tramos = sorted(((lista, bisect.bisect_left(lista, inicio), bisect.bisect_left(lista, fin))
+                             for lista in listas), key=lambda t: t[2] - t[1])
+        
+        if not tramos:
+            posiciones = range(inicio, fin)
+        elif len(tramos) == 1:
+            lista, a, b = tramos[0]
+            posiciones = (lista[k] for k in range(a, b))
+        else:
+            posiciones = self._interseccion(tramos[0], tramos[1])
+        for posicion in posiciones:
+            yield self.transacciones[posicion]
+    
+    @staticmethod
+    def _interseccion(corto: Tuple, largo: Tuple) -> Iterator[int]:
+        lista_corta, a, b = corto
+        lista_larga, j, fin = largo
+        for k in range(a, b):
+            posicion = lista_corta[k]
+            j = bisect.bisect_left(lista_larga, posicion, j, fin)
+            if j == fin:
+                return
+            if lista_larga[j] == posicion:
+                yield posicion
+    
+    # ---------- pruebas de inclusión ----------
+    
+    def _completar_merkle(self):
+        """Añade al árbol Merkle los bloques que aún no tiene (p. ej. tras reabrir)"""
+        if self.merkle.tamano == len(self.transacciones):
+            return
+        with self._lock_cadena:
+            pendientes = len(self.transacciones) - self.merkle.tamano
+            hash_bloque = self.transacciones.hash_bloque
+            for posicion in range(self.merkle.tamano, len(self.transacciones)):
+                self.merkle.agregar(hash_bloque(posicion))
+        logger.info(f"🌳 Árbol Merkle completado: {pendientes} bloques")
+    
+    def raiz_merkle(self, tamano: Optional[int] = None) -> str:
+        """Raíz Merkle de los primeros `tamano` bloques (por defecto, de toda la cadena)"""
+        self._completar_merkle()
+        with self._lock_cadena:
+            return self.merkle.raiz(tamano).hex()
+    
+    def raiz_rango(self, numero: int) -> Optional[str]:
+        """Raíz Merkle del rango `numero` (bloques numero*tamaño+1 ...), si está completo"""
+        self._completar_merkle()
+        with self._lock_cadena:
+            raiz = self.merkle.raiz_rango(numero)
+        return raiz.hex() if raiz else None
+    
+    def prueba_inclusion(self, indice: int, tamano: Optional[int] = None) -> Dict:
+        """
+        Prueba de que el bloque `indice` está en la cadena.
+        
+        La ruta tiene log2(tamano) hashes y se verifica con
+        `verificar_prueba_inclusion` sin acceso al ledger. Con `tamano` se
+        prueba contra la raíz de la cadena cuando tenía ese número de bloques
+        (p. ej. una raíz publicada antes).
+        """
+        self._completar_merkle()
+        with self._lock_cadena:
+            tamano = self.merkle.tamano if tamano is None else tamano
+            if not 1 <= indice <= tamano <= self.merkle.tamano:
+                return {"error": "Bloque fuera de rango"}
+            posicion = indice - 1
+            numero = posicion // self.merkle.tamano_rango
+            fin_rango = (numero + 1) * self.merkle.tamano_rango
+            return {
+                "indice": indice,
+                "tamano": tamano,
+                "hash_bloque": self.transacciones.hash_bloque(posicion).hex(),
+                "ruta": [h.hex() for h in self.merkle.ruta(posicion, tamano)],
+                "raiz": self.merkle.raiz(tamano).hex(),
+                "rango": {
+                    "numero": numero,
+                    "altura": self.merkle.nivel_rango,
+                    "raiz": self.merkle.raiz_rango(numero).hex()
+                } if fin_rango <= tamano else None
+            }
+    
+    # ---------- concurrencia ----------
+    
+    def _bloquear_wallets(self, wallet_ids):
+        """Toma las franjas de lock de las wallets en orden fijo (sin deadlocks)"""
+        if not self.concurrente:
+            return nullcontext()
+        n = len(self._franjas)
+        return _LocksOrdenados([self._franjas[i] for i in sorted({hash(w) % n for w in wallet_ids})])
+    
+    def _disponible(self, wallet_id: str) -> float:
+        """Saldo menos lo reservado por transferencias aún no encadenadas"""
+        reservado = self._reservado.get(wallet_id)
+        saldo = self.wallets[wallet_id]["balance_fc"]
+        return saldo - reservado[0] if reservado else saldo
+    
+    def _reservar(self, reservas: List[Tuple[str, float]]):
+        for wallet_id, monto in reservas:
+            reservado = self._reservado.setdefault(wallet_id, [0.0, 0])
+            reservado[0] += monto
+            reservado[1] += 1
+    
+    def _liberar_reservas(self, reservas: List[Tuple[str, float]]):
+        for wallet_id, monto in reservas:
+            reservado = self._reservado[wallet_id]
+            reservado[1] -= 1
+            if reservado[1]:
+                reservado[0] -= monto
+            else:
+                del self._reservado[wallet_id]
+    
+    def _enviar(self, movimientos: List[Tuple], reservas: List[Tuple[str, float]] = (),
+                sync: bool = True) -> "_Solicitud":
+        """
+        Encola movimientos en el secuenciador (modo concurrente) o los
+        confirma directamente. Las reservas se toman aquí, bajo las franjas de
+        lock del llamador, para que el orden de la cadena respete el de los saldos.
+        """
+        solicitud = _Solicitud(movimientos, reservas, sync)
+        if self._secuenciador:
+            solicitud.evento = threading.Event()
+            self._reservar(reservas)
+            self._secuenciador.enviar(solicitud)
+        else:
+            self._confirmar_solicitudes([solicitud])
+        return solicitud
+    
+    def _confirmar_solicitudes(self, solicitudes: List["_Solicitud"]):
+        """Encadena y anexa un grupo de solicitudes como un único commit"""
+        if len(solicitudes) == 1:
+            movimientos, reservas, sync = solicitudes[0].movimientos, solicitudes[0].reservas, solicitudes[0].sync
+        else:
+            movimientos = [m for s in solicitudes for m in s.movimientos]
+            reservas = [r for s in solicitudes for r in s.reservas]
+            sync = any(s.sync for s in solicitudes)
+        try:
+            with self._lock_cadena:
+                bloques = self._encadenar_lote(movimientos)
+                self._anexar_lote(bloques, reservas, sync=sync)
+        except Exception as e:
+            logger.error(f"❌ Commit fallido ({len(movimientos)} movimientos): {e}")
+            if self.concurrente:
+                with self._bloquear_wallets([w for w, _ in reservas]):
+                    self._liberar_reservas(reservas)
+            for solicitud in solicitudes:
+                solicitud.completar(error=e)
+            return
+        
+        k = 0
+        for solicitud in solicitudes:
+            solicitud.completar(bloques[k:k + len(solicitud.movimientos)])
+            k += len(solicitud.movimientos)
+    
+    def _validar_transferencias(self, transferencias: List[Tuple[str, str, float, str]]
+                                ) -> Tuple[Optional[Dict], List[Tuple[str, float]]]:
+        """
+        Valida saldos en orden sobre el lote completo (se puede gastar lo
+        recibido antes en el mismo lote). Devuelve el error, si lo hay, y lo que
+        hay que reservar de cada wallet: su caída máxima durante el lote.
+        """
+        saldos: Dict[str, float] = {}
+        caida: Dict[str, float] = {}
+        for k, (desde, hacia, monto_fc, concepto) in enumerate(transferencias):
+            if desde not in self.wallets or hacia not in self.wallets:
+                return {"error": "Wallet no encontrada", "posicion": k}, []
+            if not monto_fc > 0:
+                return {"error": "Monto inválido", "posicion": k}, []
+            inicial = self._disponible(desde)
+            saldo = saldos.get(desde, inicial)
+            if saldo < monto_fc:
+                return {"error": "Saldo insuficiente", "posicion": k}, []
+            saldos[desde] = saldo - monto_fc
+            caida[desde] = max(caida.get(desde, 0.0), inicial - saldos[desde])
+            if hacia not in saldos:
+                saldos[hacia] = self._disponible(hacia)
+            saldos[hacia] += monto_fc
+        return None, [(w, monto) for w, monto in caida.items() if monto > 0]
+    
+    # ---------- emisión y transferencias ----------
+    
+    def _encadenar_lote(self, movimientos: List[Tuple]) -> List[BloqueTransaccion]:
+        """
+        Construye y encadena los bloques sin tocar la cadena. Cada movimiento
+        es (tipo, origen, destino, monto_fc, monto_usd, metadata).
+        """
+        bloques = []
+        # Timestamps no decrecientes aunque el reloj retroceda: consultar() los busca por bisección
+        timestamp = max(time.time(), self._ultimo_timestamp)
+        hash_anterior = self.ultimo_hash
+        indice = self.indice_actual
+        
+        for tipo, origen, destino, monto_fc, monto_usd, metadata in movimientos:
+            indice += 1
+            bloque = BloqueTransaccion(
+                index=indice,
+                timestamp=timestamp,
+                tipo=tipo,
+                from_wallet=origen,
+                to_wallet=destino,
+                monto_fc=monto_fc,
+                monto_usd=monto_usd,
+                hash_anterior=hash_anterior,
+                hash_actual="",
+                firma="",
+                metadata=metadata,
+                nonce=0,
+                version=VERSION_CANONICA
+            )
+            bloque.hash_actual = calcular_hash(bloque)
+            if not self.claves_firma:
+                bloque.firma = hashlib.sha256(f"{bloque.hash_actual}_FIRMA".encode()).hexdigest()
+            hash_anterior = bloque.hash_actual
+            bloques.append(bloque)
+        
+        return bloques
+    
+    def emitir_lote(self, emisiones: List[Tuple[float, float, str, str]]) -> Dict:
+        """
+        Emite ForgeCoins en lote: [(monto_fc, monto_usd, destino, razon), ...].
+        
+        Valida todo el lote antes de escribir; o entran todos los bloques o
+        ninguno.
+        """
+        emisiones = list(emisiones)
+        for k, (monto_fc, monto_usd, destino, razon) in enumerate(emisiones):
+            if monto_fc < 0 or monto_usd < 0:
+                return {"error": "Monto negativo", "posicion": k}
+            if not destino:
+                return {"error": "Destino vacío", "posicion": k}
+        if not emisiones:
+            return {"exito": True, "cantidad": 0, "hash": self.ultimo_hash}
+        
+        bloques = self._enviar([
+            (TipoTransaccion.EMISION, "SISTEMA", destino, monto_fc, monto_usd, {"razon": razon})
+            for monto_fc, monto_usd, destino, razon in emisiones
+        ]).esperar()
+        
+        total_fc = sum(e[0] for e in emisiones)
+        logger.info(f"💰 Lote emitido: {len(bloques)} bloques, {total_fc} FC")
+        return {
+            "exito": True,
+            "cantidad": len(bloques),
+            "bloques": (bloques[0].index, bloques[-1].index),
+            "hash": bloques[-1].hash_actual,
+            "monto_fc": total_fc
+        }
+    
+    def transferir_lote(self, transferencias: List[Tuple[str, str, float, str]]) -> Dict:
+        """
+        Transfiere en lote: [(desde, hacia, monto_fc, concepto), ...].
+        
+        Los saldos se validan en orden sobre el lote completo (una transferencia
+        puede gastar lo recibido antes en el mismo lote); si alguna falla no se
+        aplica ninguna.
+        """
+        transferencias = list(transferencias)
+        if not transferencias:
+            return {"exito": True, "cantidad": 0, "hash": self.ultimo_hash}
         
-        # Actualizar wallet
-        if destino in self.wallets:
-            self.wallets[destino]["balance_fc"] += monto_fc
-            self.wallets[destino]["balance_usd"] += monto_usd
-            self.wallets[destino]["ultima_actualizacion"] = time.time()
+        implicadas = {w for desde, hacia, _, _ in transferencias for w in (desde, hacia)}
+        with self._bloquear_wallets(implicadas):
+            error, reservas = self._validar_transferencias(transferencias)
+            if error:
+                return error
+            solicitud = self._enviar([
+                (TipoTransaccion.TRANSFERENCIA, desde, hacia, monto_fc, monto_fc * 0.10, {"concepto": concepto})
+                for desde, hacia, monto_fc, concepto in transferencias
+            ], reservas)
+        bloques = solicitud.esperar()
+        
+        logger.info(f"🔁 Lote transferido: {len(bloques)} bloques")
+        return {
+            "exito": True,
+            "cantidad": len(bloques),
+            "bloques": (bloques[0].index, bloques[-1].index),
+            "hash": bloques[-1].hash_actual
+        }
+    
+    def emitir_forgecoins(self, monto_fc: float, monto_usd: float, destino: str, razon: str) -> Dict:
+        """Emite nuevos ForgeCoins"""
+        bloque = self._enviar(
+            [(TipoTransaccion.EMISION, "SISTEMA", destino, monto_fc, monto_usd, {"razon": razon})],
+            sync=False
+        ).esperar()[0]
         
         logger.info(f"💰 Emitidos {monto_fc} FC a {destino}")
         
@@ -151,41 +2986,24 @@ class OrionTreasury:
     
     def transferir(self, desde: str, hacia: str, monto_fc: float, concepto: str) -> Dict:
         """Transfiere ForgeCoins entre wallets"""
-        if desde not in self.wallets or hacia not in self.wallets:
-            return {"error": "Wallet no encontrada"}
-        
-        if self.wallets[desde]["balance_fc"] < monto_fc:
-            return {"error": "Saldo insuficiente"}
-        
-        bloque = BloqueTransaccion(
-            index=self.indice_actual + 1,
-            timestamp=time.time(),
-            tipo=TipoTransaccion.TRANSFERENCIA,
-            from_wallet=desde,
-            to_wallet=hacia,
-            monto_fc=monto_fc,
-            monto_usd=monto_fc * 0.10,  # Tasa fija 0.10 USD/FC
-            hash_anterior=self.ultimo_hash,
-            hash_actual="",
-            firma="",
-            metadata={"concepto": concepto},
-            nonce=0
-        )
-        
-        # Calcular hash
-        contenido = f"{bloque.index}{bloque.timestamp}{bloque.tipo.value}{bloque.from_wallet}{bloque.to_wallet}{bloque.monto_fc}{bloque.monto_usd}{bloque.hash_anterior}{bloque.nonce}{json.dumps(bloque.metadata)}"
-        bloque.hash_actual = hashlib.sha256(contenido.encode()).hexdigest()
-        bloque.firma = hashlib.sha256(f"{bloque.hash_actual}_FIRMA".encode()).hexdigest()
-        
-        self.transacciones.append(bloque)
-        self.ultimo_hash = bloque.hash_actual
-        self.indice_actual = bloque.index
-        
-        # Actualizar saldos
-        self.wallets[desde]["balance_fc"] -= monto_fc
-        self.wallets[desde]["balance_usd"] -= monto_fc * 0.10
-        self.wallets[hacia]["balance_fc"] += monto_fc
-        self.wallets[hacia]["balance_usd"] += monto_fc * 0.10
+        with self._bloquear_wallets((desde, hacia)):
+            if desde not in self.wallets or hacia not in self.wallets:
+                return {"error": "Wallet no encontrada"}
+            
+            # Cero, negativos y NaN pasarían la comprobación de saldo
+            if not monto_fc > 0:
+                return {"error": "Monto inválido"}
+            
+            if self._disponible(desde) < monto_fc:
+                return {"error": "Saldo insuficiente"}
+            
+            # Tasa fija 0.10 USD/FC
+            solicitud = self._enviar(
+                [(TipoTransaccion.TRANSFERENCIA, desde, hacia, monto_fc, monto_fc * 0.10, {"concepto": concepto})],
+                [(desde, monto_fc)],
+                sync=False
+            )
+        bloque = solicitud.esperar()[0]
         
         return {
             "exito": True,
@@ -199,6 +3017,7 @@ class OrionTreasury:
             return {"error": "Los porcentajes deben sumar 100"}
         
         distribuciones = []
+        emisiones = []
         
         for red, pct in porcentajes.items():
             monto_usd = total_usd * (pct / 100)
@@ -208,7 +3027,7 @@ class OrionTreasury:
             if wallet_destino not in self.wallets:
                 self.crear_wallet(wallet_destino, "sistema")
             
-            self.emitir_forgecoins(monto_fc, monto_usd, wallet_destino, f"Distribución {red.value}")
+            emisiones.append((monto_fc, monto_usd, wallet_destino, f"Distribución {red.value}"))
             
             distribuciones.append({
                 "red": red.value,
@@ -217,6 +3036,10 @@ class OrionTreasury:
                 "porcentaje": pct
             })
         
+        lote = self.emitir_lote(emisiones)
+        if "error" in lote:
+            return lote
+        
         resultado = {
             "fecha": datetime.now().isoformat(),
             "total_usd": total_usd,
@@ -227,15 +3050,29 @@ class OrionTreasury:
         logger.info(f"📊 Distribución completada: ${total_usd}")
         return resultado
     
-    def verificar_integridad(self) -> Dict:
-        """Verifica la cadena de bloques"""
+    def verificar_integridad(self, desde: Optional[int] = None) -> Dict:
+        """
+        Verifica la cadena de bloques.
+        
+        Sin `desde` se re-verifica todo desde génesis. Con `desde` (posición
+        de bloque) la verificación arranca en el último checkpoint confiable
+        en o antes de esa posición; `desde=self.indice_actual` audita solo
+        lo añadido desde el último checkpoint.
+        """
         hash_anterior = "0" * 64
+        inicio = 0
         errores = []
+        checkpoint = None
         
-        for i, bloque in enumerate(self.transacciones):
+        if desde is not None:
+            checkpoint = self._checkpoint_confiable(desde)
+            if checkpoint:
+                inicio = checkpoint["indice"]
+                hash_anterior = checkpoint["hash"]
+        
+        for i, bloque in enumerate(self.transacciones.iterar(inicio), start=inicio):
             # Recalcular hash
-            contenido = f"{bloque.index}{bloque.timestamp}{bloque.tipo.value}{bloque.from_wallet}{bloque.to_wallet}{bloque.monto_fc}{bloque.monto_usd}{bloque.hash_anterior}{bloque.nonce}{json.dumps(bloque.metadata)}"
-            hash_calculado = hashlib.sha256(contenido.encode()).hexdigest()
+            hash_calculado = calcular_hash(bloque)
             
             if hash_calculado != bloque.hash_actual:
                 errores.append(f"Hash inválido en bloque {i}")
@@ -248,16 +3085,195 @@ class OrionTreasury:
         return {
             "integro": len(errores) == 0,
             "bloques": len(self.transacciones),
+            "verificados": len(self.transacciones) - inicio,
+            "checkpoint": checkpoint["indice"] if checkpoint else None,
+            "errores": errores
+        }
+    
+    def verificar_integridad_paralela(self, procesos: Optional[int] = None,
+                                      desde: Optional[int] = None) -> Dict:
+        """Como verificar_integridad, pero reparte el hashing en varios procesos"""
+        hash_anterior = "0" * 64
+        inicio = 0
+        checkpoint = None
+        
+        if desde is not None:
+            checkpoint = self._checkpoint_confiable(desde)
+            if checkpoint:
+                inicio = checkpoint["indice"]
+                hash_anterior = checkpoint["hash"]
+        
+        errores = verificar_cadena_paralela(self.transacciones, inicio, hash_anterior, procesos)
+        
+        return {
+            "integro": len(errores) == 0,
+            "bloques": len(self.transacciones),
+            "verificados": len(self.transacciones) - inicio,
+            "checkpoint": checkpoint["indice"] if checkpoint else None,
+            "errores": errores
+        }
+    
+    def exportar(self, directorio: str, formato: str = "parquet", **opciones) -> Dict:
+        """
+        Exporta (de forma incremental) la cadena a Parquet o Arrow IPC para
+        análisis; `ExportadorLedger(directorio, formato).cargar().to_pandas()`
+        la devuelve como DataFrame.
+        """
+        if not ARROW_AVAILABLE:
+            return {"error": "La exportación columnar requiere pyarrow"}
+        return ExportadorLedger(directorio, formato, **opciones).exportar(self.transacciones)
+    
+    def rotar_clave_firma(self, clave: Optional[bytes] = None) -> Dict:
+        """Pasa a firmar con una clave nueva; las firmas previas siguen siendo verificables"""
+        if not self.claves_firma:
+            return {"error": "Firmas Ed25519 no disponibles (falta cryptography)"}
+        with self._lock_cadena:
+            return {"clave_id": self.claves_firma.rotar(clave)}
+    
+    def verificar_firmas(self, procesos: Optional[int] = None) -> Dict:
+        """
+        Auditoría de firmas: verifica en paralelo cada firma Ed25519 de la
+        cadena. Cada firma cubre su bloque y, por encadenamiento, todos los
+        anteriores; `sin_firma` cuenta los bloques finales que ninguna cubre.
+        La integridad de los hashes la comprueba `verificar_integridad`.
+        """
+        if not self.claves_firma:
+            return {"error": "Firmas Ed25519 no disponibles (falta cryptography)"}
+        # La auditoría cierra el group commit en curso: la cola queda firmada
+        self.sync()
+        firmas, ultima, errores = verificar_firmas_paralela(
+            self.transacciones, dict(self.claves_firma.publicas), procesos=procesos)
+        sin_firma = len(self.transacciones) - 1 - ultima
+        return {
+            "integro": not errores and sin_firma == 0,
+            "firmas": firmas,
+            "sin_firma": sin_firma,
+            "claves": len(self.claves_firma.publicas),
             "errores": errores
         }
     
+    def _checkpoint_confiable(self, posicion: int) -> Optional[Dict]:
+        """Último checkpoint con firma válida que coincide con el bloque guardado"""
+        for checkpoint in self.checkpoints.anteriores_a(posicion):
+            if checkpoint["indice"] > len(self.transacciones):
+                continue
+            bloque = self.transacciones[checkpoint["indice"] - 1]
+            if (bloque.hash_actual == checkpoint["hash"] and
+                    calcular_hash(bloque) == bloque.hash_actual):
+                return checkpoint
+            logger.warning(f"⚠️ Checkpoint {checkpoint['indice']} no coincide con la cadena")
+        return None
+    
     def get_balance(self, wallet_id: str) -> Dict:
         """Obtiene saldo de una wallet"""
         if wallet_id in self.wallets:
             return self.wallets[wallet_id]
         return {"error": "Wallet no encontrada"}
+    
+    def archivar(self, antiguedad_dias: float = 90) -> Dict:
+        """
+        Archiva en frío los segmentos sellados con más de `antiguedad_dias`:
+        quedan comprimidos e inmutables, con sus hashes de frontera y su raíz
+        Merkle, y se siguen leyendo y verificando de forma transparente.
+        """
+        if not self.registro:
+            return {"error": "El archivo en frío requiere un ledger en disco"}
+        # Solo toca segmentos sellados: no bloquea la escritura de la cadena
+        archivados = self.registro.archivar(time.time() - antiguedad_dias * 86400)
+        return {
+            "segmentos": len(archivados),
+            "bloques": sum(a["bloques"] for a in archivados),
+            "bytes_antes": sum(a["bytes_antes"] for a in archivados),
+            "bytes_despues": sum(a["bytes_despues"] for a in archivados),
+            "archivos": archivados
+        }
+    
+    def verificar_archivos(self) -> Dict:
+        """Verifica contenido, raíz Merkle y fronteras de cada archivo frío"""
+        if not self.registro:
+            return {"integro": True, "archivos": 0, "errores": []}
+        errores = self.registro.verificar_archivos()
+        return {"integro": not errores, "archivos": len(self.registro.archivos()), "errores": errores}
+    
+    def sync(self):
+        """Fuerza el group commit pendiente (en memoria, firma la cola de la cadena)"""
+        if self.registro:
+            self.registro.sync()
+            self.registro_wallets.sync()
+        elif self.claves_firma:
+            with self._lock_cadena:
+                self._firmar_cola()
+    
+    def cerrar(self):
+        """Cierra el registro en disco dejando todo persistido"""
+        if self._secuenciador:
+            self._secuenciador.detener()
+            self._secuenciador = None
+        if self.registro:
+            self.snapshots.esperar()
+            # Un cierre ordenado deja un snapshot al día: el próximo arranque no reproduce nada
+            if self.indice_actual != self._indice_snapshot:
+                self.guardar_snapshot(en_segundo_plano=False)
+            self.registro.cerrar()
+            self.registro_wallets.cerrar()
+
+def benchmark_contencion(hilos: int = 8, n_wallets: int = 1000, transferencias_por_hilo: int = 2000,
+                         directorio: Optional[str] = None) -> Dict:
+    """
+    Benchmark de contención del modo concurrente: `hilos` hilos transfieren
+    al azar entre `n_wallets` wallets (menos wallets = más contención).
+    Comprueba al final que el supply se conserva y que la cadena es íntegra.
+    """
+    import random
+    
+    nivel = logger.level
+    logger.setLevel(logging.WARNING)
+    tesoreria = OrionTreasury(directorio, concurrente=True)
+    wallets = [tesoreria.crear_wallet(f"bench_{i}") for i in range(n_wallets)]
+    tesoreria.emitir_lote([(1000.0, 100.0, w, "fondeo benchmark") for w in wallets])
+    supply_inicial = sum(w["balance_fc"] for w in tesoreria.wallets.values())
+    
+    rechazadas = [0] * hilos
+    
+    def trabajador(n: int):
+        rng = random.Random(n)
+        for _ in range(transferencias_por_hilo):
+            desde, hacia = rng.sample(wallets, 2)
+            if "error" in tesoreria.transferir(desde, hacia, rng.uniform(1, 50), "bench"):
+                rechazadas[n] += 1
+    
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajador, args=(n,)) for n in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    segundos = time.perf_counter() - inicio
+    
+    supply_final = sum(w["balance_fc"] for w in tesoreria.wallets.values())
+    integridad = tesoreria.verificar_integridad()
+    tesoreria.cerrar()
+    logger.setLevel(nivel)
+    
+    total = hilos * transferencias_por_hilo
+    return {
+        "hilos": hilos,
+        "wallets": n_wallets,
+        "transferencias": total,
+        "rechazadas": sum(rechazadas),
+        "segundos": round(segundos, 3),
+        "tps": round(total / segundos, 1),
+        "supply_conservado": abs(supply_final - supply_inicial) < 1e-6 * supply_inicial,
+        "integro": integridad["integro"],
+        "bloques": integridad["bloques"]
+    }
 
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        for hilos in (1, 2, 4, 8, 16):
+            print(benchmark_contencion(hilos))
+        sys.exit(0)
+    
     # Prueba
     treasury = OrionTreasury()
     wallet = treasury.crear_wallet("miguel", "fundador")
@@ -265,3 +3281,6 @@ if __name__ == "__main__":
     
     treasury.emitir_forgecoins(1000, 100, wallet, "Génesis")
     print(f"Balance: {treasury.get_balance(wallet)}")
+    
+    prueba = treasury.prueba_inclusion(1)
+    print(f"Raíz Merkle: {prueba['raiz']} - prueba válida: {verificar_prueba_inclusion(prueba)}")
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Pruebas del Tesoro Orion
+Ejecuta: python -m pytest test_orion_treasury.py
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import orion_treasury as ot
+
+logging.getLogger("OrionTreasury").setLevel(logging.WARNING)
+
+
+def _tesoreria_con_emisiones(directorio, n, **opciones):
+    tesoreria = ot.OrionTreasury(str(directorio) if directorio else None, **opciones)
+    wallet = tesoreria.crear_wallet("a")
+    for _ in range(n):
+        tesoreria.emitir_forgecoins(1, 0.1, wallet, "prueba")
+    return tesoreria, wallet
+
+
+def _ultimo_segmento(directorio):
+    return os.path.join(directorio, max(n for n in os.listdir(directorio) if n.endswith(".log")))
+
+
+# ---------- reapertura del registro en disco ----------
+
+def test_reabre_tras_registro_final_a_medias(tmp_path):
+    """Una escritura incompleta tras el último registro se descarta al reabrir"""
+    tesoreria, wallet = _tesoreria_con_emisiones(tmp_path, 50, tamano_segmento=4096)
+    ultimo_hash = tesoreria.ultimo_hash
+    tesoreria.cerrar()
+    with open(_ultimo_segmento(tmp_path), "ab") as f:
+        f.write(b"\x10\x00\x00\x00basura")
+
+    tesoreria = ot.OrionTreasury(str(tmp_path))
+    assert tesoreria.indice_actual == 50
+    assert tesoreria.ultimo_hash == ultimo_hash
+    assert tesoreria.wallets[wallet]["balance_fc"] == 50
+    tesoreria.emitir_forgecoins(1, 0.1, wallet, "tras reabrir")
+    assert tesoreria.verificar_integridad()["integro"]
+    tesoreria.cerrar()
+
+
+def test_reabre_tras_registro_final_truncado(tmp_path):
+    """Un último registro cortado se trunca y los saldos se reconstruyen sin él"""
+    tesoreria, wallet = _tesoreria_con_emisiones(tmp_path, 50)
+    hash_penultimo = tesoreria.transacciones[48].hash_actual
+    tesoreria.cerrar()
+    ruta = _ultimo_segmento(tmp_path)
+    with open(ruta, "r+b") as f:
+        f.truncate(os.path.getsize(ruta) - 7)
+
+    tesoreria = ot.OrionTreasury(str(tmp_path))
+    assert tesoreria.indice_actual == 49
+    assert tesoreria.ultimo_hash == hash_penultimo
+    assert tesoreria.wallets[wallet]["balance_fc"] == 49
+    tesoreria.emitir_forgecoins(1, 0.1, wallet, "tras reabrir")
+    assert tesoreria.indice_actual == 50
+    assert tesoreria.verificar_integridad()["integro"]
+    tesoreria.cerrar()
+
+
+# ---------- verificación paralela ----------
+
+def _manipular(tesoreria, posicion, **campos):
+    bloque = tesoreria.transacciones[posicion]
+    for campo, valor in campos.items():
+        setattr(bloque, campo, valor)
+    tesoreria.transacciones[posicion] = bloque
+
+
+def test_verificacion_paralela_igual_a_secuencial():
+    """En una cadena manipulada, la paralela da los mismos errores y en el mismo orden"""
+    tesoreria, _ = _tesoreria_con_emisiones(None, 1000)
+    _manipular(tesoreria, 150, monto_fc=5)
+    _manipular(tesoreria, 299, hash_actual="cd" * 32)
+    _manipular(tesoreria, 300, hash_anterior="ab" * 32)
+    _manipular(tesoreria, 720, hash_actual="ab" * 32)
+
+    secuencial = tesoreria.verificar_integridad()["errores"]
+    paralela = ot.verificar_cadena_paralela(tesoreria.transacciones, procesos=2, tamano_rango=100)
+
+    assert secuencial[0] == "Hash inválido en bloque 150"
+    assert paralela == secuencial
+    assert tesoreria.verificar_integridad_paralela(procesos=2)["errores"] == secuencial
+
+
+def test_verificacion_paralela_en_disco(tmp_path):
+    tesoreria, _ = _tesoreria_con_emisiones(tmp_path, 300, tamano_segmento=8192)
+    tesoreria.sync()
+    assert ot.verificar_cadena_paralela(tesoreria.transacciones, procesos=2, tamano_rango=64) == []
+    assert tesoreria.verificar_integridad()["errores"] == []
+    tesoreria.cerrar()
+
+
+# ---------- versiones de bloque ----------
+
+def _cadena_legada(n):
+    """Bloques construidos como antes de la versión canónica: sin versión, hash sobre f-string"""
+    bloques = []
+    hash_anterior = "0" * 64
+    for i in range(1, n + 1):
+        bloque = ot.BloqueTransaccion(
+            index=i, timestamp=1700000000.0 + i, tipo=ot.TipoTransaccion.EMISION,
+            from_wallet="SISTEMA", to_wallet="legado", monto_fc=1.5, monto_usd=0.15,
+            hash_anterior=hash_anterior, hash_actual="", firma="", metadata={"razon": "legado"}, nonce=0
+        )
+        contenido = (f"{bloque.index}{bloque.timestamp}{bloque.tipo.value}{bloque.from_wallet}"
+                     f"{bloque.to_wallet}{bloque.monto_fc}{bloque.monto_usd}{bloque.hash_anterior}"
+                     f"{bloque.nonce}{json.dumps(bloque.metadata)}")
+        bloque.hash_actual = hashlib.sha256(contenido.encode()).hexdigest()
+        bloque.firma = hashlib.sha256(f"{bloque.hash_actual}_FIRMA".encode()).hexdigest()
+        hash_anterior = bloque.hash_actual
+        bloques.append(bloque)
+    return bloques
+
+
+def test_cadena_legada_verifica(tmp_path):
+    """Una cadena hasheada con el f-string antiguo sigue verificando y admite bloques v2"""
+    legados = _cadena_legada(20)
+    assert all(b.version == ot.VERSION_LEGADO for b in legados)
+    assert ot.verificar_cadena_paralela(legados, procesos=2, tamano_rango=5) == []
+
+    registro = ot.RegistroSegmentos(str(tmp_path))
+    registro.extend(legados)
+    registro.cerrar()
+
+    tesoreria = ot.OrionTreasury(str(tmp_path))
+    assert tesoreria.transacciones[0].version == ot.VERSION_LEGADO
+    assert tesoreria.verificar_integridad()["integro"]
+    wallet = tesoreria.crear_wallet("nuevo")
+    tesoreria.emitir_forgecoins(1, 0.1, wallet, "v2")
+    assert tesoreria.transacciones[-1].version == ot.VERSION_CANONICA
+    assert tesoreria.verificar_integridad()["integro"]
+    tesoreria.cerrar()
+
+    tesoreria = ot.OrionTreasury(str(tmp_path))
+    versiones = [b.version for b in tesoreria.transacciones]
+    assert versiones == [ot.VERSION_LEGADO] * 20 + [ot.VERSION_CANONICA]
+    assert tesoreria.verificar_integridad()["integro"]
+    tesoreria.cerrar()
+
+
+# ---------- snapshots de saldos ----------
+
+def test_snapshot_mas_cola_igual_a_replay_completo(tmp_path):
+    """Snapshots tomados con transferencias en vuelo: snapshot + cola = replay desde génesis"""
+    ledger = tmp_path / "ledger"
+    tesoreria = ot.OrionTreasury(str(ledger), intervalo_snapshot=300, concurrente=True)
+    wallets = [tesoreria.crear_wallet(f"w{i}") for i in range(40)]
+    tesoreria.emitir_lote([(1000, 100, w, "fondeo") for w in wallets])
+
+    def trabajador(k):
+        for i in range(400):
+            tesoreria.transferir(wallets[(k * 7 + i) % 40], wallets[(k * 13 + 3 * i + 1) % 40], 1.5, "t")
+
+    hilos = [threading.Thread(target=trabajador, args=(k,)) for k in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    tesoreria.snapshots.esperar()
+
+    # Cada snapshot coincide con reproducir la cadena hasta su bloque
+    for ruta in tesoreria.snapshots._rutas():
+        with open(ruta) as f:
+            cabecera = json.loads(f.readline())
+            filas = json.loads(f.read())
+        esperado = dict.fromkeys(wallets, 0.0)
+        for bloque in tesoreria.transacciones.iterar(0, cabecera["indice"]):
+            if bloque.from_wallet in esperado:
+                esperado[bloque.from_wallet] -= bloque.monto_fc
+            esperado[bloque.to_wallet] += bloque.monto_fc
+        campos = cabecera["campos"]
+        obtenido = {fila[campos.index("wallet_id")]: fila[campos.index("balance_fc")] for fila in filas}
+        assert obtenido == esperado
+    estado = {k: dict(v) for k, v in tesoreria.wallets.items()}
+    tesoreria.cerrar()
+
+    # Sin el snapshot final queda un snapshot anterior más una cola que reproducir
+    rutas = sorted(os.listdir(ledger / "snapshots"))
+    os.remove(ledger / "snapshots" / rutas[-1])
+    completo = tmp_path / "completo"
+    shutil.copytree(ledger, completo)
+    shutil.rmtree(completo / "snapshots")
+
+    con_snapshot = ot.OrionTreasury(str(ledger))
+    assert 0 < con_snapshot._indice_snapshot < con_snapshot.indice_actual
+    desde_genesis = ot.OrionTreasury(str(completo))
+    assert desde_genesis._indice_snapshot == 0
+    assert con_snapshot.wallets == desde_genesis.wallets == estado
+    con_snapshot.cerrar()
+    desde_genesis.cerrar()
+
+
+# ---------- transferencias ----------
+
+@pytest.mark.parametrize("monto", [0, -5.0, float("nan")])
+def test_transferir_rechaza_montos_no_positivos(monto):
+    tesoreria, origen = _tesoreria_con_emisiones(None, 3)
+    destino = tesoreria.crear_wallet("b")
+    bloques = len(tesoreria.transacciones)
+
+    assert tesoreria.transferir(origen, destino, monto, "x") == {"error": "Monto inválido"}
+    resultado = tesoreria.transferir_lote([(origen, destino, 1, "ok"), (origen, destino, monto, "x")])
+    assert resultado == {"error": "Monto inválido", "posicion": 1}
+    assert len(tesoreria.transacciones) == bloques
+    assert tesoreria.wallets[origen]["balance_fc"] == 3
+    assert tesoreria.wallets[destino]["balance_fc"] == 0